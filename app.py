@@ -7,6 +7,7 @@ import time
 
 from channel import channel_factory
 from common import const
+from common.metrics import metrics
 from config import load_config
 from plugins import *
 import threading
@@ -49,6 +50,12 @@ def run():
         # kill signal
         sigterm_handler_wrap(signal.SIGTERM)
 
+        # 本地指标接口
+        if conf().get("metrics_port"):
+            metrics.enabled = True
+            metrics.start_http_server(conf().get("metrics_port"), conf().get("metrics_host", "127.0.0.1"))
+            logger.info("[INIT] metrics server started on {}:{}".format(conf().get("metrics_host", "127.0.0.1"), conf().get("metrics_port")))
+
         # create channel
         channel_name = conf().get("channel_type", "wx")
 
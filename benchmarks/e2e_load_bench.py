@@ -0,0 +1,186 @@
+"""
+wx849 + Dify 端到端压测
+
+在本机启动 WechatAPI 和 Dify 的替身服务(benchmarks/stub_servers.py)，用真实的
+WX849Channel -> ChatChannel -> DifyBot -> 发送 链路处理合成的私聊和群聊消息：
+消息由替身服务的 /Msg/Sync 返回给通道，DifyBot 请求替身 Dify 得到回复，回复经 /Msg/SendTxt 发回替身服务。
+统计从消息进入 Sync 队列到第一条回复到达 SendTxt 的端到端延迟和吞吐。
+
+用法: python benchmarks/e2e_load_bench.py [-n 消息数] [-r 每秒注入的消息数] [--latency Dify延迟] [--paragraphs 段落数]
+                                          [--agent] [--stream] [--async-pipeline]
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_servers import StubDifyServer, StubWX849Server  # noqa: E402
+from common.log import logger  # noqa: E402
+from common.metrics import metrics  # noqa: E402
+from config import conf  # noqa: E402
+
+BOT_WXID = "wxid_bot"
+TOKEN_RE = re.compile(r"q\d{7}")
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class _Tracker(object):
+    """记录每条消息的注入时间和回复到达时间"""
+
+    def __init__(self, total):
+        self.total = total
+        self.injected = {}
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def inject(self, token):
+        with self.lock:
+            self.injected[token] = time.monotonic()
+
+    def on_send(self, arrived, to_wxid, content):
+        match = TOKEN_RE.search(content or "")
+        if not match:
+            return
+        with self.lock:
+            start = self.injected.pop(match.group(0), None)
+            if start is None:
+                return
+            self.latencies.append(arrived - start)
+            if len(self.latencies) >= self.total:
+                self.done.set()
+
+
+def configure(args, wx_port, dify_port):
+    conf().update({
+        "channel_type": "wx849",
+        "model": "dify",
+        "dify_api_base": f"http://127.0.0.1:{dify_port}/v1",
+        "dify_api_key": "app-bench",
+        "dify_app_type": "agent" if args.agent else "chatbot",
+        "wx849_api_host": "127.0.0.1",
+        "wx849_api_port": wx_port,
+        "wx849_protocol_version": "849",
+        "wx849_sync_mode": "longpoll",
+        "wx849_send_global_rate": 0,
+        "wx849_send_recipient_rate": 0,
+        "single_chat_prefix": [""],
+        "single_chat_reply_prefix": "",
+        "group_chat_prefix": ["bot"],
+        "group_name_white_list": ["ALL_GROUP"],
+        "concurrency_in_session": 1,
+        "async_pipeline": args.async_pipeline,
+        "dify_stream_reply": args.stream,
+        "dify_max_concurrency": args.dify_concurrency,
+        "speech_recognition": False,
+        "voice_reply_voice": False,
+    })
+    metrics.enabled = True
+
+
+def start_channel(wx_port):
+    from channel.wx849.wx849_channel import WX849Channel
+    import WechatAPI  # WX849Channel 导入时已把 lib/wx849 加入 sys.path
+
+    channel = WX849Channel()
+    # 跳过扫码登录，直接使用已登录状态
+    channel.bot = WechatAPI.WechatAPIClient("127.0.0.1", wx_port)
+    channel.bot.set_api_path_prefix("/VXAPI")
+    channel.bot.wxid = channel.wxid = channel.user_id = BOT_WXID
+    channel.name = "bot"
+    channel.is_running = channel.is_logged_in = True
+
+    def run_loop():
+        import asyncio
+
+        asyncio.set_event_loop(channel.loop)
+        channel.loop.create_task(channel._message_listener())
+        channel.loop.run_forever()
+
+    threading.Thread(target=run_loop, name="wx849-loop", daemon=True).start()
+    return channel
+
+
+def drive(wx, tracker, args):
+    """按 rate 注入消息，rate 为0时一次全部注入"""
+    start = time.monotonic()
+    for i in range(args.messages):
+        token = f"q{i:07d}"
+        tracker.inject(token)
+        if i % 100 < args.group_ratio * 100:
+            group_id = f"bench{i % args.groups}@chatroom"
+            wx.inject(f"wxid_user{i % 50}", f"bot {token}", group_id=group_id)
+        else:
+            wx.inject(f"wxid_p{i % args.senders}", token)
+        if args.rate:
+            delay = start + (i + 1) / args.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def report(args, tracker, elapsed, dify):
+    latencies = tracker.latencies
+    received = len(latencies)
+    print(f"messages: {args.messages} sent, {received} replied, {len(tracker.injected)} missing")
+    print(f"dify: {dify.requests} requests, max in flight {dify.max_in_flight}, "
+          f"mode {'agent/streaming' if args.agent else 'chatbot/blocking'}, latency {args.latency * 1000:.0f}ms")
+    print(f"pipeline: {'async' if args.async_pipeline else 'threaded'}, stream reply: {'on' if args.stream else 'off'}, "
+          f"paragraphs: {args.paragraphs}")
+    if not received:
+        return
+    print(f"elapsed: {elapsed:.2f}s  throughput: {received / elapsed:.1f} msgs/s")
+    print(f"{'latency(ms)':<14}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    print(f"{'first reply':<14}{_percentile(latencies, 0.5) * 1000:>10.1f}{_percentile(latencies, 0.95) * 1000:>10.1f}"
+          f"{_percentile(latencies, 0.99) * 1000:>10.1f}{max(latencies) * 1000:>10.1f}")
+    for metric in sorted(metrics.collect(), key=lambda m: m.name):
+        if metric.name != "chat_stage_seconds" or not getattr(metric, "count", 0):
+            continue
+        label = f"  {metric.labels.get('stage')}"
+        print(f"{label:<14}{metric.percentile(0.5) * 1000:>10.1f}{metric.percentile(0.95) * 1000:>10.1f}"
+              f"{metric.percentile(0.99) * 1000:>10.1f}{'':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--messages", type=int, default=1000, help="消息总数")
+    parser.add_argument("-r", "--rate", type=float, default=200, help="每秒注入的消息数，0表示一次全部注入")
+    parser.add_argument("--senders", type=int, default=200, help="私聊发送者数")
+    parser.add_argument("--groups", type=int, default=20, help="群数量")
+    parser.add_argument("--group-ratio", type=float, default=0.5, help="群消息所占比例")
+    parser.add_argument("--latency", type=float, default=0.2, help="Dify替身的平均响应延迟(秒)")
+    parser.add_argument("--paragraphs", type=int, default=1, help="Dify替身答案的段落数")
+    parser.add_argument("--agent", action="store_true", help="使用agent模式(SSE流式响应)")
+    parser.add_argument("--stream", action="store_true", help="开启dify_stream_reply，边生成边发送段落")
+    parser.add_argument("--async-pipeline", action="store_true", help="开启async_pipeline")
+    parser.add_argument("--dify-concurrency", type=int, default=100, help="异步流水线中请求Dify的最大并发数(dify_max_concurrency)")
+    parser.add_argument("--timeout", type=float, default=120, help="等待全部回复的最长时间(秒)")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    wx = StubWX849Server(bot_wxid=BOT_WXID)
+    dify = StubDifyServer(latency=args.latency, paragraphs=args.paragraphs)
+    wx_port, dify_port = wx.start(), dify.start()
+    configure(args, wx_port, dify_port)
+
+    tracker = _Tracker(args.messages)
+    wx.on_send = tracker.on_send
+    start_channel(wx_port)
+
+    start = time.monotonic()
+    drive(wx, tracker, args)
+    tracker.done.wait(args.timeout)
+    elapsed = time.monotonic() - start
+    report(args, tracker, elapsed, dify)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+ChatChannel 会话调度基准
+
+对比事件驱动的就绪队列调度(ChatChannel.produce/consume)与原有的 0.2 秒轮询调度：
+N 个 session 各产生若干条 context，统计从 produce 到 _handle 开始执行的延迟和总耗时。
+
+用法: python benchmarks/session_scheduler_bench.py [-s session数] [-m 每个session的消息数]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bridge.context import Context, ContextType  # noqa: E402
+from channel import chat_channel  # noqa: E402
+from channel.chat_channel import ChatChannel  # noqa: E402
+from common.dequeue import Dequeue  # noqa: E402
+
+
+class _Recorder(object):
+    def __init__(self, total):
+        self.total = total
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def handle(self, context):
+        latency = time.monotonic() - context["produced_at"]
+        with self.lock:
+            self.latencies.append(latency)
+            if len(self.latencies) >= self.total:
+                self.done.set()
+
+
+class BenchChannel(ChatChannel):
+    """当前实现，_handle 只记录调度延迟"""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        super().__init__()
+
+    def _handle(self, context):
+        self.recorder.handle(context)
+
+
+class LegacyChannel(BenchChannel):
+    """原有实现：每 0.2 秒遍历所有 session，用信号量控制 session 内并发"""
+
+    sessions = {}
+    futures = {}
+    lock = threading.Lock()
+
+    def produce(self, context):
+        session_id = context.get("session_id", 0)
+        with self.lock:
+            if session_id not in self.sessions:
+                self.sessions[session_id] = [Dequeue(), threading.BoundedSemaphore(4)]
+            self.sessions[session_id][0].put(context)
+
+    def consume(self):
+        while True:
+            with self.lock:
+                session_ids = list(self.sessions.keys())
+            for session_id in session_ids:
+                with self.lock:
+                    context_queue, semaphore = self.sessions[session_id]
+                if semaphore.acquire(blocking=False):
+                    if not context_queue.empty():
+                        context = context_queue.get()
+                        future = chat_channel.handler_pool.submit(self._handle, context)
+                        future.add_done_callback(lambda f, s=semaphore: s.release())
+                    elif semaphore._initial_value == semaphore._value + 1:
+                        with self.lock:
+                            del self.sessions[session_id]
+                    else:
+                        semaphore.release()
+            time.sleep(0.2)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(channel_cls, sessions, messages):
+    recorder = _Recorder(sessions * messages)
+    channel = channel_cls(recorder)
+    start = time.monotonic()
+    for i in range(messages):
+        for s in range(sessions):
+            context = Context(ContextType.TEXT, f"msg {i}", kwargs={"session_id": f"session_{s}", "produced_at": time.monotonic()})
+            channel.produce(context)
+    recorder.done.wait()
+    elapsed = time.monotonic() - start
+    latencies = recorder.latencies
+    return {
+        "elapsed": elapsed,
+        "p50": _percentile(latencies, 0.5) * 1000,
+        "p99": _percentile(latencies, 0.99) * 1000,
+        "max": max(latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--sessions", type=int, default=10000, help="session数")
+    parser.add_argument("-m", "--messages", type=int, default=1, help="每个session的消息数")
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.messages} messages")
+    print(f"{'scheduler':<12}{'total(s)':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for name, cls in (("legacy", LegacyChannel), ("ready-queue", BenchChannel)):
+        result = run(cls, args.sessions, args.messages)
+        print(f"{name:<12}{result['elapsed']:>10.2f}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['max']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+压测用的本地替身服务
+
+- StubWX849Server: 实现 WX849Channel 用到的 /VXAPI/Msg/* 和 /VXAPI/Group/* 接口。
+  inject() 放入的消息由 /Msg/Sync 返回(没有消息时最多挂起 sync_wait 秒，模拟长轮询)，
+  /Msg/SendTxt 等发送接口记录每条回复的到达时间。
+- StubDifyServer: 实现 Dify 的 /v1/chat-messages，按配置的延迟返回 blocking 响应或 SSE 流，
+  回复内容包含原始query，便于把回复和请求对应起来。
+
+两个服务都在独立线程的事件循环中运行，不占用被测channel的事件循环。
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+
+class _StubServer(object):
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self._runner = None
+
+    def build_app(self):
+        raise NotImplementedError
+
+    def start(self):
+        """在后台线程中启动服务，返回实际监听的端口"""
+        started = threading.Event()
+
+        async def start_site():
+            self._runner = web.AppRunner(self.build_app(), access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self.host, self.port)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(start_site())
+            started.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name=f"{type(self).__name__}", daemon=True).start()
+        started.wait()
+        return self.port
+
+    def stop(self):
+        if self._runner:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class StubWX849Server(_StubServer):
+    def __init__(self, bot_wxid="wxid_bot", sync_wait=0.5, batch_size=50, **kwargs):
+        super().__init__(**kwargs)
+        self.bot_wxid = bot_wxid
+        self.sync_wait = sync_wait
+        self.batch_size = batch_size
+        self._pending = []
+        self._arrived = None  # asyncio.Event，在服务线程的事件循环中创建
+        self._msg_id = 0
+        self._lock = threading.Lock()
+        self.sent = []  # (到达时间, 接收者, 内容)
+        self.on_send = None  # 收到回复时的回调 (到达时间, 接收者, 内容)
+        self.requests = {}  # 接口 -> 调用次数
+
+    def build_app(self):
+        self._arrived = asyncio.Event()
+        app = web.Application()
+        app.router.add_post("/VXAPI/Msg/Sync", self._sync)
+        app.router.add_post("/VXAPI/Msg/SendTxt", self._send_txt)
+        app.router.add_post("/VXAPI/Msg/UploadImg", self._send_other)
+        app.router.add_post("/VXAPI/Group/GetChatRoomInfo", self._group_info)
+        app.router.add_post("/VXAPI/Group/GetChatRoomMemberDetail", self._member_detail)
+        return app
+
+    def _count(self, name):
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    def inject(self, from_wxid, content, group_id=None):
+        """模拟收到一条文本消息，群消息的内容格式为 "发送者wxid:\\n内容" """
+        with self._lock:
+            self._msg_id += 1
+            msg_id = self._msg_id
+        raw = {
+            "MsgId": msg_id,
+            "NewMsgId": msg_id,
+            "FromUserName": {"string": group_id or from_wxid},
+            "ToUserName": {"string": self.bot_wxid},
+            "MsgType": 1,
+            "Content": {"string": f"{from_wxid}:\n{content}" if group_id else content},
+            "CreateTime": int(time.time()),
+            "MsgSource": "",
+        }
+        self.loop.call_soon_threadsafe(self._append, raw)
+
+    def _append(self, raw):
+        self._pending.append(raw)
+        self._arrived.set()
+
+    async def _sync(self, request):
+        self._count("Msg/Sync")
+        if not self._pending:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), self.sync_wait)
+            except asyncio.TimeoutError:
+                pass
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        return web.json_response({
+            "Success": True,
+            "Data": {
+                "AddMsgs": batch,
+                "KeyBuf": {"buffer": uuid.uuid4().hex},
+                "ContinueFlag": 1 if self._pending else 0,
+            },
+        })
+
+    async def _send_txt(self, request):
+        self._count("Msg/SendTxt")
+        params = await request.json()
+        record = (time.monotonic(), params.get("ToWxid"), params.get("Content", ""))
+        self.sent.append(record)
+        if self.on_send:
+            self.on_send(*record)
+        return web.json_response({
+            "Success": True,
+            "Data": {"List": [{"ClientMsgid": len(self.sent), "Createtime": int(time.time()), "NewMsgId": len(self.sent)}]},
+        })
+
+    async def _send_other(self, request):
+        self._count(request.path.replace("/VXAPI/", ""))
+        await request.read()
+        return web.json_response({"Success": True, "Data": {}})
+
+    async def _group_info(self, request):
+        self._count("Group/GetChatRoomInfo")
+        params = await request.json()
+        group_id = params.get("QID") or params.get("Qid") or params.get("ChatRoomName") or ""
+        return web.json_response({
+            "Success": True,
+            "Data": {"ContactList": [{"UserName": {"string": group_id}, "NickName": {"string": f"压测群{group_id[:6]}"}}]},
+        })
+
+    async def _member_detail(self, request):
+        self._count("Group/GetChatRoomMemberDetail")
+        members = [{"UserName": f"wxid_user{i}", "NickName": f"用户{i}", "DisplayName": ""} for i in range(50)]
+        return web.json_response({
+            "Success": True,
+            "Data": {"NewChatroomData": {"MemberCount": len(members), "ChatRoomMember": members}},
+        })
+
+
+class StubDifyServer(_StubServer):
+    def __init__(self, latency=0.2, jitter=0.1, chunks=5, paragraphs=1, **kwargs):
+        """
+        :param latency: 每个请求的平均延迟(秒)，即生成完整答案的时间
+        :param jitter: 延迟的随机波动比例
+        :param chunks: SSE模式下每个段落拆成的分片数，延迟平均分摊在所有分片之间
+        :param paragraphs: 答案的段落数，第一段包含原始query
+        """
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks = chunks
+        self.paragraphs = paragraphs
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat-messages", self._chat_messages)
+        return app
+
+    def _delay(self):
+        return max(0.0, self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _chat_messages(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            body = await request.json()
+            query = body.get("query", "")
+            conversation_id = body.get("conversation_id") or uuid.uuid4().hex
+            message_id = uuid.uuid4().hex
+            paragraphs = [f"收到: {query}。"] + [
+                f"这是第{i + 1}段回答，用来模拟较长的多段落回复，每一段都包含若干个完整的句子。内容本身没有意义。"
+                for i in range(1, self.paragraphs)]
+            answer = "\n\n".join(paragraphs)
+            if body.get("response_mode") != "streaming":
+                await asyncio.sleep(self._delay())
+                return web.json_response({
+                    "event": "message", "message_id": message_id, "conversation_id": conversation_id,
+                    "mode": "chat", "answer": answer, "metadata": {"usage": {}}, "created_at": int(time.time()),
+                })
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            pieces = []
+            for i, paragraph in enumerate(paragraphs):
+                text = ("\n\n" if i else "") + paragraph
+                size = max(1, -(-len(text) // max(1, self.chunks)))
+                pieces += [text[j:j + size] for j in range(0, len(text), size)]
+            delay = self._delay() / len(pieces)
+            for piece in pieces:
+                await asyncio.sleep(delay)
+                event = {"event": "agent_message", "message_id": message_id, "conversation_id": conversation_id,
+                         "answer": piece, "created_at": int(time.time())}
+                await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            end = {"event": "message_end", "message_id": message_id, "conversation_id": conversation_id,
+                   "metadata": {"usage": {}}}
+            await response.write(f"data: {json.dumps(end)}\n\n".encode("utf-8"))
+            await response.write_eof()
+            return response
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,217 @@
+"""
+WX849 消息解析微基准
+
+对比单遍解析(channel.wx849.wx849_parser.parse_message)与原有解析路径
+(WX849Message 中解析 MsgSource + _process_message 多次 split + 各类型处理方法的正则和 ET.fromstring)。
+
+用法: python benchmarks/wx849_parser_bench.py [-n 次数]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel.wx849.wx849_parser import parse_message  # noqa: E402
+
+GROUP = "12345678901@chatroom"
+SELF = "wxid_bot"
+SENDER = "wxid_sender01"
+
+AT_SOURCE = (
+    "<msgsource><atuserlist><![CDATA[,wxid_bot]]></atuserlist><bizflag>0</bizflag>"
+    "<silence>0</silence><membercount>128</membercount><signature>V1_abcdef|v1_abcdef</signature>"
+    "<tmp_node><publisher-id></publisher-id></tmp_node></msgsource>"
+)
+PLAIN_SOURCE = "<msgsource><bizflag>0</bizflag><silence>1</silence><membercount>128</membercount></msgsource>"
+
+IMAGE_XML = (
+    '<?xml version="1.0"?>\n<msg>\n\t<img aeskey="0123456789abcdef0123456789abcdef" encryver="1" '
+    'cdnthumbaeskey="0123456789abcdef0123456789abcdef" cdnthumburl="3057020100044b30490201000204" '
+    'cdnthumblength="3280" cdnthumbheight="120" cdnthumbwidth="90" cdnmidheight="0" cdnmidwidth="0" '
+    'cdnhdheight="0" cdnhdwidth="0" cdnmidimgurl="3057020100044b304902010002045e" length="74513" '
+    'md5="d41d8cd98f00b204e9800998ecf8427e" hevc_mid_size="74513" />\n\t<platform_signature></platform_signature>\n'
+    '\t<imgdatahash></imgdatahash>\n</msg>\n'
+)
+VOICE_XML = (
+    '<msg><voicemsg endflag="1" cancelflag="0" forwardflag="0" voiceformat="4" voicelength="3420" '
+    'length="5140" bufid="0" aeskey="0123456789abcdef" voiceurl="3052020100044b304902010002" '
+    'voicemd5="" clientmsgid="41d8cd98f00b204e9800998ecf" fromusername="wxid_sender01" /></msg>'
+)
+VIDEO_XML = (
+    '<?xml version="1.0"?>\n<msg>\n\t<videomsg aeskey="0123456789abcdef" cdnvideourl="3057020100044b30" '
+    'cdnthumbaeskey="0123456789abcdef" cdnthumburl="3057020100044b30" length="1934285" playlength="12" '
+    'cdnthumblength="8910" cdnthumbwidth="288" cdnthumbheight="512" fromusername="wxid_sender01" '
+    'md5="d41d8cd98f00b204e9800998ecf8427e" newmd5="" isplaceholder="0" rawmd5="" rawlength="0" '
+    'cdnrawvideourl="" cdnrawvideoaeskey="" overwritenewmsgid="0" isad="0" />\n</msg>\n'
+)
+EMOJI_XML = (
+    '<msg><emoji fromusername = "wxid_sender01" tousername = "12345678901@chatroom" type="2" '
+    'idbuffer="media:0_0" md5="d41d8cd98f00b204e9800998ecf8427e" len = "48812" productid="" '
+    'androidmd5="d41d8cd98f00b204e9800998ecf8427e" androidlen="48812" s60v3md5 = "" s60v3len="48812" '
+    'cdnurl = "http://wxapp.tc.qq.com/262/20304/stodownload?m=d41d8&amp;filekey=3043" designerid = "" '
+    'thumburl = "" encrypturl = "" aeskey= "" externurl = "" externmd5 = "" width= "240" height= "240" /></msg>'
+)
+LINK_XML = (
+    '<?xml version="1.0"?>\n<msg>\n\t<appmsg appid="" sdkver="0">\n\t\t<title>一篇文章的标题</title>\n'
+    '\t\t<des>文章摘要内容，长度适中的一段描述文字</des>\n\t\t<action />\n\t\t<type>5</type>\n'
+    '\t\t<url>https://mp.weixin.qq.com/s?__biz=MzA&amp;mid=2650&amp;idx=1&amp;sn=abc</url>\n'
+    '\t\t<thumburl>https://mmbiz.qpic.cn/mmbiz_jpg/abc/0</thumburl>\n\t</appmsg>\n'
+    '\t<fromusername>wxid_sender01</fromusername>\n\t<scene>0</scene>\n\t<appinfo>\n\t\t<version>1</version>\n'
+    '\t\t<appname></appname>\n\t</appinfo>\n\t<commenturl></commenturl>\n</msg>\n'
+)
+QUOTE_XML = (
+    '<?xml version="1.0"?>\n<msg>\n\t<appmsg appid="" sdkver="0">\n\t\t<title>这个怎么看</title>\n'
+    '\t\t<des />\n\t\t<action />\n\t\t<type>57</type>\n\t\t<refermsg>\n\t\t\t<type>1</type>\n'
+    '\t\t\t<svrid>1234567890123456789</svrid>\n\t\t\t<fromusr>12345678901@chatroom</fromusr>\n'
+    '\t\t\t<chatusr>wxid_other</chatusr>\n\t\t\t<displayname>张三</displayname>\n'
+    '\t\t\t<content>被引用的原始消息</content>\n\t\t</refermsg>\n\t</appmsg>\n'
+    '\t<fromusername>wxid_sender01</fromusername>\n</msg>\n'
+)
+
+
+def _raw(msg_type, content, group=True, source=PLAIN_SOURCE):
+    return {
+        "MsgId": 1234567890,
+        "FromUserName": {"string": GROUP if group else SENDER},
+        "ToUserName": {"string": SELF},
+        "MsgType": msg_type,
+        "Content": {"string": f"{SENDER}:\n{content}" if group else content},
+        "CreateTime": 1700000000,
+        "MsgSource": source,
+        "NewMsgId": 1234567890123456789,
+    }
+
+
+CORPUS = {
+    "group_text_at": _raw(1, "@机器人 帮我查一下明天北京的天气", source=AT_SOURCE),
+    "group_text": _raw(1, "大家好，今天的会议改到下午三点"),
+    "private_text": _raw(1, "你好，请问怎么使用？", group=False),
+    "group_image": _raw(3, IMAGE_XML),
+    "private_image": _raw(3, IMAGE_XML, group=False),
+    "group_voice": _raw(34, VOICE_XML),
+    "group_video": _raw(43, VIDEO_XML),
+    "group_emoji": _raw(47, EMOJI_XML),
+    "group_link": _raw(49, LINK_XML),
+    "group_quote": _raw(49, QUOTE_XML),
+}
+
+
+def _str(value):
+    return value.get("string", "") if isinstance(value, dict) else str(value)
+
+
+def legacy_parse(msg):
+    """按原有路径解析，返回与单遍解析可对比的字段"""
+    content = _str(msg["Content"])
+    from_user = _str(msg["FromUserName"])
+    is_group = from_user.endswith("@chatroom")
+    msg_type = msg["MsgType"]
+    result = {"sender": "", "body": content, "at_list": [], "self_display_name": ""}
+
+    # WX849Message.__init__: MsgSource
+    msg_source = msg.get("MsgSource", "")
+    try:
+        root = ET.fromstring(msg_source if "<msgsource>" in msg_source.lower() else f"<msgsource>{msg_source}</msgsource>")
+        for tag in ["selfDisplayName", "displayname", "nickname"]:
+            elem = root.find(f".//{tag}")
+            if elem is not None and elem.text:
+                result["self_display_name"] = elem.text
+                break
+    except Exception:
+        pass
+
+    # 各类型处理方法
+    if msg_type == 1:
+        split_content = content.split(":\n", 1)
+        if len(split_content) > 1 and split_content[0] and not split_content[0].startswith("<"):
+            result["sender"], content = split_content
+        else:
+            split_content = content.split(":", 1)
+            if len(split_content) > 1 and split_content[0] and not split_content[0].startswith("<"):
+                result["sender"], content = split_content
+        try:
+            root = ET.fromstring(msg_source)
+            ats_elem = root.find(".//atuserlist")
+            if ats_elem is not None and ats_elem.text:
+                result["at_list"] = [x for x in ats_elem.text.strip(",").split(",") if x]
+        except Exception:
+            pass
+    elif msg_type == 3:
+        split_content = content.split(":\n", 1)
+        if len(split_content) > 1:
+            result["sender"], content = split_content
+        try:
+            img = ET.fromstring(content).find("img")
+            if img is not None:
+                result["aeskey"] = img.get("aeskey")
+                result["md5"] = img.get("md5")
+                result["length"] = img.get("length")
+        except Exception:
+            pass
+    elif msg_type in (34, 43, 47, 49):
+        match = re.search(r'fromusername\s*=\s*["\'](.*?)["\']', content)
+        if not match:
+            match = re.search(r'<fromusername>(.*?)</fromusername>', content)
+        if is_group:
+            split_content = content.split(":\n", 1)
+            if len(split_content) > 1:
+                result["sender"] = split_content[0]
+        if msg_type == 34:
+            try:
+                voice = ET.fromstring(content).find("voicemsg")
+                if voice is not None:
+                    result["voiceurl"] = voice.get("voiceurl")
+                    result["length"] = voice.get("length")
+            except Exception:
+                pass
+
+    # _process_message 中对群消息的再次拆分
+    if is_group:
+        split_content = content.split(":\n", 1)
+        if len(split_content) > 1 and split_content[0] and not split_content[0].startswith("<"):
+            result["sender"], content = split_content
+        elif content.startswith("<"):
+            try:
+                root = ET.fromstring(content)
+                if root.tag == "msg":
+                    root.find(".//username")
+            except Exception:
+                pass
+    result["body"] = content
+    return result
+
+
+def compiled_parse(msg):
+    """单遍解析，并读取与原有路径相同的类型属性"""
+    content = _str(msg["Content"])
+    from_user = _str(msg["FromUserName"])
+    parsed = parse_message(msg, content, from_user, from_user.endswith("@chatroom"))
+    if msg["MsgType"] == 3:
+        parsed.attr("aeskey"), parsed.attr("md5"), parsed.attr("length")
+    elif msg["MsgType"] == 34:
+        parsed.attr("voiceurl"), parsed.attr("length")
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=20000, help="每种消息的解析次数")
+    args = parser.parse_args()
+
+    print(f"{'payload':<16}{'legacy(us)':>12}{'compiled(us)':>14}{'speedup':>10}")
+    total_legacy = total_compiled = 0.0
+    for name, msg in CORPUS.items():
+        legacy = timeit.timeit(lambda: legacy_parse(msg), number=args.number) / args.number * 1e6
+        compiled = timeit.timeit(lambda: compiled_parse(msg), number=args.number) / args.number * 1e6
+        total_legacy += legacy
+        total_compiled += compiled
+        print(f"{name:<16}{legacy:>12.2f}{compiled:>14.2f}{legacy / compiled:>9.1f}x")
+    print(f"{'total':<16}{total_legacy:>12.2f}{total_compiled:>14.2f}{total_legacy / total_compiled:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
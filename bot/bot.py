@@ -5,6 +5,7 @@ Auto-replay chat robot abstract class
 
 from bridge.context import Context
 from bridge.reply import Reply
+from common.worker_pool import run_in_pool
 
 
 class Bot(object):
@@ -15,3 +16,10 @@ class Bot(object):
         :return: reply content
         """
         raise NotImplementedError
+
+    async def async_reply(self, query, context: Context = None) -> Reply:
+        """
+        异步流水线使用的回复接口，默认在llm线程池中调用同步的reply；
+        支持异步请求的bot重写此方法，等待回复时不占用线程
+        """
+        return await run_in_pool("llm", self.reply, query, context)
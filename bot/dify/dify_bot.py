@@ -1,80 +1,121 @@
 # encoding:utf-8
+import asyncio
 import io
 import os
 import mimetypes
-import threading
 import json
+import time
 
 
 import requests
 from urllib.parse import urlparse, unquote
 
 from bot.bot import Bot
-from lib.dify.dify_client import DifyClient, ChatClient
+from lib.dify.dify_client import ChatClient
 from bot.dify.dify_session import DifySession, DifySessionManager
+from bot.dify.dify_stream import StreamAssembler
+from bot.dify.dify_upload_cache import UploadCache, upload_key
 from bridge.context import ContextType, Context
 from bridge.reply import Reply, ReplyType
 from common.log import logger
-from common import const, memory
+from common import const, http_client, memory
+from common.metrics import metrics
 from common.utils import parse_markdown_text, print_red
 from common.tmp_dir import TmpDir
+from common.worker_pool import AdaptiveThreadPool, run_in_pool
 from config import conf
 
 UNKNOWN_ERROR_MSG = "我暂时遇到了一些问题，请您稍后重试~"
 
+# 下载回复中图片和文件的线程池，与发送回复的线程分开，等待下载时不会互相阻塞
+download_pool = AdaptiveThreadPool("dify_download", min_workers=1, max_workers=4)
+
+
+class _DownloadTooLarge(Exception):
+    pass
+
+
+def _read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
 class DifyBot(Bot):
     def __init__(self):
         super().__init__()
         self.sessions = DifySessionManager(DifySession, model=conf().get("model", const.DIFY))
+        self._clients = {}  # (api_base, api_key) -> ChatClient，所有请求复用共享的HTTP连接
+        self._async_clients = {}  # (api_base, api_key) -> AsyncDifyClient
+        self._first_segment_histogram = metrics.histogram("dify_stream_first_segment_seconds", doc="流式回复从发出请求到第一段可以发送的耗时")
+        self._upload_cache = UploadCache(conf().get("dify_upload_cache_ttl", 3600))  # 相同图片不重复上传
+        download_pool.set_bounds(max_workers=conf().get("dify_download_concurrency", 4))
 
     def reply(self, query, context: Context=None):
         # acquire reply content
         if context.type == ContextType.TEXT or context.type == ContextType.IMAGE_CREATE:
-            if context.type == ContextType.IMAGE_CREATE:
-                query = conf().get('image_create_prefix', ['画'])[0] + query
-            logger.info("[DIFY] query={}".format(query))
-            session_id = context["session_id"]
-            # TODO: 适配除微信以外的其他channel
-            channel_type = conf().get("channel_type", "wx")
-            user = None
-            if channel_type in ["wx", "wework", "gewechat", "wx849"]:
-                user = context["msg"].other_user_nickname if context.get("msg") else "default"
-            elif channel_type in ["wechatcom_app", "wechatmp", "wechatmp_service", "wechatcom_service", "web"]:
-                user = context["msg"].other_user_id if context.get("msg") else "default"
-            else:
-                return Reply(ReplyType.ERROR, f"unsupported channel type: {channel_type}, now dify only support wx, wx849, wechatcom_app, wechatmp, wechatmp_service channel")
-            logger.debug(f"[DIFY] dify_user={user}")
-            user = user if user else "default" # 防止用户名为None，当被邀请进的群未设置群名称时用户名为None
-            session = self.sessions.get_session(session_id, user)
-            if context.get("isgroup", False):
-                # 群聊：根据是否是共享会话群来决定是否设置用户信息
-                if not context.get("is_shared_session_group", False):
-                    # 非共享会话群：设置发送者信息
-                    session.set_user_info(context["msg"].actual_user_id, context["msg"].actual_user_nickname)
-                else:
-                    # 共享会话群：不设置用户信息
-                    session.set_user_info('', '')
-                # 设置群聊信息
-                session.set_room_info(context["msg"].other_user_id, context["msg"].other_user_nickname)
-            else:
-                # 私聊：使用发送者信息作为用户信息，房间信息留空
-                session.set_user_info(context["msg"].other_user_id, context["msg"].other_user_nickname)
-                session.set_room_info('', '')
-
-            # 打印设置的session信息
-            logger.debug(f"[DIFY] Session user and room info - user_id: {session.get_user_id()}, user_name: {session.get_user_name()}, room_id: {session.get_room_id()}, room_name: {session.get_room_name()}")
-            logger.debug(f"[DIFY] session={session} query={query}")
-
+            query, session, error_reply = self._prepare_session(query, context)
+            if error_reply:
+                return error_reply
             reply, err = self._reply(query, session, context)
-            if err != None:
-                dify_error_reply = conf().get("dify_error_reply", None)
-                error_msg = dify_error_reply if dify_error_reply else err
-                reply = Reply(ReplyType.TEXT, error_msg)
-            return reply
+            return self._error_reply(err) if err != None else reply
         else:
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
+    async def async_reply(self, query, context: Context = None):
+        """异步流水线使用AsyncDifyClient请求Dify，等待回复时不占用线程，所在任务被取消时中断请求"""
+        if context.type == ContextType.TEXT or context.type == ContextType.IMAGE_CREATE:
+            query, session, error_reply = self._prepare_session(query, context)
+            if error_reply:
+                return error_reply
+            reply, err = await self._reply_async(query, session, context)
+            return self._error_reply(err) if err != None else reply
+        else:
+            return Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
+
+    def _prepare_session(self, query, context: Context):
+        """返回 (query, session, 错误回复)"""
+        if context.type == ContextType.IMAGE_CREATE:
+            query = conf().get('image_create_prefix', ['画'])[0] + query
+        logger.info("[DIFY] query={}".format(query))
+        session_id = context["session_id"]
+        # TODO: 适配除微信以外的其他channel
+        channel_type = conf().get("channel_type", "wx")
+        user = None
+        if channel_type in ["wx", "wework", "gewechat", "wx849"]:
+            user = context["msg"].other_user_nickname if context.get("msg") else "default"
+        elif channel_type in ["wechatcom_app", "wechatmp", "wechatmp_service", "wechatcom_service", "web"]:
+            user = context["msg"].other_user_id if context.get("msg") else "default"
+        else:
+            return query, None, Reply(ReplyType.ERROR, f"unsupported channel type: {channel_type}, now dify only support wx, wx849, wechatcom_app, wechatmp, wechatmp_service channel")
+        logger.debug(f"[DIFY] dify_user={user}")
+        user = user if user else "default" # 防止用户名为None，当被邀请进的群未设置群名称时用户名为None
+        session = self.sessions.get_session(session_id, user)
+        if context.get("isgroup", False):
+            # 群聊：根据是否是共享会话群来决定是否设置用户信息
+            if not context.get("is_shared_session_group", False):
+                # 非共享会话群：设置发送者信息
+                session.set_user_info(context["msg"].actual_user_id, context["msg"].actual_user_nickname)
+            else:
+                # 共享会话群：不设置用户信息
+                session.set_user_info('', '')
+            # 设置群聊信息
+            session.set_room_info(context["msg"].other_user_id, context["msg"].other_user_nickname)
+        else:
+            # 私聊：使用发送者信息作为用户信息，房间信息留空
+            session.set_user_info(context["msg"].other_user_id, context["msg"].other_user_nickname)
+            session.set_room_info('', '')
+
+        # 打印设置的session信息
+        logger.debug(f"[DIFY] Session user and room info - user_id: {session.get_user_id()}, user_name: {session.get_user_name()}, room_id: {session.get_room_id()}, room_name: {session.get_room_name()}")
+        logger.debug(f"[DIFY] session={session} query={query}")
+        return query, session, None
+
+    def _error_reply(self, err):
+        dify_error_reply = conf().get("dify_error_reply", None)
+        error_msg = dify_error_reply if dify_error_reply else err
+        return Reply(ReplyType.TEXT, error_msg)
+
     # TODO: delete this function
     def _get_payload(self, query, session: DifySession, response_mode):
         # 输入的变量参考 wechat-assistant-pro：https://github.com/leochen-g/wechat-assistant-pro/issues/76
@@ -94,10 +135,21 @@ class DifyBot(Bot):
     def _get_dify_conf(self, context: Context, key, default=None):
         return context.get(key, conf().get(key, default))
 
+    def _get_client(self, context: Context) -> ChatClient:
+        api_key = self._get_dify_conf(context, "dify_api_key", '')
+        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
+        client = self._clients.get((api_base, api_key))
+        if client is None:
+            client = self._clients[(api_base, api_key)] = ChatClient(api_key, api_base, requester=http_client.request)
+        return client
+
     def _reply(self, query: str, session: DifySession, context: Context):
         try:
             session.count_user_message() # 限制一个conversation中消息数，防止conversation过长
             dify_app_type = self._get_dify_conf(context, "dify_app_type", 'chatbot')
+            if dify_app_type in ('chatbot', 'chatflow', 'agent') and context.get("channel") \
+                    and self._get_dify_conf(context, "dify_stream_reply", False):
+                return self._handle_stream(query, session, context)
             if dify_app_type == 'chatbot' or dify_app_type == 'chatflow':
                 return self._handle_chatbot(query, session, context)
             elif dify_app_type == 'agent':
@@ -113,10 +165,140 @@ class DifyBot(Bot):
             logger.exception(error_info)
             return None, UNKNOWN_ERROR_MSG
 
-    def _handle_chatbot(self, query: str, session: DifySession, context: Context):
+    def _get_async_client(self, context: Context):
+        from lib.dify.async_dify_client import AsyncDifyClient
+
         api_key = self._get_dify_conf(context, "dify_api_key", '')
         api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        chat_client = ChatClient(api_key, api_base)
+        client = self._async_clients.get((api_base, api_key))
+        if client is None:
+            client = self._async_clients[(api_base, api_key)] = AsyncDifyClient(
+                api_key, api_base,
+                timeout=conf().get("dify_request_timeout", 180),
+                max_concurrency=conf().get("dify_max_concurrency", 20),
+                idle_timeout=conf().get("http_read_timeout", 180),  # 与同步请求的读取超时一致
+            )
+        return client
+
+    async def _reply_async(self, query: str, session: DifySession, context: Context):
+        from lib.dify.async_dify_client import DifyAPIError
+
+        try:
+            session.count_user_message() # 限制一个conversation中消息数，防止conversation过长
+            dify_app_type = self._get_dify_conf(context, "dify_app_type", 'chatbot')
+            if dify_app_type in ('chatbot', 'chatflow', 'agent') and context.get("channel") \
+                    and self._get_dify_conf(context, "dify_stream_reply", False):
+                return await self._handle_stream_async(query, session, context)
+            if dify_app_type == 'chatbot' or dify_app_type == 'chatflow':
+                return await self._handle_chatbot_async(query, session, context)
+            elif dify_app_type == 'agent':
+                return await self._handle_agent_async(query, session, context)
+            elif dify_app_type == 'workflow':
+                return await self._handle_workflow_async(query, session, context)
+            else:
+                friendly_error_msg = "[DIFY] 请检查 config.json 中的 dify_app_type 设置，目前仅支持 agent, chatbot, chatflow, workflow"
+                return None, friendly_error_msg
+        except asyncio.CancelledError:
+            logger.info(f"[DIFY] request cancelled, session_id={session.get_session_id()}")
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"[DIFY] request timeout, session_id={session.get_session_id()}")
+            return None, UNKNOWN_ERROR_MSG
+        except DifyAPIError as e:
+            logger.warning(f"[DIFY] response text={e.text} status_code={e.status}")
+            return None, self._handle_error_response(e.text, e.status)
+        except Exception as e:
+            error_info = f"[DIFY] Exception: {e}"
+            logger.exception(error_info)
+            return None, UNKNOWN_ERROR_MSG
+
+    async def _handle_chatbot_async(self, query: str, session: DifySession, context: Context):
+        client = self._get_async_client(context)
+        payload = self._get_payload(query, session, 'blocking')
+        files = await self._get_upload_files_async(session, context, client)
+        rsp_data = await client.create_chat_message(
+            inputs=payload['inputs'],
+            query=payload['query'],
+            user=payload['user'],
+            conversation_id=payload['conversation_id'],
+            files=files
+        )
+        # 答案中的图片和文件在线程池中下载和发送
+        return await run_in_pool("media", self._chatbot_reply, rsp_data, session, context)
+
+    async def _handle_agent_async(self, query: str, session: DifySession, context: Context):
+        client = self._get_async_client(context)
+        payload = self._get_payload(query, session, 'streaming')
+        files = await self._get_upload_files_async(session, context, client)
+        events = []
+        stream = client.stream_chat_message(
+            inputs=payload['inputs'],
+            query=payload['query'],
+            user=payload['user'],
+            conversation_id=payload['conversation_id'],
+            files=files
+        )
+        try:
+            async for event in stream:
+                events.append(event)
+                if event.get('event') == 'message_end':
+                    break
+        finally:
+            await stream.aclose()
+        msgs, conversation_id = self._merge_sse_events(events)
+        return await run_in_pool("media", self._agent_reply, msgs, conversation_id, session, context)
+
+    async def _handle_stream_async(self, query: str, session: DifySession, context: Context):
+        client = self._get_async_client(context)
+        payload = self._get_payload(query, session, 'streaming')
+        files = await self._get_upload_files_async(session, context, client)
+        assembler = self._new_stream_assembler(context)
+        progress = {"start": time.monotonic(), "sent": 0}
+        stream = client.stream_chat_message(
+            inputs=payload['inputs'],
+            query=payload['query'],
+            user=payload['user'],
+            conversation_id=payload['conversation_id'],
+            files=files
+        )
+        try:
+            async for event in stream:
+                items = assembler.feed(event)
+                if items:
+                    await run_in_pool("media", self._deliver_stream_items, items, context, progress)
+                if assembler.done:
+                    break
+        finally:
+            await stream.aclose()
+        return await run_in_pool("media", self._finish_stream, assembler, session, context, progress)
+
+    async def _handle_workflow_async(self, query: str, session: DifySession, context: Context):
+        payload = self._get_workflow_payload(query, session)
+        rsp_data = await self._get_async_client(context).run_workflow(inputs=payload['inputs'], user=payload['user'])
+        return self._workflow_reply(rsp_data)
+
+    async def _get_upload_files_async(self, session: DifySession, context: Context, client):
+        from lib.dify.async_dify_client import DifyAPIError
+
+        path = await run_in_pool("media", self._take_upload_image, session, context)
+        if not path:
+            return None
+        file_name = os.path.basename(path)
+        file_type, _ = mimetypes.guess_type(file_name)
+        content = await run_in_pool("media", _read_file, path)
+
+        async def upload():
+            try:
+                return await client.file_upload(session.get_user(), file_name, content, file_type)
+            except DifyAPIError as e:
+                logger.warning(f"[DIFY] response text={e.text} status_code={e.status} when upload file")
+                return None
+
+        file_upload_data = await self._upload_cache.get_or_upload_async(upload_key(client, content), upload)
+        return self._upload_files_payload(file_upload_data) if file_upload_data else None
+
+    def _handle_chatbot(self, query: str, session: DifySession, context: Context):
+        chat_client = self._get_client(context)
         response_mode = 'blocking'
         payload = self._get_payload(query, session, response_mode)
         files = self._get_upload_files(session, context)
@@ -149,7 +331,10 @@ class DifyBot(Bot):
         #     },
         #     "created_at": 1705407629
         # }
-        rsp_data = response.json()
+        return self._chatbot_reply(response.json(), session, context)
+
+    def _chatbot_reply(self, rsp_data, session: DifySession, context: Context):
+        """处理chatbot的完整响应：答案中除最后一项外的文字、图片和文件先直接发送，最后一项作为返回值"""
         logger.debug("[DIFY] usage {}".format(rsp_data.get('metadata', {}).get('usage', 0)))
 
         answer = rsp_data['answer']
@@ -161,64 +346,72 @@ class DifyBot(Bot):
         is_group = context.get("isgroup", False)
         if is_group:
             at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-        for item in parsed_content[:-1]:
-            reply = None
-            if item['type'] == 'text':
-                content = at_prefix + item['content']
-                reply = Reply(ReplyType.TEXT, content)
-            elif item['type'] == 'image':
-                image_url = self._fill_file_base_url(item['content'])
-                image = self._download_image(image_url)
-                if image:
-                    reply = Reply(ReplyType.IMAGE, image)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-            elif item['type'] == 'file':
-                file_url = self._fill_file_base_url(item['content'])
-                file_path = self._download_file(file_url)
-                if file_path:
-                    reply = Reply(ReplyType.FILE, file_path)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        # 所有图片和文件先并行下载，再按原顺序逐项发送
+        prefetched = self._prefetch_media(parsed_content)
+        for item, future in zip(parsed_content[:-1], prefetched):
+            reply = future.result() if future else self._build_item_reply(item, at_prefix)
             logger.debug(f"[DIFY] reply={reply}")
             if reply and channel:
                 channel.send(reply, context)
         # parsed_content 没有数据时，直接不回复
         if not parsed_content:
             return None, None
-        final_item = parsed_content[-1]
-        final_reply = None
-        if final_item['type'] == 'text':
-            content = final_item['content']
-            if is_group:
-                at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-                content = at_prefix + content
-            final_reply = Reply(ReplyType.TEXT, final_item['content'])
-        elif final_item['type'] == 'image':
-            image_url = self._fill_file_base_url(final_item['content'])
+        # 最后一项作为返回值，由通道装饰后发送
+        final_reply = prefetched[-1].result() if prefetched[-1] else self._build_item_reply(parsed_content[-1])
+
+        # 设置dify conversation_id, 依靠dify管理上下文
+        if session.get_conversation_id() == '':
+            session.set_conversation_id(rsp_data['conversation_id'])
+
+        return final_reply, None
+
+    def _build_item_reply(self, item, at_prefix=""):
+        """把 parse_markdown_text 解析出的一项转换为Reply，图片和文件下载失败时回复链接"""
+        reply = None
+        if item['type'] == 'text':
+            reply = Reply(ReplyType.TEXT, at_prefix + item['content'])
+        elif item['type'] == 'image':
+            image_url = self._fill_file_base_url(item['content'])
             image = self._download_image(image_url)
             if image:
-                final_reply = Reply(ReplyType.IMAGE, image)
+                reply = Reply(ReplyType.IMAGE, image)
             else:
-                final_reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-        elif final_item['type'] == 'file':
-            file_url = self._fill_file_base_url(final_item['content'])
+                reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
+        elif item['type'] == 'file':
+            file_url = self._fill_file_base_url(item['content'])
             file_path = self._download_file(file_url)
             if file_path:
-                final_reply = Reply(ReplyType.FILE, file_path)
+                reply = Reply(ReplyType.FILE, file_path)
             else:
-                final_reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+                reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        return reply
 
-        # 设置dify conversation_id, 依靠dify管理上下文
-        if session.get_conversation_id() == '':
-            session.set_conversation_id(rsp_data['conversation_id'])
+    def _prefetch_media(self, items):
+        """
+        在下载线程池中并行下载所有图片和文件项，返回与items一一对应的列表：
+        图片和文件项为返回Reply的future，其他项为None
+        """
+        return [download_pool.submit(self._build_item_reply, item) if item['type'] in ('image', 'file') else None
+                for item in items]
 
-        return final_reply, None
+    def _stream_download(self, url, output):
+        """流式下载url写入output，超过 dify_download_max_mb 时抛出 _DownloadTooLarge，返回下载的字节数"""
+        max_size = conf().get("dify_download_max_mb", 20) * 1024 * 1024
+        with http_client.get(url, stream=True) as response:
+            response.raise_for_status()
+            if int(response.headers.get("Content-Length") or 0) > max_size:
+                raise _DownloadTooLarge(f"content-length {response.headers['Content-Length']} exceeds {max_size}")
+            size = 0
+            for block in response.iter_content(64 * 1024):
+                size += len(block)
+                if size > max_size:
+                    raise _DownloadTooLarge(f"size exceeds {max_size}")
+                output.write(block)
+            return size
 
     def _download_file(self, url):
+        file_path = None
         try:
-            response = requests.get(url)
-            response.raise_for_status()
             parsed_url = urlparse(url)
             logger.debug(f"Downloading file from {url}")
             url_path = unquote(parsed_url.path)
@@ -227,32 +420,27 @@ class DifyBot(Bot):
             logger.debug(f"Saving file as {file_name}")
             file_path = os.path.join(TmpDir().path(), file_name)
             with open(file_path, 'wb') as file:
-                file.write(response.content)
+                self._stream_download(url, file)
             return file_path
         except Exception as e:
-            logger.error(f"Error downloading {url}: {e}")
+            logger.error(f"[DIFY] Error downloading {url}: {e}")
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
         return None
 
     def _download_image(self, url):
         try:
-            pic_res = requests.get(url, stream=True)
-            pic_res.raise_for_status()
             image_storage = io.BytesIO()
-            size = 0
-            for block in pic_res.iter_content(1024):
-                size += len(block)
-                image_storage.write(block)
-            logger.debug(f"[WX] download image success, size={size}, img_url={url}")
+            size = self._stream_download(url, image_storage)
+            logger.debug(f"[DIFY] download image success, size={size}, img_url={url}")
             image_storage.seek(0)
             return image_storage
         except Exception as e:
-            logger.error(f"Error downloading {url}: {e}")
+            logger.error(f"[DIFY] Error downloading {url}: {e}")
         return None
 
     def _handle_agent(self, query: str, session: DifySession, context: Context):
-        api_key = self._get_dify_conf(context, "dify_api_key", '')
-        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        chat_client = ChatClient(api_key, api_base)
+        chat_client = self._get_client(context)
         response_mode = 'streaming'
         payload = self._get_payload(query, session, response_mode)
         files = self._get_upload_files(session, context)
@@ -276,10 +464,16 @@ class DifyBot(Bot):
         # data: {"event": "agent_message", "id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "answer": "I have created an image of a cute Japanese", "created_at": 1705639511, "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142"}
         # data: {"event": "message_end", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142", "metadata": {"usage": {"prompt_tokens": 305, "prompt_unit_price": "0.001", "prompt_price_unit": "0.001", "prompt_price": "0.0003050", "completion_tokens": 97, "completion_unit_price": "0.002", "completion_price_unit": "0.001", "completion_price": "0.0001940", "total_tokens": 184, "total_price": "0.0002290", "currency": "USD", "latency": 1.771092874929309}}}
         msgs, conversation_id = self._handle_sse_response(response)
+        return self._agent_reply(msgs, conversation_id, session, context)
+
+    def _agent_reply(self, msgs, conversation_id, session: DifySession, context: Context):
         channel = context.get("channel")
         # TODO: 适配除微信以外的其他channel，已添加wx849
         is_group = context.get("isgroup", False)
-        for msg in msgs[:-1]:
+        # message_file 先在下载线程池中并行下载，再与文字按原顺序逐条发送
+        prefetched = self._prefetch_media([{'type': 'image', 'content': msg['content']['url']}
+                                           if msg['type'] == 'message_file' else msg for msg in msgs[:-1]])
+        for msg, future in zip(msgs[:-1], prefetched):
             if msg['type'] == 'agent_message':
                 if is_group:
                     at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
@@ -287,10 +481,7 @@ class DifyBot(Bot):
                 reply = Reply(ReplyType.TEXT, msg['content'])
                 channel.send(reply, context)
             elif msg['type'] == 'message_file':
-                url = self._fill_file_base_url(msg['content']['url'])
-                reply = Reply(ReplyType.IMAGE_URL, url)
-                thread = threading.Thread(target=channel.send, args=(reply, context))
-                thread.start()
+                channel.send(future.result(), context)
         # 检查msgs是否为空
         if not msgs:
             return None, "No messages received from agent."
@@ -306,11 +497,85 @@ class DifyBot(Bot):
             session.set_conversation_id(conversation_id)
         return reply, None
 
+    def _handle_stream(self, query: str, session: DifySession, context: Context):
+        """
+        流式回复：边接收边把已完整的段落发送给用户，不必等待整个回答生成完毕
+        段落在句子/段落边界、agent_thought 和 message_file 处切分，最后一段作为返回值由通道装饰后发送
+        """
+        chat_client = self._get_client(context)
+        payload = self._get_payload(query, session, 'streaming')
+        files = self._get_upload_files(session, context)
+        start = time.monotonic()
+        response = chat_client.create_chat_message(
+            inputs=payload['inputs'],
+            query=payload['query'],
+            user=payload['user'],
+            response_mode=payload['response_mode'],
+            conversation_id=payload['conversation_id'],
+            files=files
+        )
+
+        if response.status_code != 200:
+            error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
+            logger.warning(error_info)
+            friendly_error_msg = self._handle_error_response(response.text, response.status_code)
+            return None, friendly_error_msg
+
+        assembler = self._new_stream_assembler(context)
+        progress = {"start": start, "sent": 0}
+        try:
+            for event in self._iter_sse_events(response):
+                items = assembler.feed(event)
+                if items:
+                    self._deliver_stream_items(items, context, progress)
+                if assembler.done:
+                    break
+        finally:
+            response.close()
+        return self._finish_stream(assembler, session, context, progress)
+
+    def _new_stream_assembler(self, context: Context):
+        return StreamAssembler(min_chars=self._get_dify_conf(context, "dify_stream_min_chars", 50),
+                               flush_interval=self._get_dify_conf(context, "dify_stream_flush_interval", 2))
+
+    def _deliver_stream_items(self, items, context: Context, progress):
+        """立即发送流式回复中已完整的内容项，群聊中加上@前缀"""
+        at_prefix = "@" + context["msg"].actual_user_nickname + "\n" if context.get("isgroup", False) else ""
+        for item, future in zip(items, self._prefetch_media(items)):
+            reply = future.result() if future else self._build_stream_reply(item, at_prefix)
+            if reply:
+                if not progress["sent"]:
+                    self._first_segment_histogram.observe(time.monotonic() - progress["start"])
+                progress["sent"] += 1
+                context.get("channel").send(reply, context)
+
+    def _finish_stream(self, assembler, session: DifySession, context: Context, progress):
+        if not assembler.conversation_id:
+            raise Exception("conversation_id not found")
+        # 设置dify conversation_id, 依靠dify管理上下文
+        if session.get_conversation_id() == '':
+            session.set_conversation_id(assembler.conversation_id)
+
+        items, final_item = assembler.finish()
+        if final_item is None:
+            self._deliver_stream_items(items, context, progress)
+            return None, None
+        # 最后一项的图片或文件与前面的内容同时下载
+        final_future = self._prefetch_media([final_item])[0]
+        self._deliver_stream_items(items, context, progress)
+        if not progress["sent"]:
+            self._first_segment_histogram.observe(time.monotonic() - progress["start"])
+        logger.debug(f"[DIFY] stream reply sent {progress['sent']} segments before final")
+        return final_future.result() if final_future else self._build_stream_reply(final_item), None
+
+    def _build_stream_reply(self, item, at_prefix=""):
+        if item['type'] == 'message_file':
+            return Reply(ReplyType.IMAGE_URL, self._fill_file_base_url(item['content']['url']))
+        return self._build_item_reply(item, at_prefix)
+
     def _handle_workflow(self, query: str, session: DifySession, context: Context):
         payload = self._get_workflow_payload(query, session)
-        api_key = self._get_dify_conf(context, "dify_api_key", '')
-        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        dify_client = DifyClient(api_key, api_base)
+        dify_client = self._get_client(context)
         response = dify_client._send_request("POST", "/workflows/run", json=payload)
         if response.status_code != 200:
             error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
@@ -337,49 +602,62 @@ class DifyBot(Bot):
         #      }
         #  }
 
-        rsp_data = response.json()
+        return self._workflow_reply(response.json())
+
+    def _workflow_reply(self, rsp_data):
         if 'data' not in rsp_data or 'outputs' not in rsp_data['data'] or 'text' not in rsp_data['data']['outputs']:
             error_info = f"[DIFY] Unexpected response format: {rsp_data}"
             logger.warning(error_info)
         reply = Reply(ReplyType.TEXT, rsp_data['data']['outputs']['text'])
         return reply, None
 
-    def _get_upload_files(self, session: DifySession, context: Context):
+    def _take_upload_image(self, session: DifySession, context: Context):
+        """取出会话缓存的图片并下载到本地，返回文件路径；未开启图片识别或没有图片时返回None"""
         session_id = session.get_session_id()
         img_cache = memory.USER_IMAGE_CACHE.get(session_id)
         if not img_cache or not self._get_dify_conf(context, "image_recognition", False):
             return None
         # 清理图片缓存
         memory.USER_IMAGE_CACHE[session_id] = None
-        api_key = self._get_dify_conf(context, "dify_api_key", '')
-        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        dify_client = DifyClient(api_key, api_base)
         msg = img_cache.get("msg")
         path = img_cache.get("path")
         msg.prepare()
+        return path
 
-        with open(path, 'rb') as file:
-            file_name = os.path.basename(path)
-            file_type, _ = mimetypes.guess_type(file_name)
+    def _get_upload_files(self, session: DifySession, context: Context):
+        path = self._take_upload_image(session, context)
+        if not path:
+            return None
+        dify_client = self._get_client(context)
+        file_name = os.path.basename(path)
+        file_type, _ = mimetypes.guess_type(file_name)
+        content = _read_file(path)
+
+        def upload():
             files = {
-                'file': (file_name, file, file_type)
+                'file': (file_name, content, file_type)
             }
             response = dify_client.file_upload(user=session.get_user(), files=files)
-
-        if response.status_code != 200 and response.status_code != 201:
-            error_info = f"[DIFY] response text={response.text} status_code={response.status_code} when upload file"
-            logger.warning(error_info)
-            return None, error_info
-        # {
-        #     'id': 'f508165a-10dc-4256-a7be-480301e630e6',
-        #     'name': '0.png',
-        #     'size': 17023,
-        #     'extension': 'png',
-        #     'mime_type': 'image/png',
-        #     'created_by': '0d501495-cfd4-4dd4-a78b-a15ed4ed77d1',
-        #     'created_at': 1722781568
-        # }
-        file_upload_data = response.json()
+            if response.status_code != 200 and response.status_code != 201:
+                error_info = f"[DIFY] response text={response.text} status_code={response.status_code} when upload file"
+                logger.warning(error_info)
+                return None
+            # {
+            #     'id': 'f508165a-10dc-4256-a7be-480301e630e6',
+            #     'name': '0.png',
+            #     'size': 17023,
+            #     'extension': 'png',
+            #     'mime_type': 'image/png',
+            #     'created_by': '0d501495-cfd4-4dd4-a78b-a15ed4ed77d1',
+            #     'created_at': 1722781568
+            # }
+            return response.json()
+
+        # 相同内容在缓存有效期内直接复用上传结果，同一图片的并发上传合并为一次
+        file_upload_data = self._upload_cache.get_or_upload(upload_key(dify_client, content), upload)
+        return self._upload_files_payload(file_upload_data) if file_upload_data else None
+
+    def _upload_files_payload(self, file_upload_data):
         logger.debug("[DIFY] upload file {}".format(file_upload_data))
         return [
             {
@@ -430,15 +708,18 @@ class DifyBot(Bot):
             return None
 
     # TODO: 异步返回events
-    def _handle_sse_response(self, response: requests.Response):
-        events = []
+    def _iter_sse_events(self, response: requests.Response):
         for line in response.iter_lines():
             if line:
                 decoded_line = line.decode('utf-8')
                 event = self._parse_sse_event(decoded_line)
                 if event:
-                    events.append(event)
+                    yield event
+
+    def _handle_sse_response(self, response: requests.Response):
+        return self._merge_sse_events(list(self._iter_sse_events(response)))
 
+    def _merge_sse_events(self, events):
         merged_message = []
         accumulated_agent_message = ''
         conversation_id = None
@@ -0,0 +1,112 @@
+import re
+import time
+
+from common.log import logger
+from common.utils import parse_markdown_text
+
+# 句末标点：中文标点直接结束一句，英文标点后面需要跟空白(避免切开网址和小数)
+_SENTENCE_END = re.compile(r"[。！？；…]+[”’」』）)]*|[.!?;]+(?=\s)")
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+
+
+class StreamSegmenter(object):
+    """
+    把流式返回的文本片段切分成可以单独发送的段落
+
+    feed 累积收到的文本，返回已经完整的段落：
+    - 在段落边界(空行)处，累积的文本不少于 min_chars 时切分
+    - 在句子边界处，累积的文本不少于 min_chars 且距上次切分超过 flush_interval 秒时切分
+    - 不在未闭合的代码块或 markdown 链接中间切分
+    flush 返回剩余的全部文本，在 agent_thought、message_file 和消息结束时调用。
+    """
+
+    def __init__(self, min_chars=50, flush_interval=2.0):
+        self.min_chars = min_chars
+        self.flush_interval = flush_interval
+        self._buffer = ""
+        self._last_flush = None  # 第一段不受 flush_interval 限制
+
+    def feed(self, text):
+        self._buffer += text or ""
+        segments = []
+        while True:
+            end = self._split_point()
+            if end is None:
+                break
+            segment, self._buffer = self._buffer[:end].strip(), self._buffer[end:]
+            if segment:
+                segments.append(segment)
+                self._last_flush = time.monotonic()
+        return segments
+
+    def flush(self):
+        segment, self._buffer = self._buffer.strip(), ""
+        if segment:
+            self._last_flush = time.monotonic()
+        return segment
+
+    def _split_point(self):
+        """返回最后一个可切分位置，没有时返回None"""
+        candidates = [m.end() for m in _PARAGRAPH_END.finditer(self._buffer)]
+        if self._last_flush is None or time.monotonic() - self._last_flush >= self.flush_interval:
+            candidates += [m.end() for m in _SENTENCE_END.finditer(self._buffer)]
+        for end in sorted(candidates, reverse=True):
+            segment = self._buffer[:end]
+            if len(segment.strip()) < self.min_chars:
+                break
+            if self._splittable(segment):
+                return end
+        return None
+
+    @staticmethod
+    def _splittable(segment):
+        if segment.count("```") % 2:
+            return False
+        return segment.rfind("](") <= segment.rfind(")")
+
+
+class StreamAssembler(object):
+    """
+    把Dify流式响应的事件依次转换为待发送的内容项
+
+    内容项与 parse_markdown_text 的返回格式相同，message_file 事件为 {'type': 'message_file', 'content': 事件}。
+    切分出的内容项先保留，收到后续事件时才交给调用方发送，这样流结束时最后一项可以作为返回值，由通道装饰后发送。
+    """
+
+    def __init__(self, min_chars=50, flush_interval=2.0):
+        self.segmenter = StreamSegmenter(min_chars=min_chars, flush_interval=flush_interval)
+        self.conversation_id = None
+        self.done = False  # 是否收到了message_end
+        self._held = []
+
+    def feed(self, event):
+        """处理一个事件，返回现在可以发送的内容项"""
+        event_name = event['event']
+        ready = []
+        if event_name in ('message', 'agent_message'):
+            ready, self._held = self._held, []
+            self.conversation_id = self.conversation_id or event.get('conversation_id')
+            for segment in self.segmenter.feed(event.get('answer', '')):
+                self._held.extend(parse_markdown_text(segment))
+        elif event_name in ('agent_thought', 'message_file'):
+            ready, self._held = self._held, parse_markdown_text(self.segmenter.flush())
+            if event_name == 'message_file':
+                self._held.append({'type': 'message_file', 'content': event})
+        elif event_name == 'error':
+            logger.error("[DIFY] error: {}".format(event))
+            raise Exception(event)
+        elif event_name == 'message_end':
+            self.conversation_id = self.conversation_id or event.get('conversation_id')
+            logger.debug("[DIFY] message_end usage: {}".format(event.get('metadata', {}).get('usage')))
+            self.done = True
+        else:
+            # chatflow的节点事件、ping等
+            logger.debug("[DIFY] stream event: {}".format(event_name))
+        return ready
+
+    def finish(self):
+        """流结束后调用，返回 (现在可以发送的内容项, 最后一项)，没有内容时最后一项为None"""
+        items, self._held = self._held + parse_markdown_text(self.segmenter.flush()), []
+        if not items:
+            return [], None
+        return items[:-1], items[-1]
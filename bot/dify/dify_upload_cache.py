@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+from common.expired_dict import ExpiredDict
+from common.metrics import metrics
+
+
+def upload_key(client, content: bytes):
+    """上传缓存的key：(api_base, api_key, 内容的sha256)"""
+    return client.base_url, client.api_key, hashlib.sha256(content).hexdigest()
+
+
+class UploadCache(object):
+    """
+    Dify上传文件的缓存
+
+    保存 /files/upload 的返回结果，在 ttl 秒内相同内容不再重复上传；
+    同一个key的并发上传合并为一次，其余调用方等待并共享结果，上传失败时都得到None。
+    get_or_upload 供同步代码调用，get_or_upload_async 供异步流水线调用，两者共享缓存和进行中的上传。
+    """
+
+    def __init__(self, ttl=3600):
+        self._lock = threading.Lock()
+        self._entries = ExpiredDict(ttl)  # key -> 上传结果
+        self._pending = {}  # key -> 进行中上传的 concurrent.futures.Future
+        self._hits = metrics.counter("dify_upload_cache_total", labels={"result": "hit"}, doc="dify上传缓存的查询次数")
+        self._misses = metrics.counter("dify_upload_cache_total", labels={"result": "miss"}, doc="dify上传缓存的查询次数")
+        self._coalesced = metrics.counter("dify_upload_cache_total", labels={"result": "coalesced"}, doc="dify上传缓存的查询次数")
+
+    def _claim(self, key):
+        """返回 (缓存的结果, 进行中上传的future, 是否由调用方上传)"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._hits.inc()
+                return data, None, False
+            future = self._pending.get(key)
+            if future is not None:
+                self._coalesced.inc()
+                return None, future, False
+            self._misses.inc()
+            future = self._pending[key] = Future()
+            return None, future, True
+
+    def _complete(self, key, future, data):
+        with self._lock:
+            self._pending.pop(key, None)
+            if data is not None:
+                self._entries[key] = data
+        future.set_result(data)
+
+    def get_or_upload(self, key, upload):
+        """返回key对应的上传结果，没有缓存时调用 upload() 上传，upload 失败时返回None"""
+        data, future, owner = self._claim(key)
+        if not future:
+            return data
+        if not owner:
+            return future.result()
+        data = None
+        try:
+            data = upload()
+        finally:
+            self._complete(key, future, data)
+        return data
+
+    async def get_or_upload_async(self, key, upload):
+        """与 get_or_upload 相同，upload 为返回协程的函数"""
+        data, future, owner = self._claim(key)
+        if not future:
+            return data
+        if not owner:
+            # shield: 某个等待方被取消时不影响进行中的上传
+            return await asyncio.shield(asyncio.wrap_future(future))
+        data = None
+        try:
+            data = await upload()
+        finally:
+            self._complete(key, future, data)
+        return data
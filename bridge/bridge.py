@@ -3,7 +3,9 @@ from bridge.context import Context
 from bridge.reply import Reply
 from common import const
 from common.log import logger
+from common.metrics import metrics
 from common.singleton import singleton
+from common.worker_pool import run_in_pool
 from config import conf
 from translate.factory import create_translator
 from voice.factory import create_voice
@@ -90,7 +92,8 @@ class Bridge(object):
         return self.btype[typename]
 
     def fetch_reply_content(self, query, context: Context) -> Reply:
-        return self.get_bot("chat").reply(query, context)
+        with self._reply_timer():
+            return self.get_bot("chat").reply(query, context)
 
     def fetch_voice_to_text(self, voiceFile) -> Reply:
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
@@ -101,6 +104,19 @@ class Bridge(object):
     def fetch_translate(self, text, from_lang="", to_lang="en") -> Reply:
         return self.get_bot("translate").translate(text, from_lang, to_lang)
 
+    async def async_fetch_reply_content(self, query, context: Context) -> Reply:
+        with self._reply_timer():
+            return await self.get_bot("chat").async_reply(query, context)
+
+    def _reply_timer(self):
+        return metrics.timer("bot_reply_seconds", {"bot": self.btype["chat"]}, doc="bot生成回复的耗时(按bot类型)")
+
+    async def async_fetch_voice_to_text(self, voiceFile) -> Reply:
+        return await run_in_pool("media", self.fetch_voice_to_text, voiceFile)
+
+    async def async_fetch_text_to_voice(self, text) -> Reply:
+        return await run_in_pool("media", self.fetch_text_to_voice, text)
+
     def find_chat_bot(self, bot_type: str):
         if self.chat_bots.get(bot_type) is None:
             self.chat_bots[bot_type] = create_bot(bot_type)
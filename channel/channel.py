@@ -42,3 +42,12 @@ class Channel(object):
 
     def build_text_to_voice(self, text) -> Reply:
         return Bridge().fetch_text_to_voice(text)
+
+    async def async_build_reply_content(self, query, context: Context = None) -> Reply:
+        return await Bridge().async_fetch_reply_content(query, context)
+
+    async def async_build_voice_to_text(self, voice_file) -> Reply:
+        return await Bridge().async_fetch_voice_to_text(voice_file)
+
+    async def async_build_text_to_voice(self, text) -> Reply:
+        return await Bridge().async_fetch_text_to_voice(text)
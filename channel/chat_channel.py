@@ -1,15 +1,23 @@
+import asyncio
+import json
 import os
+import random
 import re
 import threading
 import time
-from asyncio import CancelledError
-from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import CancelledError, Future
 
 from bridge.context import *
 from bridge.reply import *
 from channel.channel import Channel
+from common.count_index import MaxCountIndex
+from common.delay_scheduler import DelayScheduler
 from common.dequeue import Dequeue
+from common.fair_queue import WeightedFairQueue
 from common import memory
+from common.metrics import metrics
+from common.worker_pool import AdaptiveThreadPool, run_in_pool
+from config import get_appdata_dir, global_config
 from plugins import *
 
 try:
@@ -17,7 +25,41 @@ try:
 except Exception as e:
     pass
 
-handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
+# 按任务类型隔离的线程池，慢的媒体处理和发送重试不会占满处理对话的线程，线程数在上下限之间按负载自动调整
+handler_pool = AdaptiveThreadPool("llm", min_workers=4, max_workers=32)  # 处理消息、调用模型的线程池
+media_pool = AdaptiveThreadPool("media", min_workers=1, max_workers=4)  # 处理图片、视频、文件消息以及语音转码的线程池
+send_pool = AdaptiveThreadPool("send", min_workers=1, max_workers=4)  # 发送回复的线程池，同一接收者的回复按顺序发送
+worker_pools = (handler_pool, media_pool, send_pool)
+retry_scheduler = DelayScheduler("send_retry")  # 发送失败的回复在这里等待重试，不占用发送线程
+
+# 提交到 media_pool 处理的context类型
+MEDIA_CONTEXT_TYPES = (ContextType.IMAGE, ContextType.VIDEO, ContextType.FILE)
+
+# 队列满时的处理策略
+QUEUE_POLICIES = ("drop_oldest", "drop_newest", "merge", "busy_reply")
+BUSY_REPLY_INTERVAL = 60  # 同一session两次繁忙提示的最小间隔(秒)
+# 流量类别，按 traffic_class_weights 的权重分配处理机会
+TRAFFIC_CLASSES = ("admin", "vip", "private", "group")
+
+queue_depth_gauge = metrics.gauge("chat_queue_depth", doc="所有session中排队等待处理的context数")
+queue_expired_counter = metrics.counter("chat_queue_expired_total", doc="排队超过 queue_max_age 被丢弃的context数")
+coalesced_counter = metrics.counter("chat_coalesced_total", doc="被合并到同一会话后续消息中的文字context数")
+send_retry_counter = metrics.counter("send_retry_total", doc="发送失败后安排重试的次数")
+send_dead_letter_counter = metrics.counter("send_dead_letter_total", doc="重试用尽或超过接收者重试上限而放弃发送的回复数")
+send_retry_pending_gauge = metrics.gauge("send_retry_pending", doc="等待重试的回复数")
+
+
+def timed_stage(stage):
+    """记录消息处理阶段耗时的装饰器，开启metrics_port时生效"""
+    return metrics.timed("chat_stage_seconds", {"stage": stage}, doc="消息处理各阶段的耗时")
+
+
+def _is_admin_command(context: Context):
+    return context.type == ContextType.TEXT and context.content.startswith("#")
+
+
+def _count_shed(policy):
+    metrics.counter("chat_queue_shed_total", labels={"policy": policy}, doc="队列满时按策略丢弃或合并的context数").inc()
 
 
 # 抽象类, 它包含了与消息通道无关的通用处理逻辑
@@ -25,15 +67,29 @@ class ChatChannel(Channel):
     name = None  # 登录的用户名
     user_id = None  # 登录的用户id
     futures = {}  # 记录每个session_id提交到线程池的future对象, 用于重置会话时把没执行的future取消掉，正在执行的不会被取消
-    sessions = {}  # 用于控制并发，每个session_id同时只能有一个context在处理
+    sessions = {}  # 用于控制并发，session_id -> [context队列, 正在处理的数量, 并发上限]
     lock = threading.Lock()  # 用于控制对sessions的访问
+    ready = threading.Condition(lock)  # 有session可调度时通知consume线程
+    ready_sessions = WeightedFairQueue()  # 有待处理的context且未达到并发上限的session_id，按流量类别加权公平排队
+    ready_set = set()  # ready_sessions 中的session_id，避免重复入队
+    queued = 0  # 所有session中排队的context总数，需要持有lock访问
+    droppable = MaxCountIndex()  # session_id -> 排队中可丢弃(非管理命令)的context数，需要持有lock访问
+    busy_notified = {}  # session_id -> 上次发送繁忙提示的时间
+    retry_pending = {}  # 接收者 -> 等待重试的回复数，需要持有retry_lock访问
+    retry_lock = threading.Lock()
+    coalescing = {}  # session_id -> [等待合并的文字context列表, 静默期结束时间, 最晚合并时间]，需要持有lock访问
+    async_loop = None  # 设置后consume把context交给该事件循环中的异步流水线(_handle_async)处理，由支持的channel在开启async_pipeline时设置
 
     def __init__(self):
+        for pool in worker_pools:
+            pool.set_bounds(conf().get(f"{pool.name}_pool_min_workers"), conf().get(f"{pool.name}_pool_max_workers"))
+        self.ready_sessions.set_weights(conf().get("traffic_class_weights"))
         _thread = threading.Thread(target=self.consume)
         _thread.setDaemon(True)
         _thread.start()
 
     # 根据消息构造context，消息内容相关的触发项写在这里
+    @timed_stage("compose")
     def _compose_context(self, ctype: ContextType, content, **kwargs):
         context = Context(ctype, content)
         context.kwargs = kwargs
@@ -167,6 +223,7 @@ class ChatChannel(Channel):
                 context["desire_rtype"] = ReplyType.VOICE
         return context
 
+    @timed_stage("handle")
     def _handle(self, context: Context):
         if context is None or not context.content:
             return
@@ -183,6 +240,7 @@ class ChatChannel(Channel):
             # reply的发送步骤
             self._send_reply(context, reply)
 
+    @timed_stage("generate")
     def _generate_reply(self, context: Context, reply: Reply = Reply()) -> Reply:
         e_context = PluginManager().emit_event(
             EventContext(
@@ -197,25 +255,11 @@ class ChatChannel(Channel):
                 context["channel"] = e_context["channel"]
                 reply = super().build_reply_content(context.content, context)
             elif context.type == ContextType.VOICE:  # 语音消息
-                cmsg = context["msg"]
-                cmsg.prepare()
-                file_path = context.content
-                wav_path = os.path.splitext(file_path)[0] + ".wav"
-                try:
-                    any_to_wav(file_path, wav_path)
-                except Exception as e:  # 转换失败，直接使用mp3，对于某些api，mp3也可以识别
-                    logger.warning("[chat_channel]any to wav error, use raw path. " + str(e))
-                    wav_path = file_path
+                # 下载和转码在media_pool中执行，与图片、视频处理共用并发上限
+                file_path, wav_path = media_pool.submit(self._prepare_voice, context).result()
                 # 语音识别
                 reply = super().build_voice_to_text(wav_path)
-                # 删除临时文件
-                try:
-                    os.remove(file_path)
-                    if wav_path != file_path:
-                        os.remove(wav_path)
-                except Exception as e:
-                    pass
-                    # logger.warning("[chat_channel]delete temp file error: " + str(e))
+                self._remove_voice_files(file_path, wav_path)
 
                 if reply.type == ReplyType.TEXT:
                     new_context = self._compose_context(ContextType.TEXT, reply.content, **context.kwargs)
@@ -223,22 +267,53 @@ class ChatChannel(Channel):
                         reply = self._generate_reply(new_context)
                     else:
                         return
-            elif context.type == ContextType.IMAGE:  # 图片消息，当前仅做下载保存到本地的逻辑
-                memory.USER_IMAGE_CACHE[context["session_id"]] = {
-                    "path": context.content,
-                    "msg": context.get("msg")
-                }
-            elif context.type == ContextType.ACCEPT_FRIEND:  # 好友申请，匹配字符串
-                reply = self._build_friend_request_reply(context)
-            elif context.type == ContextType.SHARING:  # 分享信息，当前无默认逻辑
-                pass
-            elif context.type == ContextType.FUNCTION or context.type == ContextType.FILE:  # 文件消息及函数调用等，当前无默认逻辑
-                pass
             else:
-                logger.warning("[chat_channel] unknown context type: {}".format(context.type))
-                return
+                reply = self._build_other_reply(context, reply)
         return reply
 
+    def _build_other_reply(self, context: Context, reply: Reply):
+        """文字、语音以外的context的默认处理，同步和异步流水线共用"""
+        if context.type == ContextType.IMAGE:  # 图片消息，当前仅做下载保存到本地的逻辑
+            memory.USER_IMAGE_CACHE[context["session_id"]] = {
+                "path": context.content,
+                "msg": context.get("msg")
+            }
+        elif context.type == ContextType.ACCEPT_FRIEND:  # 好友申请，匹配字符串
+            reply = self._build_friend_request_reply(context)
+        elif context.type == ContextType.SHARING:  # 分享信息，当前无默认逻辑
+            pass
+        elif context.type == ContextType.FUNCTION or context.type == ContextType.FILE:  # 文件消息及函数调用等，当前无默认逻辑
+            pass
+        else:
+            logger.warning("[chat_channel] unknown context type: {}".format(context.type))
+            return None
+        return reply
+
+    def _prepare_voice(self, context: Context):
+        """下载语音并转换为wav，返回 (原文件路径, 用于识别的文件路径)"""
+        cmsg = context["msg"]
+        cmsg.prepare()
+        file_path = context.content
+        wav_path = os.path.splitext(file_path)[0] + ".wav"
+        try:
+            any_to_wav(file_path, wav_path)
+        except Exception as e:  # 转换失败，直接使用mp3，对于某些api，mp3也可以识别
+            logger.warning("[chat_channel]any to wav error, use raw path. " + str(e))
+            wav_path = file_path
+        return file_path, wav_path
+
+    @staticmethod
+    def _remove_voice_files(file_path, wav_path):
+        # 删除临时文件
+        try:
+            os.remove(file_path)
+            if wav_path != file_path:
+                os.remove(wav_path)
+        except Exception as e:
+            pass
+            # logger.warning("[chat_channel]delete temp file error: " + str(e))
+
+    @timed_stage("decorate")
     def _decorate_reply(self, context: Context, reply: Reply) -> Reply:
         if reply and reply.type:
             e_context = PluginManager().emit_event(
@@ -248,39 +323,48 @@ class ChatChannel(Channel):
                 )
             )
             reply = e_context["reply"]
-            desire_rtype = context.get("desire_rtype")
-            if not e_context.is_pass() and reply and reply.type:
-                if reply.type in self.NOT_SUPPORT_REPLYTYPE:
-                    logger.error("[chat_channel]reply type not support: " + str(reply.type))
-                    reply.type = ReplyType.ERROR
-                    reply.content = "不支持发送的消息类型: " + str(reply.type)
-
-                if reply.type == ReplyType.TEXT:
-                    reply_text = reply.content
-                    if desire_rtype == ReplyType.VOICE and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
-                        reply = super().build_text_to_voice(reply.content)
-                        return self._decorate_reply(context, reply)
-                    if context.get("isgroup", False):
-                        if not conf().get("no_need_at", False):
-                            reply_text = "@" + context["msg"].actual_user_nickname + "\n" + reply_text.strip()
-                        reply_text = conf().get("group_chat_reply_prefix", "") + reply_text + conf().get(
-                            "group_chat_reply_suffix", "")
-                    else:
-                        reply_text = conf().get("single_chat_reply_prefix", "") + reply_text + conf().get(
-                            "single_chat_reply_suffix", "")
-                    reply.content = reply_text
-                elif reply.type == ReplyType.ERROR or reply.type == ReplyType.INFO:
-                    reply.content = "[" + str(reply.type) + "]\n" + reply.content
-                elif reply.type == ReplyType.IMAGE_URL or reply.type == ReplyType.VOICE or reply.type == ReplyType.IMAGE or reply.type == ReplyType.FILE or reply.type == ReplyType.VIDEO or reply.type == ReplyType.VIDEO_URL:
-                    pass
-                elif reply.type == ReplyType.ACCEPT_FRIEND:
-                    pass
+            if self._need_text_to_voice(context, e_context, reply):
+                reply = super().build_text_to_voice(reply.content)
+                return self._decorate_reply(context, reply)
+            return self._format_reply(context, e_context, reply)
+
+    def _need_text_to_voice(self, context: Context, e_context: EventContext, reply: Reply):
+        """期望语音回复而得到文字回复时，需要先转为语音再装饰"""
+        return not e_context.is_pass() and reply and reply.type == ReplyType.TEXT \
+            and context.get("desire_rtype") == ReplyType.VOICE and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE
+
+    def _format_reply(self, context: Context, e_context: EventContext, reply: Reply) -> Reply:
+        """插件处理之后的默认装饰：加群聊@、前后缀等，同步和异步流水线共用"""
+        desire_rtype = context.get("desire_rtype")
+        if not e_context.is_pass() and reply and reply.type:
+            if reply.type in self.NOT_SUPPORT_REPLYTYPE:
+                logger.error("[chat_channel]reply type not support: " + str(reply.type))
+                reply.type = ReplyType.ERROR
+                reply.content = "不支持发送的消息类型: " + str(reply.type)
+
+            if reply.type == ReplyType.TEXT:
+                reply_text = reply.content
+                if context.get("isgroup", False):
+                    if not conf().get("no_need_at", False):
+                        reply_text = "@" + context["msg"].actual_user_nickname + "\n" + reply_text.strip()
+                    reply_text = conf().get("group_chat_reply_prefix", "") + reply_text + conf().get(
+                        "group_chat_reply_suffix", "")
                 else:
-                    logger.error("[chat_channel] unknown reply type: {}".format(reply.type))
-                    return
-            if desire_rtype and desire_rtype != reply.type and reply.type not in [ReplyType.ERROR, ReplyType.INFO]:
-                logger.warning("[chat_channel] desire_rtype: {}, but reply type: {}".format(context.get("desire_rtype"), reply.type))
-            return reply
+                    reply_text = conf().get("single_chat_reply_prefix", "") + reply_text + conf().get(
+                        "single_chat_reply_suffix", "")
+                reply.content = reply_text
+            elif reply.type == ReplyType.ERROR or reply.type == ReplyType.INFO:
+                reply.content = "[" + str(reply.type) + "]\n" + reply.content
+            elif reply.type == ReplyType.IMAGE_URL or reply.type == ReplyType.VOICE or reply.type == ReplyType.IMAGE or reply.type == ReplyType.FILE or reply.type == ReplyType.VIDEO or reply.type == ReplyType.VIDEO_URL:
+                pass
+            elif reply.type == ReplyType.ACCEPT_FRIEND:
+                pass
+            else:
+                logger.error("[chat_channel] unknown reply type: {}".format(reply.type))
+                return
+        if desire_rtype and desire_rtype != reply.type and reply.type not in [ReplyType.ERROR, ReplyType.INFO]:
+            logger.warning("[chat_channel] desire_rtype: {}, but reply type: {}".format(context.get("desire_rtype"), reply.type))
+        return reply
 
     def _send_reply(self, context: Context, reply: Reply):
         if reply and reply.type:
@@ -293,19 +377,170 @@ class ChatChannel(Channel):
             reply = e_context["reply"]
             if not e_context.is_pass() and reply and reply.type:
                 logger.debug("[chat_channel] ready to send reply: {}, context: {}".format(reply, context))
-                self._send(reply, context)
+                # 在发送线程池中按接收者串行发送，发送和失败重试不占用处理消息的线程
+                future = send_pool.submit_keyed(context.get("receiver"), self._send, reply, context)
+                future.add_done_callback(self._send_callback)
+
+    @staticmethod
+    def _send_callback(future: Future):
+        if not future.cancelled() and future.exception():
+            logger.error("[chat_channel] send reply error: {}".format(future.exception()))
 
     def _send(self, reply: Reply, context: Context, retry_cnt=0):
         try:
-            self.send(reply, context)
+            with metrics.timer("chat_stage_seconds", {"stage": "send"}):
+                result = self.send(reply, context)
         except Exception as e:
             logger.error("[chat_channel] sendMsg error: {}".format(str(e)))
             if isinstance(e, NotImplementedError):
                 return
             logger.exception(e)
-            if retry_cnt < 2:
-                time.sleep(3 + 3 * retry_cnt)
-                self._send(reply, context, retry_cnt + 1)
+            self._schedule_retry(reply, context, retry_cnt, e)
+            return
+        if isinstance(result, Future):
+            # 异步发送的通道(如wx849)返回future，发送完成后根据结果决定是否重试，当前线程不等待
+            result.add_done_callback(lambda future: self._on_send_done(future, reply, context, retry_cnt))
+
+    def _on_send_done(self, future, reply: Reply, context: Context, retry_cnt):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error("[chat_channel] sendMsg error: {}".format(str(error)))
+            self._schedule_retry(reply, context, retry_cnt, error)
+
+    def _schedule_retry(self, reply: Reply, context: Context, retry_cnt, error):
+        """
+        发送失败后交给重试调度器，按指数退避加随机抖动等待后重新提交到发送线程池，当前线程立即返回；
+        超过重试次数或该接收者等待重试的回复过多时写入死信日志
+        """
+        receiver = context.get("receiver")
+        if retry_cnt >= conf().get("send_retry_max", 2):
+            self._dead_letter(reply, context, retry_cnt, error, "retry exhausted")
+            return
+        with self.retry_lock:
+            pending = self.retry_pending.get(receiver, 0)
+            if pending >= conf().get("send_retry_per_recipient", 5):
+                overflow = True
+            else:
+                overflow = False
+                self.retry_pending[receiver] = pending + 1
+        if overflow:
+            self._dead_letter(reply, context, retry_cnt, error, "too many pending retries")
+            return
+        delay = conf().get("send_retry_base_delay", 3) * (2 ** retry_cnt) * random.uniform(0.75, 1.25)
+        logger.info("[chat_channel] retry send in {:.1f}s, receiver={}, retry_cnt={}".format(delay, receiver, retry_cnt + 1))
+        send_retry_counter.inc()
+        send_retry_pending_gauge.inc()
+        retry_scheduler.call_later(delay, self._resend, reply, context, retry_cnt + 1)
+
+    def _resend(self, reply: Reply, context: Context, retry_cnt):
+        receiver = context.get("receiver")
+        with self.retry_lock:
+            pending = self.retry_pending.get(receiver, 1) - 1
+            if pending > 0:
+                self.retry_pending[receiver] = pending
+            else:
+                self.retry_pending.pop(receiver, None)
+        send_retry_pending_gauge.dec()
+        send_pool.submit_keyed(receiver, self._send, reply, context, retry_cnt).add_done_callback(self._send_callback)
+
+    @staticmethod
+    def _dead_letter(reply: Reply, context: Context, retry_cnt, error, reason):
+        """放弃发送的回复记录到 send_dead_letter.log，每行一个json"""
+        send_dead_letter_counter.inc()
+        logger.warning("[chat_channel] give up sending reply, reason={}, receiver={}, retry_cnt={}".format(reason, context.get("receiver"), retry_cnt))
+        record = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "reason": reason,
+            "receiver": context.get("receiver"),
+            "session_id": context.get("session_id"),
+            "reply_type": str(reply.type),
+            "content": str(reply.content)[:1000],
+            "retry_cnt": retry_cnt,
+            "error": str(error),
+        }
+        try:
+            with open(os.path.join(get_appdata_dir(), "send_dead_letter.log"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.error("[chat_channel] write dead letter error: {}".format(e))
+
+    # 异步流水线：与 _handle/_generate_reply/_decorate_reply/_send_reply 逻辑相同的协程版本，在 async_loop 中执行。
+    # 插件和bot的同步实现通过线程池适配，等待模型回复时不占用线程(bot实现了async_reply时)
+    @timed_stage("handle")
+    async def _handle_async(self, context: Context):
+        if context is None or not context.content:
+            return
+        logger.debug("[chat_channel] ready to handle context: {}".format(context))
+        reply = await self._generate_reply_async(context)
+
+        logger.debug("[chat_channel] ready to decorate reply: {}".format(reply))
+        if reply and reply.content:
+            reply = await self._decorate_reply_async(context, reply)
+            await self._send_reply_async(context, reply)
+
+    @timed_stage("generate")
+    async def _generate_reply_async(self, context: Context, reply: Reply = None) -> Reply:
+        e_context = await PluginManager().emit_event_async(
+            EventContext(
+                Event.ON_HANDLE_CONTEXT,
+                {"channel": self, "context": context, "reply": reply or Reply()},
+            )
+        )
+        reply = e_context["reply"]
+        if not e_context.is_pass():
+            logger.debug("[chat_channel] ready to handle context: type={}, content={}".format(context.type, context.content))
+            if context.type == ContextType.TEXT or context.type == ContextType.IMAGE_CREATE:  # 文字和图片消息
+                context["channel"] = e_context["channel"]
+                reply = await self.async_build_reply_content(context.content, context)
+            elif context.type == ContextType.VOICE:  # 语音消息
+                file_path, wav_path = await run_in_pool("media", self._prepare_voice, context)
+                reply = await self.async_build_voice_to_text(wav_path)
+                self._remove_voice_files(file_path, wav_path)
+
+                if reply.type == ReplyType.TEXT:
+                    new_context = self._compose_context(ContextType.TEXT, reply.content, **context.kwargs)
+                    if new_context:
+                        reply = await self._generate_reply_async(new_context)
+                    else:
+                        return
+            else:
+                reply = self._build_other_reply(context, reply)
+        return reply
+
+    @timed_stage("decorate")
+    async def _decorate_reply_async(self, context: Context, reply: Reply) -> Reply:
+        if reply and reply.type:
+            e_context = await PluginManager().emit_event_async(
+                EventContext(
+                    Event.ON_DECORATE_REPLY,
+                    {"channel": self, "context": context, "reply": reply},
+                )
+            )
+            reply = e_context["reply"]
+            if self._need_text_to_voice(context, e_context, reply):
+                reply = await self.async_build_text_to_voice(reply.content)
+                return await self._decorate_reply_async(context, reply)
+            return self._format_reply(context, e_context, reply)
+
+    async def _send_reply_async(self, context: Context, reply: Reply):
+        if reply and reply.type:
+            e_context = await PluginManager().emit_event_async(
+                EventContext(
+                    Event.ON_SEND_REPLY,
+                    {"channel": self, "context": context, "reply": reply},
+                )
+            )
+            reply = e_context["reply"]
+            if not e_context.is_pass() and reply and reply.type:
+                logger.debug("[chat_channel] ready to send reply: {}, context: {}".format(reply, context))
+                await self._send_async(reply, context)
+
+    async def _send_async(self, reply: Reply, context: Context):
+        """默认交给发送线程池按接收者顺序发送；send本身不阻塞的channel可以重写为直接发送"""
+        future = send_pool.submit_keyed(context.get("receiver"), self._send, reply, context)
+        future.add_done_callback(self._send_callback)
 
     # 处理好友申请
     def _build_friend_request_reply(self, context):
@@ -338,70 +573,285 @@ class ChatChannel(Channel):
             except Exception as e:
                 logger.exception("Worker raise exception: {}".format(e))
             with self.lock:
-                self.sessions[session_id][1].release()
+                session = self.sessions[session_id]
+                session[1] -= 1
+                futures = self.futures.get(session_id)
+                if futures and worker in futures:
+                    futures.remove(worker)
+                if session[1] == 0 and session[0].empty():
+                    # 所有任务都处理完毕，删除session
+                    del self.sessions[session_id]
+                    self.futures.pop(session_id, None)
+                else:
+                    self._mark_ready(session_id)
 
         return func
 
+    def _mark_ready(self, session_id):
+        """
+        session有待处理的context且未达到并发上限时加入就绪队列，需要持有self.lock
+        流量类别按队首的context确定，群聊中管理员或vip用户的消息排到队首时按其类别调度
+        """
+        if session_id in self.ready_set:
+            return
+        context_queue, running, limit = self.sessions[session_id]
+        if running < limit and not context_queue.empty():
+            self.ready_sessions.append(session_id, self._traffic_class(context_queue.queue[0]))
+            self.ready_set.add(session_id)
+            self.ready.notify()
+
+    @timed_stage("produce")
     def produce(self, context: Context):
         session_id = context.get("session_id", 0)
         with self.lock:
-            if session_id not in self.sessions:
-                self.sessions[session_id] = [
-                    Dequeue(),
-                    threading.BoundedSemaphore(conf().get("concurrency_in_session", 4)),
-                ]
-            if context.type == ContextType.TEXT and context.content.startswith("#"):
-                self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
-            else:
-                self.sessions[session_id][0].put(context)
+            window = conf().get("coalesce_window", 0)
+            pending = self.coalescing.get(session_id)
+            if window and self._coalescable(context):
+                now = time.monotonic()
+                if pending and self._sender(pending[0][-1]) == self._sender(context):
+                    # 静默期内的连续文字消息先缓存，静默期结束后合并为一条再入队
+                    pending[0].append(context)
+                    pending[1] = min(now + window, pending[2])
+                    return
+                if pending:
+                    self._flush_coalesced(session_id)
+                self.coalescing[session_id] = [[context], now + window, now + conf().get("coalesce_max_wait", 5)]
+                self.ready.notify()
+                return
+            if pending and not (context.type == ContextType.TEXT and context.content.startswith("#")):
+                # 其他类型的消息到达时先把缓存的文字入队，保持会话内的顺序
+                self._flush_coalesced(session_id)
+            self._enqueue(session_id, context)
+
+    @staticmethod
+    def _coalescable(context: Context):
+        return context.type == ContextType.TEXT and isinstance(context.content, str) and not context.content.startswith("#")
+
+    @staticmethod
+    def _sender(context: Context):
+        """共享会话的群中只合并同一个人的消息"""
+        return getattr(context.get("msg"), "actual_user_id", None)
+
+    def _flush_coalesced(self, session_id):
+        """把session缓存的文字context合并为一条入队，需要持有self.lock"""
+        contexts = self.coalescing.pop(session_id)[0]
+        context = contexts[-1]
+        if len(contexts) > 1:
+            context.content = "\n".join(c.content for c in contexts)
+            coalesced_counter.inc(len(contexts) - 1)
+            logger.debug("[chat_channel] coalesce {} contexts in session {}".format(len(contexts), session_id))
+        self._enqueue(session_id, context)
+
+    def _flush_due_coalesced(self):
+        """合并静默期已结束的session，返回距离下一个静默期结束的秒数，需要持有self.lock"""
+        if not self.coalescing:
+            return None
+        now = time.monotonic()
+        for session_id, (_, deadline, _) in list(self.coalescing.items()):
+            if deadline <= now:
+                self._flush_coalesced(session_id)
+        if not self.coalescing:
+            return None
+        return max(0, min(pending[1] for pending in self.coalescing.values()) - now)
+
+    def _enqueue(self, session_id, context: Context):
+        """context放入session队列，需要持有self.lock"""
+        context["queued_at"] = time.monotonic()
+        if session_id not in self.sessions:
+            self.sessions[session_id] = [Dequeue(), 0, conf().get("concurrency_in_session", 4)]
+        if _is_admin_command(context):
+            self.sessions[session_id][0].putleft(context)  # 优先处理管理命令，不受队列长度限制
+        else:
+            policy = self._admit(session_id, context)
+            if policy is not None:
+                _count_shed(policy)
+                if not self.sessions[session_id][1] and self.sessions[session_id][0].empty():
+                    del self.sessions[session_id]
+                if policy == "busy_reply" and self._should_notify_busy(session_id):
+                    reply = Reply(ReplyType.TEXT, conf().get("queue_busy_reply"))
+                    future = send_pool.submit_keyed(context.get("receiver"), self._send, reply, context)
+                    future.add_done_callback(self._send_callback)
+                return
+            self.sessions[session_id][0].put(context)
+            self.droppable.add(session_id)
+        self._update_queued(1)
+        self._mark_ready(session_id)
+
+    @staticmethod
+    def _traffic_class(context: Context):
+        """按发送者划分流量类别：管理员、user_datas中标记vip的用户、私聊、群聊"""
+        msg = context.get("msg")
+        if context.get("isgroup", False):
+            user_id = getattr(msg, "actual_user_id", None)
+        else:
+            user_id = getattr(msg, "from_user_id", None) or context.get("receiver")
+        if user_id and user_id in global_config["admin_users"]:
+            return "admin"
+        if user_id and conf().user_datas.get(user_id, {}).get("vip"):
+            return "vip"
+        return "group" if context.get("isgroup", False) else "private"
+
+    @staticmethod
+    def _wait_histogram(traffic_class):
+        return metrics.histogram("chat_schedule_wait_seconds", labels={"class": traffic_class}, doc="context从入队到开始处理的等待时间")
+
+    def wait_percentiles(self):
+        """各流量类别的排队等待时间分位数(秒)，{类别: {"p50": .., "p95": .., "p99": ..}}"""
+        result = {}
+        for traffic_class in TRAFFIC_CLASSES:
+            histogram = self._wait_histogram(traffic_class)
+            if histogram.count:
+                result[traffic_class] = {f"p{int(q * 100)}": histogram.percentile(q) for q in (0.5, 0.95, 0.99)}
+        return result
+
+    def _admit(self, session_id, context: Context):
+        """
+        检查session队列和全局队列的长度限制，需要持有self.lock
+        可以入队时返回None，否则按 queue_overflow_policy 处理并返回实际使用的策略：
+        drop_oldest 丢弃最早排队的context后入队，drop_newest 丢弃新context，
+        merge 把文字合并到session中最后一条排队的文字消息，busy_reply 丢弃新context并回复繁忙提示
+        """
+        session_limit = conf().get("session_queue_max_size", 0)
+        global_limit = conf().get("global_queue_max_size", 0)
+        queue = self.sessions[session_id][0]
+        # 管理命令不计入session队列长度
+        session_full = session_limit and self.droppable.count(session_id) >= session_limit
+        if not session_full and not (global_limit and self.queued >= global_limit):
+            return None
+        policy = conf().get("queue_overflow_policy", "drop_oldest")
+        if policy not in QUEUE_POLICIES:
+            policy = "drop_oldest"
+        if policy == "merge":
+            last = queue.queue[-1] if queue.qsize() else None
+            if context.type == ContextType.TEXT and last is not None and last.type == ContextType.TEXT \
+                    and not _is_admin_command(last):
+                last.content = last.content + "\n" + context.content
+                return policy
+            policy = "drop_newest"
+        if policy == "drop_oldest":
+            # session队列满时丢弃本session最早的消息，只有全局队列满时从排队最多的session中丢弃，避免排队少的session被饿死
+            victim = session_id if session_full else self.droppable.max_key()
+            dropped = self._drop_oldest(self.sessions[victim][0]) if victim is not None else None
+            if dropped is not None:
+                self.droppable.add(victim, -1)
+                logger.warning("[chat_channel] queue full, drop oldest context: {}".format(dropped))
+                self._update_queued(-1)
+                _count_shed(policy)
+                return None
+            policy = "drop_newest"
+        logger.warning("[chat_channel] queue full, drop context, policy={}, session_id={}".format(policy, session_id))
+        return policy
+
+    @staticmethod
+    def _drop_oldest(queue):
+        """
+        从队列中移除最早的一条非管理命令context并返回，管理命令不会被丢弃，没有可丢弃的时返回None
+        管理命令总是插到队首，只需跳过队首的管理命令
+        """
+        with queue.mutex:
+            for index, context in enumerate(queue.queue):
+                if not _is_admin_command(context):
+                    del queue.queue[index]
+                    return context
+        return None
+
+    def _should_notify_busy(self, session_id):
+        """同一session在 BUSY_REPLY_INTERVAL 内只提示一次，需要持有self.lock"""
+        now = time.monotonic()
+        if now - self.busy_notified.get(session_id, -BUSY_REPLY_INTERVAL) < BUSY_REPLY_INTERVAL:
+            return False
+        if len(self.busy_notified) > 1000:
+            self.busy_notified = {k: t for k, t in self.busy_notified.items() if now - t < BUSY_REPLY_INTERVAL}
+        self.busy_notified[session_id] = now
+        return True
+
+    def _update_queued(self, delta):
+        """需要持有self.lock"""
+        self.queued += delta
+        queue_depth_gauge.set(self.queued)
+
+    def _pop_fresh(self, session_id, session):
+        """取出session中最早的未过期context，排队超过 queue_max_age 的直接丢弃，需要持有self.lock"""
+        max_age = conf().get("queue_max_age", 0)
+        now = time.monotonic()
+        while not session[0].empty():
+            context = session[0].get()
+            self._update_queued(-1)
+            if not _is_admin_command(context):
+                self.droppable.add(session_id, -1)
+            if not max_age or now - context.get("queued_at", now) <= max_age:
+                return context
+            logger.warning("[chat_channel] drop expired context, waited {:.1f}s: {}".format(now - context["queued_at"], context))
+            queue_expired_counter.inc()
+        return None
 
     # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    # 只处理就绪队列中的session，由produce和任务完成时唤醒，不再轮询所有session
     def consume(self):
         while True:
             with self.lock:
-                session_ids = list(self.sessions.keys())
-            for session_id in session_ids:
-                with self.lock:
-                    context_queue, semaphore = self.sessions[session_id]
-                if semaphore.acquire(blocking=False):  # 等线程处理完毕才能删除
-                    if not context_queue.empty():
-                        context = context_queue.get()
-                        logger.debug("[chat_channel] consume context: {}".format(context))
-                        future: Future = handler_pool.submit(self._handle, context)
-                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                        with self.lock:
-                            if session_id not in self.futures:
-                                self.futures[session_id] = []
-                            self.futures[session_id].append(future)
-                    elif semaphore._initial_value == semaphore._value + 1:  # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕
-                        with self.lock:
-                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
-                            assert len(self.futures[session_id]) == 0, "thread pool error"
-                            del self.sessions[session_id]
-                    else:
-                        semaphore.release()
-            time.sleep(0.2)
-
-    # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
+                while True:
+                    timeout = self._flush_due_coalesced()
+                    if self.ready_sessions:
+                        break
+                    self.ready.wait(timeout)
+                session_id, traffic_class = self.ready_sessions.popleft()
+                self.ready_set.discard(session_id)
+                session = self.sessions.get(session_id)
+                if session is None or session[1] >= session[2]:
+                    continue
+                context = self._pop_fresh(session_id, session)
+                if context is None:
+                    if session[1] == 0:
+                        del self.sessions[session_id]
+                        self.futures.pop(session_id, None)
+                    continue
+                session[1] += 1
+                self._wait_histogram(traffic_class).observe(time.monotonic() - context["queued_at"])
+                logger.debug("[chat_channel] consume context: {}".format(context))
+                if self.async_loop is not None:
+                    # 异步流水线：返回的future取消时会一并取消事件循环中的任务
+                    future: Future = asyncio.run_coroutine_threadsafe(self._handle_async(context), self.async_loop)
+                else:
+                    pool = media_pool if context.type in MEDIA_CONTEXT_TYPES else handler_pool
+                    future: Future = pool.submit(self._handle, context)
+                self.futures.setdefault(session_id, []).append(future)
+                # 还有待处理的context且有空闲并发时重新排到队尾，各session轮流处理
+                self._mark_ready(session_id)
+            future.add_done_callback(self._thread_pool_callback(session_id, context=context))
+
+    # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务；异步流水线中执行中的任务也会被取消
     def cancel_session(self, session_id):
         with self.lock:
-            if session_id in self.sessions:
-                for future in self.futures[session_id]:
-                    future.cancel()
-                cnt = self.sessions[session_id][0].qsize()
-                if cnt > 0:
-                    logger.info("Cancel {} messages in session {}".format(cnt, session_id))
-                self.sessions[session_id][0] = Dequeue()
+            futures = self._clear_session(session_id)
+        # 取消会同步触发完成回调，回调中需要获取锁，所以在锁外取消
+        for future in futures:
+            future.cancel()
 
     def cancel_all_session(self):
         with self.lock:
-            for session_id in self.sessions:
-                for future in self.futures[session_id]:
-                    future.cancel()
-                cnt = self.sessions[session_id][0].qsize()
-                if cnt > 0:
-                    logger.info("Cancel {} messages in session {}".format(cnt, session_id))
-                self.sessions[session_id][0] = Dequeue()
+            futures = []
+            for session_id in set(self.sessions) | set(self.coalescing):
+                futures.extend(self._clear_session(session_id))
+        for future in futures:
+            future.cancel()
+
+    def _clear_session(self, session_id):
+        """清空session中排队和等待合并的context，返回待取消的future，需要持有self.lock"""
+        # 还在合并静默期的文字context尚未进入session队列，session可能还不存在
+        self.coalescing.pop(session_id, None)
+        if session_id not in self.sessions:
+            return []
+        session = self.sessions[session_id]
+        cnt = session[0].qsize()
+        if cnt > 0:
+            logger.info("Cancel {} messages in session {}".format(cnt, session_id))
+            self._update_queued(-cnt)
+        session[0] = Dequeue()
+        self.droppable.remove(session_id)
+        if session[1] == 0:
+            del self.sessions[session_id]
+        return list(self.futures.get(session_id, []))
 
 
 def check_prefix(content, prefix_list):
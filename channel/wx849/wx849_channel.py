@@ -1,4 +1,5 @@
 import asyncio
+import base64
 import os
 import json
 import time
@@ -7,20 +8,30 @@ import io
 import sys
 import traceback  # 添加traceback模块导入
 import xml.etree.ElementTree as ET  # 在顶部添加ET导入
+from collections import OrderedDict
 from typing import Dict, Any
 
-import requests
 from bridge.context import Context, ContextType  # 确保导入Context类
 from bridge.reply import Reply, ReplyType
-from channel.chat_channel import ChatChannel
+from channel.chat_channel import ChatChannel, timed_stage
 from channel.chat_message import ChatMessage
+from channel.wx849.wx849_dispatcher import MessageDispatcher
+from channel.wx849.wx849_media import MediaCache, content_key
 from channel.wx849.wx849_message import WX849Message  # 改为从wx849_message导入WX849Message
+from channel.wx849.wx849_parser import is_group_message
+from channel.wx849.wx849_poller import AdaptivePoller
+from channel.wx849.wx849_prefilter import GroupPrefilter
+from channel.wx849.wx849_rooms import get_chatroom_directory
 from common.expired_dict import ExpiredDict
 from common.log import logger
+from common.metrics import metrics
+from common.singleflight import AsyncSingleFlight
 from common.singleton import singleton
+from common.tmp_dir import TmpDir
 from common.time_check import time_checker
-from common.utils import remove_markdown_symbol
-from config import conf, get_appdata_dir, save_config
+from common.worker_pool import run_in_pool
+from common.utils import compress_imgfile, remove_markdown_symbol
+from config import conf, save_config
 
 # 增大日志行长度限制，以便完整显示XML内容
 try:
@@ -162,6 +173,23 @@ def _check(func):
         return func(self, cmsg)
     return wrapper
 
+
+def _shrink_image(image_data, max_bytes):
+    """按面积比例缩小图片并重新压缩为JPEG，使其不超过 max_bytes；动图保持原样"""
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_data))
+    if getattr(img, "is_animated", False):
+        return image_data
+    # 文件大小大致与像素数成正比，先缩放到目标比例附近，再由 compress_imgfile 调整质量
+    ratio = (max_bytes / len(image_data)) ** 0.5
+    if ratio < 1:
+        img = img.resize((max(1, int(img.width * ratio)), max(1, int(img.height * ratio))), Image.LANCZOS)
+    buffer = io.BytesIO()
+    img.convert("RGB").save(buffer, "JPEG", quality=90)
+    return compress_imgfile(buffer, max_bytes).getvalue()
+
+
 @singleton
 class WX849Channel(ChatChannel):
     """
@@ -172,13 +200,70 @@ class WX849Channel(ChatChannel):
     def __init__(self):
         super().__init__()
         self.received_msgs = ExpiredDict(conf().get("expires_in_seconds", 3600))
+        self._setup_transport()
         self.bot = None
         self.user_id = None
         self.name = None
         self.wxid = None
         self.is_running = False
         self.is_logged_in = False
+        # 常驻事件循环，负责消息监听和发送
+        self.loop = asyncio.new_event_loop()
+        WechatAPI.transport.bind_loop(self.loop)
+        if conf().get("async_pipeline", False):
+            # 消息处理流水线也在常驻事件循环中执行，等待模型回复不占用线程
+            self.async_loop = self.loop
+        self._send_tails = {}  # 接收者 -> 最后一条待发送消息的完成标记，仅在事件循环中访问
+        # 按会话并行分发拉取到的消息
+        self.dispatcher = MessageDispatcher(self._handle_raw_message, lambda: self.wxid)
+        # 群信息查询合并：同一个群同时只有一个请求，并限制全局并发数
+        self._group_flight = AsyncSingleFlight("wx849_group_info", max_concurrency=conf().get("wx849_group_fetch_concurrency", 4))
+        # 网络图片的下载合并，以及编码后base64的短期缓存(同一张图发给多个接收者时只下载和编码一次)
+        self._image_flight = AsyncSingleFlight("wx849_image_url")
+        self._image_payloads = OrderedDict()  # url -> (过期时间, base64)，仅在事件循环中访问
         self.group_name_cache = {}
+        self.rooms = get_chatroom_directory()
+        # 群消息预过滤，在解析之前丢弃不可能触发机器人的消息
+        self.prefilter = GroupPrefilter(self.rooms, lambda: self.wxid, lambda: self.name)
+        # 图片/语音/视频/表情的磁盘缓存，按内容md5去重
+        self.media_cache = MediaCache()
+
+    @staticmethod
+    def _setup_transport():
+        """配置 WechatAPI 共享的 HTTP 连接池，并按接口统计请求耗时"""
+        WechatAPI.transport.configure(
+            limit=conf().get("wx849_http_pool_size", 100),
+            limit_per_host=conf().get("wx849_http_pool_size", 100),
+            keepalive_timeout=conf().get("wx849_http_keepalive", 60),
+            read_timeout=conf().get("wx849_http_timeout", 60),
+            media_read_timeout=conf().get("wx849_http_media_timeout", 300),
+        )
+
+        def record_latency(method, path, elapsed, status):
+            if not path.startswith(("/VXAPI/", "/api/")):
+                # 下载网络图片等外部请求，不按路径区分
+                path = "external"
+            metrics.histogram("wx849_api_latency_seconds", labels={"endpoint": path}, doc="WechatAPI 接口请求耗时").observe(elapsed)
+            if status is None or status >= 400:
+                metrics.counter("wx849_api_errors_total", labels={"endpoint": path}, doc="WechatAPI 接口请求失败次数").inc()
+
+        WechatAPI.transport.set_latency_hook(record_latency)
+
+        # 发送限速：全局和每个接收者的令牌桶，替代固定的1秒发送间隔
+        WechatAPI.governor.configure(
+            global_rate=conf().get("wx849_send_global_rate", 2),
+            global_burst=conf().get("wx849_send_global_burst", 5),
+            recipient_rate=conf().get("wx849_send_recipient_rate", 1),
+            recipient_burst=conf().get("wx849_send_recipient_burst", 3),
+        )
+        send_wait = metrics.histogram("wx849_send_wait_seconds", doc="消息在发送限速器中的排队时间")
+        send_depth = metrics.gauge("wx849_send_queue_depth", doc="发送限速器中排队的消息数")
+
+        def record_send(recipient, wait, depth):
+            send_wait.observe(wait)
+            send_depth.set(depth)
+
+        WechatAPI.governor.set_observer(record_send)
 
     async def _initialize_bot(self):
         """初始化 bot"""
@@ -261,8 +346,7 @@ class WX849Channel(ChatChannel):
                     break
                 
                 # 如果bot对象的方法失败，尝试直接发送HTTP请求检查服务是否可用
-                import aiohttp
-                async with aiohttp.ClientSession() as session:
+                async with WechatAPI.transport.shared_session() as session:
                     try:
                         # 尝试访问登录接口
                         url = f"http://{api_host}:{api_port}{api_path_prefix}/Login/GetQR"
@@ -335,7 +419,7 @@ class WX849Channel(ChatChannel):
                             # 尝试唤醒登录
                             try:
                                 # 参照示例代码中的唤醒登录方式，使用异步HTTP请求直接调用API
-                                async with aiohttp.ClientSession() as session:
+                                async with WechatAPI.transport.shared_session() as session:
                                     # 获取API配置
                                     api_host = conf().get("wx849_api_host", "127.0.0.1")
                                     api_port = conf().get("wx849_api_port", 9000)
@@ -367,15 +451,14 @@ class WX849Channel(ChatChannel):
                                     
                                     try:
                                         # 发送请求
-                                        response = await session.post(api_url, json=json_param)
-                                        
-                                        # 检查响应状态码
-                                        if response.status != 200:
-                                            logger.error(f"[WX849] 唤醒登录请求失败，状态码: {response.status}")
-                                            raise Exception(f"服务器返回状态码 {response.status}")
+                                        async with session.post(api_url, json=json_param) as response:
+                                            # 检查响应状态码
+                                            if response.status != 200:
+                                                logger.error(f"[WX849] 唤醒登录请求失败，状态码: {response.status}")
+                                                raise Exception(f"服务器返回状态码 {response.status}")
                                         
-                                        # 解析响应内容
-                                        json_resp = await response.json()
+                                            # 解析响应内容
+                                            json_resp = await response.json()
                                         logger.debug(f"[WX849] 唤醒登录响应: {json_resp}")
                                         
                                         # 检查是否成功
@@ -520,7 +603,8 @@ class WX849Channel(ChatChannel):
     async def _message_listener(self):
         """消息监听器"""
         logger.info("[WX849] 开始监听消息...")
-        error_count = 0
+        poller = AdaptivePoller()
+        logger.info(f"[WX849] 消息拉取模式: {poller.mode}")
         
         while self.is_running:
             try:
@@ -528,11 +612,12 @@ class WX849Channel(ChatChannel):
                 try:
                     # 注释掉频繁打印的调试日志
                     # logger.debug("[WX849] 正在获取新消息...")
+                    start_time = time.monotonic()
                     messages = await self.bot.get_new_message()
-                    # 重置错误计数
-                    error_count = 0
+                    # 根据本次拉取结果计算下一次拉取的等待时间
+                    delay = poller.on_success(len(messages) if messages else 0, time.monotonic() - start_time,
+                                              has_more=bool(getattr(self.bot, "_continue_flag", 0)))
                 except Exception as e:
-                    error_count += 1
                     error_msg = str(e)
                     
                     # 检查是否是登录相关错误
@@ -542,75 +627,74 @@ class WX849Channel(ChatChannel):
                         # 其他错误正常记录
                         logger.error(f"[WX849] 获取消息出错: {e}")
                     
-                    await asyncio.sleep(5)  # 出错后等待一段时间再重试
+                    await asyncio.sleep(poller.on_error())  # 出错后退避一段时间再重试
                     continue
                 
-                # 如果获取到消息，则处理
+                # 如果获取到消息，按会话分发处理：同一会话保持顺序，不同会话并行
                 if messages:
-                    for idx, msg in enumerate(messages):
-                        try:
-                            logger.debug(f"[WX849] 处理第 {idx+1}/{len(messages)} 条消息")
-                            # 判断是否是群消息
-                            is_group = False
-                            # 检查多种可能的群聊标识字段
-                            if "roomId" in msg and msg["roomId"]:
-                                is_group = True
-                            elif "toUserName" in msg and msg["toUserName"] and msg["toUserName"].endswith("@chatroom"):
-                                is_group = True
-                            elif "ToUserName" in msg and msg["ToUserName"] and msg["ToUserName"].endswith("@chatroom"):
-                                is_group = True
-                            
-                            if is_group:
-                                logger.debug(f"[WX849] 识别为群聊消息")
-                            else:
-                                logger.debug(f"[WX849] 识别为私聊消息")
-                            
-                            # 创建消息对象
-                            cmsg = WX849Message(msg, is_group)
-                            
-                            # 处理消息
-                            if is_group:
-                                self.handle_group(cmsg)
-                            else:
-                                self.handle_single(cmsg)
-                        except Exception as e:
-                            logger.error(f"[WX849] 处理消息出错: {e}")
-                            # 打印完整的异常堆栈
-                            import traceback
-                            logger.error(f"[WX849] 异常堆栈: {traceback.format_exc()}")
+                    self.dispatcher.dispatch(messages)
                 
-                # 休眠一段时间
-                await asyncio.sleep(1)
+                # 休眠一段时间，长轮询或服务端还有未拉取的消息时不等待
+                if delay > 0:
+                    await asyncio.sleep(delay)
             except Exception as e:
                 logger.error(f"[WX849] 消息监听器出错: {e}")
                 # 打印完整的异常堆栈
                 import traceback
                 logger.error(f"[WX849] 异常堆栈: {traceback.format_exc()}")
-                await asyncio.sleep(5)  # 出错后等待一段时间再重试
+                await asyncio.sleep(poller.on_error())  # 出错后退避一段时间再重试
+
+    @timed_stage("ingest")
+    def _handle_raw_message(self, msg):
+        """处理一条原始消息，由消息分发器在工作线程中调用"""
+        # 判断是否是群消息：roomId，或发送方/接收方为群ID
+        is_group = is_group_message(msg)
+        
+        if is_group:
+            logger.debug(f"[WX849] 识别为群聊消息")
+            # 先用原始消息做一次廉价判断，不可能触发的群消息不再解析
+            if conf().get("wx849_group_prefilter", False) and not self.prefilter.accept(msg):
+                return
+        else:
+            logger.debug(f"[WX849] 识别为私聊消息")
+        
+        # 创建消息对象
+        cmsg = WX849Message(msg, is_group)
+        
+        # 处理消息
+        if is_group:
+            self.handle_group(cmsg)
+        else:
+            self.handle_single(cmsg)
 
     def startup(self):
         """启动函数"""
         logger.info("[WX849] 正在启动...")
         
-        # 创建事件循环
-        loop = asyncio.new_event_loop()
+        loop = self.loop
         
         # 定义启动任务
         async def startup_task():
-            # 初始化机器人（登录）
-            login_success = await self._initialize_bot()
-            if login_success:
-                logger.info("[WX849] 登录成功，准备启动消息监听...")
-                self.is_running = True
-                # 启动消息监听
-                await self._message_listener()
-            else:
-                logger.error("[WX849] 初始化失败")
+            try:
+                # 初始化机器人（登录）
+                login_success = await self._initialize_bot()
+                if login_success:
+                    logger.info("[WX849] 登录成功，准备启动消息监听...")
+                    self.is_running = True
+                    # 启动消息监听
+                    await self._message_listener()
+                else:
+                    logger.error("[WX849] 初始化失败")
+            finally:
+                # 关闭共享的HTTP会话，释放连接
+                await WechatAPI.transport.close_session()
         
         # 在新线程中运行事件循环
         def run_loop():
             asyncio.set_event_loop(loop)
-            loop.run_until_complete(startup_task())
+            loop.create_task(startup_task())
+            # 消息监听结束后事件循环继续运行，继续处理发送任务
+            loop.run_forever()
         
         thread = threading.Thread(target=run_loop)
         thread.daemon = True
@@ -689,33 +773,9 @@ class WX849Channel(ChatChannel):
                 group_white_list = conf().get("group_name_white_list", ["ALL_GROUP"])
                 # 检查是否启用了白名单
                 if "ALL_GROUP" not in group_white_list:
-                    # 获取群名
-                    group_name = None
-                    try:
-                        # 使用同步方式获取群名，避免事件循环嵌套
-                        chatrooms_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp", 'wx849_rooms.json')
-                        
-                        if os.path.exists(chatrooms_file):
-                            try:
-                                with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                                    chatrooms_info = json.load(f)
-                                
-                                if cmsg.from_user_id in chatrooms_info:
-                                    group_name = chatrooms_info[cmsg.from_user_id].get("nickName")
-                                    if group_name:
-                                        logger.debug(f"[WX849] 从缓存获取到群名: {group_name}")
-                            except Exception as e:
-                                logger.error(f"[WX849] 读取群聊缓存失败: {e}")
-                        
-                        # 如果没有从缓存获取到群名，使用群ID作为备用
-                        if not group_name:
-                            group_name = cmsg.from_user_id
-                            logger.debug(f"[WX849] 没有找到群名，使用群ID: {group_name}")
-                        
-                        logger.debug(f"[WX849] 群聊白名单检查 - 群名: {group_name}")
-                    except Exception as e:
-                        logger.error(f"[WX849] 获取群名称失败: {e}")
-                        group_name = cmsg.from_user_id
+                    # 从群聊目录获取群名，没有时使用群ID作为备用
+                    group_name = self.rooms.get_group_name(cmsg.from_user_id) or cmsg.from_user_id
+                    logger.debug(f"[WX849] 群聊白名单检查 - 群名: {group_name}")
                     
                     # 检查群名是否在白名单中
                     if group_name and group_name not in group_white_list:
@@ -852,37 +912,33 @@ class WX849Channel(ChatChannel):
         if not msg_type and "Type" in cmsg.msg:
             msg_type = cmsg.msg["Type"]
         
+        # 发送者信息来自 WX849Message 构造时的单遍解析结果，各类型处理方法不再重复拆分内容
+        parsed = cmsg.parsed
+        if parsed.is_group:
+            cmsg.is_group = True
+            # 去掉 "wxid:\n" 前缀后的内容
+            cmsg.content = parsed.body
+            # 如果无法提取，设置为默认值但不要留空
+            cmsg.sender_wxid = parsed.sender_wxid or f"未知用户_{cmsg.from_user_id}"
+            # 设置other_user_id为群ID，确保它不为None
+            cmsg.other_user_id = cmsg.from_user_id
+        else:
+            # 私聊消息
+            cmsg.is_group = False
+            cmsg.sender_wxid = cmsg.from_user_id
+        
+        # 设置actual_user_id和actual_user_nickname，昵称稍后异步更新
+        cmsg.actual_user_id = cmsg.sender_wxid
+        cmsg.actual_user_nickname = cmsg.sender_wxid
+        
         # 尝试获取机器人在群内的昵称
         if cmsg.is_group and not cmsg.self_display_name:
             try:
-                # 从缓存中查询群成员详情
-                tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-                chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-                
-                if os.path.exists(chatrooms_file):
-                    try:
-                        with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                            chatrooms_info = json.load(f)
-                        
-                        if cmsg.from_user_id in chatrooms_info:
-                            room_info = chatrooms_info[cmsg.from_user_id]
-                            
-                            # 在成员中查找机器人的信息
-                            if "members" in room_info and isinstance(room_info["members"], list):
-                                for member in room_info["members"]:
-                                    if member.get("UserName") == self.wxid:
-                                        # 优先使用群内显示名称
-                                        if member.get("DisplayName"):
-                                            cmsg.self_display_name = member.get("DisplayName")
-                                            logger.debug(f"[WX849] 从群成员缓存中获取到机器人群内昵称: {cmsg.self_display_name}")
-                                            break
-                                        # 其次使用昵称
-                                        elif member.get("NickName"):
-                                            cmsg.self_display_name = member.get("NickName")
-                                            logger.debug(f"[WX849] 从群成员缓存中获取到机器人昵称: {cmsg.self_display_name}")
-                                            break
-                    except Exception as e:
-                        logger.error(f"[WX849] 读取群成员缓存失败: {e}")
+                # 从群聊目录中查询机器人的成员信息，优先使用群内显示名称，其次使用昵称
+                self_display_name = self.rooms.get_member_nickname(cmsg.from_user_id, self.wxid)
+                if self_display_name:
+                    cmsg.self_display_name = self_display_name
+                    logger.debug(f"[WX849] 从群成员缓存中获取到机器人群内昵称: {cmsg.self_display_name}")
                 
                 # 如果缓存中没有找到，使用机器人名称
                 if not cmsg.self_display_name:
@@ -911,92 +967,11 @@ class WX849Channel(ChatChannel):
             cmsg.ctype = ContextType.UNKNOWN
             logger.warning(f"[WX849] 未知消息类型: {msg_type}, 内容: {cmsg.content[:100]}")
         
-        # 检查消息是否来自群聊
-        if cmsg.is_group or cmsg.from_user_id.endswith("@chatroom"):
-            # 增强的群消息发送者提取逻辑
-            # 尝试多种可能的格式解析发送者信息
-            sender_extracted = False
-            
-            # 方法1: 尝试解析完整的格式 "wxid:\n消息内容"
-            split_content = cmsg.content.split(":\n", 1)
-            if len(split_content) > 1 and split_content[0] and not split_content[0].startswith("<"):
-                cmsg.sender_wxid = split_content[0]
-                cmsg.content = split_content[1]
-                sender_extracted = True
-                logger.debug(f"[WX849] 群聊发送者提取(方法1): {cmsg.sender_wxid}")
-            
-            # 方法2: 尝试解析简单的格式 "wxid:消息内容"
-            if not sender_extracted:
-                split_content = cmsg.content.split(":", 1)
-                if len(split_content) > 1 and split_content[0] and not split_content[0].startswith("<"):
-                    cmsg.sender_wxid = split_content[0]
-                    cmsg.content = split_content[1]
-                    sender_extracted = True
-                    logger.debug(f"[WX849] 群聊发送者提取(方法2): {cmsg.sender_wxid}")
-            
-            # 方法3: 尝试从回复XML中提取
-            if not sender_extracted and cmsg.content and cmsg.content.startswith("<"):
-                try:
-                    # 解析XML内容
-                    root = ET.fromstring(cmsg.content)
-                    
-                    # 查找不同类型的XML中可能存在的发送者信息
-                    if root.tag == "msg":
-                        # 常见的XML消息格式
-                        sender_node = root.find(".//username")
-                        if sender_node is not None and sender_node.text:
-                            cmsg.sender_wxid = sender_node.text
-                            sender_extracted = True
-                            logger.debug(f"[WX849] 群聊发送者从XML提取: {cmsg.sender_wxid}")
-                        
-                        # 尝试其他可能的标签
-                        if not sender_extracted:
-                            for tag in ["fromusername", "sender", "from"]:
-                                sender_node = root.find(f".//{tag}")
-                                if sender_node is not None and sender_node.text:
-                                    cmsg.sender_wxid = sender_node.text
-                                    sender_extracted = True
-                                    logger.debug(f"[WX849] 群聊发送者从XML({tag})提取: {cmsg.sender_wxid}")
-                                    break
-                except Exception as e:
-                    logger.error(f"[WX849] 从XML提取群聊发送者失败: {e}")
-            
-            # 方法4: 尝试从其它字段提取
-            if not sender_extracted:
-                for key in ["SenderUserName", "sender", "senderId", "fromUser"]:
-                    if key in cmsg.msg and cmsg.msg[key]:
-                        cmsg.sender_wxid = str(cmsg.msg[key])
-                        sender_extracted = True
-                        logger.debug(f"[WX849] 群聊发送者从字段提取({key}): {cmsg.sender_wxid}")
-                        break
-            
-            # 如果仍然无法提取，设置为默认值但不要留空
-            if not sender_extracted or not cmsg.sender_wxid:
-                cmsg.sender_wxid = f"未知用户_{cmsg.from_user_id}"
-                logger.debug(f"[WX849] 无法提取群聊发送者，使用默认值: {cmsg.sender_wxid}")
-            
-            # 设置other_user_id为群ID，确保它不为None
-            cmsg.other_user_id = cmsg.from_user_id
-            
-            # 设置actual_user_id为发送者wxid
-            cmsg.actual_user_id = cmsg.sender_wxid
-            
-            # 异步获取发送者昵称并设置actual_user_nickname
-            # 但现在我们无法在同步方法中直接调用异步方法，所以先使用wxid
-            cmsg.actual_user_nickname = cmsg.sender_wxid
-            
-            # 启动异步任务获取昵称并更新actual_user_nickname
-            threading.Thread(target=lambda: asyncio.run(self._update_nickname_async(cmsg))).start()
-            
+        if cmsg.is_group:
+            # 在通道事件循环中异步获取昵称并更新actual_user_nickname
+            self._submit(self._update_nickname_async(cmsg))
             logger.debug(f"[WX849] 设置实际发送者信息: actual_user_id={cmsg.actual_user_id}, actual_user_nickname={cmsg.actual_user_nickname}")
         else:
-            # 私聊消息
-            cmsg.sender_wxid = cmsg.from_user_id
-            cmsg.is_group = False
-            
-            # 私聊消息也设置actual_user_id和actual_user_nickname
-            cmsg.actual_user_id = cmsg.from_user_id
-            cmsg.actual_user_nickname = cmsg.from_user_id
             logger.debug(f"[WX849] 设置私聊发送者信息: actual_user_id={cmsg.actual_user_id}, actual_user_nickname={cmsg.actual_user_nickname}")
 
     async def _update_nickname_async(self, cmsg):
@@ -1009,451 +984,154 @@ class WX849Channel(ChatChannel):
 
     def _process_text_message(self, cmsg):
         """处理文本消息"""
-        import xml.etree.ElementTree as ET
-        
         cmsg.ctype = ContextType.TEXT
         
-        # 处理群聊/私聊消息发送者
-        if cmsg.is_group or cmsg.from_user_id.endswith("@chatroom"):
-            cmsg.is_group = True
-            
-            # 增强的群消息发送者提取逻辑
-            # 尝试多种可能的格式解析发送者信息
-            sender_extracted = False
-            
-            # 方法1: 尝试解析完整的格式 "wxid:\n消息内容"
-            split_content = cmsg.content.split(":\n", 1)
-            if len(split_content) > 1 and split_content[0] and not split_content[0].startswith("<"):
-                cmsg.sender_wxid = split_content[0]
-                cmsg.content = split_content[1]
-                sender_extracted = True
-                logger.debug(f"[WX849] 群聊发送者提取(方法1): {cmsg.sender_wxid}")
-            
-            # 方法2: 尝试解析简单的格式 "wxid:消息内容"
-            if not sender_extracted:
-                split_content = cmsg.content.split(":", 1)
-                if len(split_content) > 1 and split_content[0] and not split_content[0].startswith("<"):
-                    cmsg.sender_wxid = split_content[0]
-                    cmsg.content = split_content[1]
-                    sender_extracted = True
-                    logger.debug(f"[WX849] 群聊发送者提取(方法2): {cmsg.sender_wxid}")
-            
-            # 方法3: 尝试从MsgSource XML中提取
-            if not sender_extracted:
-                try:
-                    msg_source = cmsg.msg.get("MsgSource", "")
-                    if msg_source and (msg_source.startswith("<") or "<msgsource>" in msg_source.lower()):
-                        try:
-                            if "<msgsource>" not in msg_source.lower():
-                                msg_source = f"<msgsource>{msg_source}</msgsource>"
-                            root = ET.fromstring(msg_source)
-                            # 尝试提取不同可能的发送者标签
-                            for tag in ["username", "nickname", "alias", "fromusername"]:
-                                elem = root.find(f"./{tag}")
-                                if elem is not None and elem.text:
-                                    cmsg.sender_wxid = elem.text
-                                    sender_extracted = True
-                                    logger.debug(f"[WX849] 群聊发送者从MsgSource提取(标签:{tag}): {cmsg.sender_wxid}")
-                                    break
-                                    
-                            # 同时尝试提取机器人在群内的昵称
-                            for tag in ["selfDisplayName", "displayname", "nickname"]:
-                                elem = root.find(f"./{tag}")
-                                if elem is not None and elem.text:
-                                    cmsg.self_display_name = elem.text
-                                    logger.debug(f"[WX849] 从MsgSource中提取到机器人群内昵称: {cmsg.self_display_name}")
-                                    break
-                        except Exception as e:
-                            logger.debug(f"[WX849] 从MsgSource提取发送者失败: {e}")
-                except Exception as e:
-                    logger.debug(f"[WX849] 尝试解析MsgSource时出错: {e}")
-            
-            # 方法4: 尝试从其它字段提取
-            if not sender_extracted:
-                for key in ["SenderUserName", "sender", "senderId", "fromUser"]:
-                    if key in cmsg.msg and cmsg.msg[key]:
-                        cmsg.sender_wxid = str(cmsg.msg[key])
-                        sender_extracted = True
-                        logger.debug(f"[WX849] 群聊发送者从字段提取({key}): {cmsg.sender_wxid}")
-                        break
-            
-            # 如果仍然无法提取，设置为默认值但不要留空
-            if not sender_extracted or not cmsg.sender_wxid:
-                cmsg.sender_wxid = f"未知用户_{cmsg.from_user_id}"
-                logger.debug(f"[WX849] 无法提取群聊发送者，使用默认值: {cmsg.sender_wxid}")
-            
-            # 设置other_user_id为群ID，确保它不为None
-            cmsg.other_user_id = cmsg.from_user_id
-            
-            # 设置actual_user_id和actual_user_nickname
-            cmsg.actual_user_id = cmsg.sender_wxid
-            cmsg.actual_user_nickname = cmsg.sender_wxid
-            logger.debug(f"[WX849] 设置实际发送者信息: actual_user_id={cmsg.actual_user_id}, actual_user_nickname={cmsg.actual_user_nickname}")
-        else:
-            # 私聊消息
-            cmsg.sender_wxid = cmsg.from_user_id
-            cmsg.is_group = False
-        
-            # 私聊消息也设置actual_user_id和actual_user_nickname
-            cmsg.actual_user_id = cmsg.from_user_id
-            cmsg.actual_user_nickname = cmsg.from_user_id
-            logger.debug(f"[WX849] 设置私聊发送者信息: actual_user_id={cmsg.actual_user_id}, actual_user_nickname={cmsg.actual_user_nickname}")
-        
-        # 解析@信息 - 多种方式解析
-        try:
-            # 方法1: 从MsgSource解析
-            msg_source = cmsg.msg.get("MsgSource", "")
-            if msg_source:
-                try:
-                    if "<msgsource>" not in msg_source.lower():
-                        msg_source = f"<msgsource>{msg_source}</msgsource>"
-                    root = ET.fromstring(msg_source)
-                    ats_elem = root.find(".//atuserlist")
-                    if ats_elem is not None and ats_elem.text:
-                        cmsg.at_list = [x for x in ats_elem.text.strip(",").split(",") if x]
-                        logger.debug(f"[WX849] 从MsgSource解析到@列表: {cmsg.at_list}")
-                except Exception as e:
-                    logger.debug(f"[WX849] 从MsgSource解析@列表失败: {e}")
-            
-            # 方法2: 从其他字段解析
-            if not cmsg.at_list:
-                for key in ["AtUserList", "at_list", "atlist"]:
-                    if key in cmsg.msg:
-                        at_value = cmsg.msg[key]
-                        if isinstance(at_value, list):
-                            cmsg.at_list = [str(x) for x in at_value if x]
-                        elif isinstance(at_value, str):
-                            cmsg.at_list = [x for x in at_value.strip(",").split(",") if x]
-                        
-                        if cmsg.at_list:
-                            logger.debug(f"[WX849] 从字段{key}解析到@列表: {cmsg.at_list}")
-                            break
-            
-            # 方法3: 从消息内容中检测@机器人
-            if cmsg.is_group and not cmsg.at_list and "@" in cmsg.content:
-                # 如果机器人有名称或群内昵称，检查是否被@
-                if self.name and f"@{self.name}" in cmsg.content:
-                    # 模拟添加自己到at_list
-                    cmsg.at_list.append(self.wxid)
-                    logger.debug(f"[WX849] 从消息内容检测到@机器人名称: {self.name}")
-                elif hasattr(cmsg, 'self_display_name') and cmsg.self_display_name and f"@{cmsg.self_display_name}" in cmsg.content:
-                    # 模拟添加自己到at_list
-                    cmsg.at_list.append(self.wxid)
-                    logger.debug(f"[WX849] 从消息内容检测到@机器人群内昵称: {cmsg.self_display_name}")
-        except Exception as e:
-            logger.debug(f"[WX849] 解析@列表失败: {e}")
-            cmsg.at_list = []
-        
-        # 确保at_list不为空列表
-        if not cmsg.at_list or (len(cmsg.at_list) == 1 and cmsg.at_list[0] == ""):
-            cmsg.at_list = []
+        # 解析@信息：MsgSource和消息字段已在单遍解析中处理
+        cmsg.at_list = list(cmsg.parsed.at_list)
+        
+        # 从消息内容中检测@机器人
+        if cmsg.is_group and not cmsg.at_list and "@" in cmsg.content:
+            # 如果机器人有名称或群内昵称，检查是否被@
+            if self.name and f"@{self.name}" in cmsg.content:
+                # 模拟添加自己到at_list
+                cmsg.at_list.append(self.wxid)
+                logger.debug(f"[WX849] 从消息内容检测到@机器人名称: {self.name}")
+            elif cmsg.self_display_name and f"@{cmsg.self_display_name}" in cmsg.content:
+                # 模拟添加自己到at_list
+                cmsg.at_list.append(self.wxid)
+                logger.debug(f"[WX849] 从消息内容检测到@机器人群内昵称: {cmsg.self_display_name}")
         
         # 输出日志
         logger.info(f"收到文本消息: ID:{cmsg.msg_id} 来自:{cmsg.from_user_id} 发送人:{cmsg.sender_wxid} @:{cmsg.at_list} 内容:{cmsg.content}")
 
     def _process_image_message(self, cmsg):
         """处理图片消息"""
-        import xml.etree.ElementTree as ET
-        
         cmsg.ctype = ContextType.IMAGE
         
-        # 处理群聊/私聊消息发送者
-        if cmsg.is_group or cmsg.from_user_id.endswith("@chatroom"):
-            cmsg.is_group = True
-            split_content = cmsg.content.split(":\n", 1)
-            if len(split_content) > 1:
-                cmsg.sender_wxid = split_content[0]
-                cmsg.content = split_content[1]
-            else:
-                # 处理没有换行的情况
-                split_content = cmsg.content.split(":", 1)
-                if len(split_content) > 1:
-                    cmsg.sender_wxid = split_content[0]
-                    cmsg.content = split_content[1]
-                else:
-                    cmsg.content = split_content[0]
-                    cmsg.sender_wxid = ""
-            
-            # 设置actual_user_id和actual_user_nickname
-            cmsg.actual_user_id = cmsg.sender_wxid
-            cmsg.actual_user_nickname = cmsg.sender_wxid
-        else:
-            # 私聊消息
-            cmsg.sender_wxid = cmsg.from_user_id
-            cmsg.is_group = False
-            
-            # 私聊消息也设置actual_user_id和actual_user_nickname
-            cmsg.actual_user_id = cmsg.from_user_id
-            cmsg.actual_user_nickname = cmsg.from_user_id
-        
         # 解析图片信息
-        try:
-            root = ET.fromstring(cmsg.content)
-            img_element = root.find('img')
-            if img_element is not None:
-                cmsg.image_info = {
-                    'aeskey': img_element.get('aeskey'),
-                    'cdnmidimgurl': img_element.get('cdnmidimgurl'),
-                    'length': img_element.get('length'),
-                    'md5': img_element.get('md5')
-                }
-                logger.debug(f"解析图片XML成功: aeskey={cmsg.image_info['aeskey']}, length={cmsg.image_info['length']}, md5={cmsg.image_info['md5']}")
-        except Exception as e:
-            logger.debug(f"解析图片消息失败: {e}, 内容: {cmsg.content[:100]}")
+        parsed = cmsg.parsed
+        if "<img" in cmsg.content:
+            cmsg.image_info = {
+                'aeskey': parsed.attr('aeskey'),
+                'cdnmidimgurl': parsed.attr('cdnmidimgurl'),
+                'length': parsed.attr('length'),
+                'md5': parsed.attr('md5')
+            }
+            logger.debug(f"解析图片XML成功: aeskey={cmsg.image_info['aeskey']}, length={cmsg.image_info['length']}, md5={cmsg.image_info['md5']}")
+        else:
+            logger.debug(f"解析图片消息失败, 内容: {cmsg.content[:100]}")
             cmsg.image_info = {}
         
         # 输出日志 - 修改为显示完整XML内容
         logger.info(f"收到图片消息: ID:{cmsg.msg_id} 来自:{cmsg.from_user_id} 发送人:{cmsg.sender_wxid}\nXML内容: {cmsg.content}")
 
+        aeskey, cdnmidimgurl = cmsg.image_info.get('aeskey'), cmsg.image_info.get('cdnmidimgurl')
+        if aeskey and cdnmidimgurl:
+            key = cmsg.image_info.get('md5') or content_key("image", cdnmidimgurl)
+            self._attach_media(cmsg, "image", key, ".jpg", lambda: self.bot.download_image(aeskey, cdnmidimgurl))
+            cmsg.content = cmsg.media_path
+
     def _process_voice_message(self, cmsg):
         """处理语音消息"""
-        import xml.etree.ElementTree as ET
-        import re
-        
         cmsg.ctype = ContextType.VOICE
         
-        # 保存原始内容，避免修改
-        original_content = cmsg.content
-        
-        # 检查内容是否为XML格式
-        is_xml_content = original_content.strip().startswith("<?xml") or original_content.strip().startswith("<msg")
-        
-        # 首先尝试从XML中提取发送者信息
-        if is_xml_content:
-            logger.debug(f"[WX849] 语音消息：尝试从XML提取发送者")
-            try:
-                # 使用正则表达式从XML字符串中提取fromusername属性或元素
-                match = re.search(r'fromusername\s*=\s*["\'](.*?)["\']', original_content)
-                if match:
-                    cmsg.sender_wxid = match.group(1)
-                    logger.debug(f"[WX849] 语音消息：从XML属性提取的发送者ID: {cmsg.sender_wxid}")
-                else:
-                    # 尝试从元素中提取
-                    match = re.search(r'<fromusername>(.*?)</fromusername>', original_content)
-                    if match:
-                        cmsg.sender_wxid = match.group(1)
-                        logger.debug(f"[WX849] 语音消息：从XML元素提取的发送者ID: {cmsg.sender_wxid}")
-                    else:
-                        logger.debug("[WX849] 语音消息：未找到fromusername")
-                        
-                        # 尝试使用ElementTree解析
-                        try:
-                            root = ET.fromstring(original_content)
-                            # 尝试查找语音元素的fromusername属性
-                            voice_element = root.find('voicemsg')
-                            if voice_element is not None and 'fromusername' in voice_element.attrib:
-                                cmsg.sender_wxid = voice_element.attrib['fromusername']
-                                logger.debug(f"[WX849] 语音消息：使用ElementTree提取的发送者ID: {cmsg.sender_wxid}")
-                        except Exception as e:
-                            logger.debug(f"[WX849] 语音消息：使用ElementTree解析失败: {e}")
-            except Exception as e:
-                logger.debug(f"[WX849] 语音消息：提取发送者失败: {e}")
-                
-        # 如果无法从XML提取，再尝试传统的分割方法
-        if not cmsg.sender_wxid and (cmsg.is_group or cmsg.from_user_id.endswith("@chatroom")):
-            cmsg.is_group = True
-            split_content = original_content.split(":\n", 1)
-            if len(split_content) > 1:
-                cmsg.sender_wxid = split_content[0]
-                logger.debug(f"[WX849] 语音消息：使用分割方法提取的发送者ID: {cmsg.sender_wxid}")
-            else:
-                # 处理没有换行的情况
-                split_content = original_content.split(":", 1)
-                if len(split_content) > 1:
-                    cmsg.sender_wxid = split_content[0]
-                    logger.debug(f"[WX849] 语音消息：使用冒号分割提取的发送者ID: {cmsg.sender_wxid}")
-        
-        # 对于私聊消息，使用from_user_id作为发送者ID
-        if not cmsg.sender_wxid and not cmsg.is_group:
-            cmsg.sender_wxid = cmsg.from_user_id
-            cmsg.is_group = False
-        
-        # 设置actual_user_id和actual_user_nickname
-        cmsg.actual_user_id = cmsg.sender_wxid or cmsg.from_user_id
-        cmsg.actual_user_nickname = cmsg.sender_wxid or cmsg.from_user_id
-        
         # 解析语音信息 (保留此功能以获取语音URL等信息)
-        try:
-            root = ET.fromstring(original_content)
-            voice_element = root.find('voicemsg')
-            if voice_element is not None:
-                cmsg.voice_info = {
-                    'voiceurl': voice_element.get('voiceurl'),
-                    'length': voice_element.get('length')
-                }
-                logger.debug(f"解析语音XML成功: voiceurl={cmsg.voice_info['voiceurl']}, length={cmsg.voice_info['length']}")
-        except Exception as e:
-            logger.debug(f"解析语音消息失败: {e}, 内容: {original_content[:100]}")
+        parsed = cmsg.parsed
+        if "<voicemsg" in cmsg.content:
+            cmsg.voice_info = {
+                'voiceurl': parsed.attr('voiceurl'),
+                'length': parsed.attr('length')
+            }
+            logger.debug(f"解析语音XML成功: voiceurl={cmsg.voice_info['voiceurl']}, length={cmsg.voice_info['length']}")
+        else:
+            logger.debug(f"解析语音消息失败, 内容: {cmsg.content[:100]}")
             cmsg.voice_info = {}
-            
-        # 确保保留原始XML内容
-        cmsg.content = original_content
-        
-        # 最终检查，确保发送者不是XML内容
-        if not cmsg.sender_wxid or "<" in cmsg.sender_wxid:
-            cmsg.sender_wxid = "未知发送者"
-            cmsg.actual_user_id = cmsg.sender_wxid
-            cmsg.actual_user_nickname = cmsg.sender_wxid
         
         # 输出日志，显示完整XML内容
         logger.info(f"收到语音消息: ID:{cmsg.msg_id} 来自:{cmsg.from_user_id} 发送人:{cmsg.sender_wxid}\nXML内容: {cmsg.content}")
 
+        voiceurl, length = cmsg.voice_info.get('voiceurl'), cmsg.voice_info.get('length')
+        if voiceurl and length:
+            # 语音XML不带内容md5，voiceurl 在转发时保持不变，用它作为缓存key
+            key = content_key("voice", voiceurl)
+            self._attach_media(cmsg, "voice", key, ".silk", lambda: self.bot.download_voice(cmsg.msg_id, voiceurl, int(length)))
+            cmsg.content = cmsg.media_path
+
     def _process_video_message(self, cmsg):
         """处理视频消息"""
-        import xml.etree.ElementTree as ET
-        import re
-        
         cmsg.ctype = ContextType.VIDEO
         
-        # 保存原始内容，避免修改
-        original_content = cmsg.content
-        
-        # 检查内容是否为XML格式
-        is_xml_content = original_content.strip().startswith("<?xml") or original_content.strip().startswith("<msg")
-        
-        # 首先尝试从XML中提取发送者信息
-        if is_xml_content:
-            logger.debug(f"[WX849] 视频消息：尝试从XML提取发送者")
-            try:
-                # 使用正则表达式从XML字符串中提取fromusername属性或元素
-                match = re.search(r'fromusername\s*=\s*["\'](.*?)["\']', original_content)
-                if match:
-                    cmsg.sender_wxid = match.group(1)
-                    logger.debug(f"[WX849] 视频消息：从XML属性提取的发送者ID: {cmsg.sender_wxid}")
-                else:
-                    # 尝试从元素中提取
-                    match = re.search(r'<fromusername>(.*?)</fromusername>', original_content)
-                    if match:
-                        cmsg.sender_wxid = match.group(1)
-                        logger.debug(f"[WX849] 视频消息：从XML元素提取的发送者ID: {cmsg.sender_wxid}")
-                    else:
-                        logger.debug("[WX849] 视频消息：未找到fromusername")
-                        
-                        # 尝试使用ElementTree解析
-                        try:
-                            root = ET.fromstring(original_content)
-                            # 尝试查找video元素的fromusername属性
-                            video_element = root.find('videomsg')
-                            if video_element is not None and 'fromusername' in video_element.attrib:
-                                cmsg.sender_wxid = video_element.attrib['fromusername']
-                                logger.debug(f"[WX849] 视频消息：使用ElementTree提取的发送者ID: {cmsg.sender_wxid}")
-                        except Exception as e:
-                            logger.debug(f"[WX849] 视频消息：使用ElementTree解析失败: {e}")
-            except Exception as e:
-                logger.debug(f"[WX849] 视频消息：提取发送者失败: {e}")
-                
-        # 如果无法从XML提取，再尝试传统的分割方法
-        if not cmsg.sender_wxid and (cmsg.is_group or cmsg.from_user_id.endswith("@chatroom")):
-            cmsg.is_group = True
-            split_content = original_content.split(":\n", 1)
-            if len(split_content) > 1:
-                cmsg.sender_wxid = split_content[0]
-                logger.debug(f"[WX849] 视频消息：使用分割方法提取的发送者ID: {cmsg.sender_wxid}")
-            else:
-                # 处理没有换行的情况
-                split_content = original_content.split(":", 1)
-                if len(split_content) > 1:
-                    cmsg.sender_wxid = split_content[0]
-                    logger.debug(f"[WX849] 视频消息：使用冒号分割提取的发送者ID: {cmsg.sender_wxid}")
-        
-        # 对于私聊消息，使用from_user_id作为发送者ID
-        if not cmsg.sender_wxid and not cmsg.is_group:
-            cmsg.sender_wxid = cmsg.from_user_id
-            cmsg.is_group = False
-            
-        # 设置actual_user_id和actual_user_nickname
-        cmsg.actual_user_id = cmsg.sender_wxid or cmsg.from_user_id
-        cmsg.actual_user_nickname = cmsg.sender_wxid or cmsg.from_user_id
-            
-        # 确保保留原始XML内容
-        cmsg.content = original_content
-        
-        # 最终检查，确保发送者不是XML内容
-        if not cmsg.sender_wxid or "<" in cmsg.sender_wxid:
-            cmsg.sender_wxid = "未知发送者"
-            cmsg.actual_user_id = cmsg.sender_wxid
-            cmsg.actual_user_nickname = cmsg.sender_wxid
-        
         # 输出日志，显示完整XML内容
         logger.info(f"收到视频消息: ID:{cmsg.msg_id} 来自:{cmsg.from_user_id} 发送人:{cmsg.sender_wxid}\nXML内容: {cmsg.content}")
 
+        parsed = cmsg.parsed
+        if parsed.elements.get("tag") == "videomsg":
+            key = parsed.attr('md5') or content_key("video", parsed.attr('cdnvideourl'), cmsg.msg_id)
+            self._attach_media(cmsg, "video", key, ".mp4", lambda: self.bot.download_video(cmsg.msg_id))
+            cmsg.content = cmsg.media_path
+
     def _process_emoji_message(self, cmsg):
         """处理表情消息"""
-        import xml.etree.ElementTree as ET
-        import re
-        
         cmsg.ctype = ContextType.TEXT  # 表情消息通常也用TEXT类型
         
-        # 保存原始内容，避免修改
-        original_content = cmsg.content
-        
-        # 检查内容是否为XML格式
-        is_xml_content = original_content.strip().startswith("<?xml") or original_content.strip().startswith("<msg")
-        
-        # 首先尝试从XML中提取发送者信息
-        if is_xml_content:
-            logger.debug(f"[WX849] 表情消息：尝试从XML提取发送者")
-            try:
-                # 使用正则表达式从XML中提取fromusername属性
-                match = re.search(r'fromusername\s*=\s*["\'](.*?)["\']', original_content)
-                if match:
-                    cmsg.sender_wxid = match.group(1)
-                    logger.debug(f"[WX849] 表情消息：从XML提取的发送者ID: {cmsg.sender_wxid}")
-                else:
-                    logger.debug("[WX849] 表情消息：未找到fromusername属性")
-                    
-                    # 尝试使用ElementTree解析
-                    try:
-                        root = ET.fromstring(original_content)
-                        emoji_element = root.find('emoji')
-                        if emoji_element is not None and 'fromusername' in emoji_element.attrib:
-                            cmsg.sender_wxid = emoji_element.attrib['fromusername']
-                            logger.debug(f"[WX849] 表情消息：使用ElementTree提取的发送者ID: {cmsg.sender_wxid}")
-                    except Exception as e:
-                        logger.debug(f"[WX849] 表情消息：使用ElementTree解析失败: {e}")
-            except Exception as e:
-                logger.debug(f"[WX849] 表情消息：提取发送者失败: {e}")
-                
-        # 如果无法从XML提取，再尝试传统的分割方法
-        if not cmsg.sender_wxid and (cmsg.is_group or cmsg.from_user_id.endswith("@chatroom")):
-            cmsg.is_group = True
-            split_content = original_content.split(":\n", 1)
-            if len(split_content) > 1:
-                cmsg.sender_wxid = split_content[0]
-                logger.debug(f"[WX849] 表情消息：使用分割方法提取的发送者ID: {cmsg.sender_wxid}")
-            else:
-                # 处理没有换行的情况
-                split_content = original_content.split(":", 1)
-                if len(split_content) > 1:
-                    cmsg.sender_wxid = split_content[0]
-                    logger.debug(f"[WX849] 表情消息：使用冒号分割提取的发送者ID: {cmsg.sender_wxid}")
-        
-        # 对于私聊消息，使用from_user_id作为发送者ID
-        if not cmsg.sender_wxid and not cmsg.is_group:
-            cmsg.sender_wxid = cmsg.from_user_id
-            cmsg.is_group = False
-            
-        # 设置actual_user_id和actual_user_nickname
-        cmsg.actual_user_id = cmsg.sender_wxid or cmsg.from_user_id
-        cmsg.actual_user_nickname = cmsg.sender_wxid or cmsg.from_user_id
-            
-        # 确保保留原始XML内容
-        cmsg.content = original_content
-        
-        # 最终检查，确保发送者不是XML内容
-        if not cmsg.sender_wxid or "<" in cmsg.sender_wxid:
-            cmsg.sender_wxid = "未知发送者"
-            cmsg.actual_user_id = cmsg.sender_wxid
-            cmsg.actual_user_nickname = cmsg.sender_wxid
-        
         # 输出日志，显示完整XML内容
         logger.info(f"收到表情消息: ID:{cmsg.msg_id} 来自:{cmsg.from_user_id} 发送人:{cmsg.sender_wxid} \nXML内容: {cmsg.content}")
 
+        # 表情消息的内容保持XML文本，调用 cmsg.prepare() 后可从 cmsg.media_path 读取表情文件
+        parsed = cmsg.parsed
+        md5 = parsed.attr('md5') if parsed.elements.get("tag") == "emoji" else None
+        if md5:
+            cdnurl = parsed.attr('cdnurl')
+            self._attach_media(cmsg, "emoji", md5, ".gif", lambda: self._fetch_emoji(md5, cdnurl))
+
+    def _attach_media(self, cmsg, kind, key, ext, fetch_func):
+        """
+        为媒体消息设置本地文件路径(cmsg.media_path)，实际下载推迟到 cmsg.prepare()，
+        经媒体缓存完成：命中时直接复用，转发的相同图片/表情只下载一次。
+        """
+        cmsg.media_path = os.path.join(TmpDir().path(), f"wx849_{kind}_{cmsg.msg_id}{ext}")
+
+        def prepare():
+            try:
+                future = self._submit(self.media_cache.fetch(kind, key, ext, fetch_func))
+                cache_path = future.result(timeout=conf().get("wx849_media_download_timeout", 60))
+                self.media_cache.materialize(cache_path, cmsg.media_path)
+            except Exception as e:
+                logger.error(f"[WX849] 下载{kind}失败: ID:{cmsg.msg_id}, {e}")
+                raise
+
+        cmsg._prepare_fn = prepare
+
+    async def _fetch_emoji(self, md5, cdnurl=None):
+        """下载表情：优先使用XML中的cdnurl，没有时通过md5查询下载地址"""
+        url = cdnurl
+        if not url:
+            url = self._find_emoji_url(await self.bot.download_emoji(md5))
+        if not url:
+            raise ValueError(f"未找到表情下载地址: {md5}")
+        async with WechatAPI.transport.shared_session() as session:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.read()
+
+    def _find_emoji_url(self, data):
+        """从 download_emoji 的返回结果中找到第一个下载地址"""
+        if isinstance(data, dict):
+            for key in ("url", "Url", "cdnUrl", "CdnUrl", "cdnurl"):
+                value = data.get(key)
+                if isinstance(value, str) and value.startswith("http"):
+                    return value
+            data = list(data.values())
+        if isinstance(data, list):
+            for item in data:
+                if isinstance(item, (dict, list)):
+                    url = self._find_emoji_url(item)
+                    if url:
+                        return url
+        return None
+
     def _process_xml_message(self, cmsg):
         """处理XML消息"""
-        # 只保留re模块的导入
-        import re
-        
         # 先默认设置为XML类型，添加错误处理
         try:
             cmsg.ctype = ContextType.XML
@@ -1470,68 +1148,11 @@ class WX849Channel(ChatChannel):
                 logger.error("[WX849] 设置 ContextType.XML 失败，回退到 TEXT 类型")
                 cmsg.ctype = ContextType.TEXT
         
-        # 添加调试日志，记录原始XML内容
-        logger.debug(f"[WX849] 开始处理XML消息，消息ID: {cmsg.msg_id}, 内容长度: {len(cmsg.content)}")
-        if cmsg.content and len(cmsg.content) > 0:
-            logger.debug(f"[WX849] XML内容前100字符: {cmsg.content[:100]}")
-        else:
-            logger.debug(f"[WX849] XML内容为空")
-        
-        # 检查内容是否为XML格式
-        original_content = cmsg.content
-        is_xml_content = original_content.strip().startswith("<?xml") or original_content.strip().startswith("<msg")
-        
-        # 处理群聊/私聊消息发送者
-        if cmsg.is_group or cmsg.from_user_id.endswith("@chatroom"):
-            cmsg.is_group = True
-            # 先默认设置一个空的sender_wxid
-            cmsg.sender_wxid = ""
-            
-            # 尝试从XML中提取发送者信息
-            if is_xml_content:
-                logger.debug(f"[WX849] XML消息：尝试从XML提取发送者")
-                try:
-                    # 使用正则表达式从XML中提取fromusername属性
-                    match = re.search(r'fromusername\s*=\s*["\'](.*?)["\']', original_content)
-                    if match:
-                        cmsg.sender_wxid = match.group(1)
-                        logger.debug(f"[WX849] XML消息：从XML提取的发送者ID: {cmsg.sender_wxid}")
-                    else:
-                        # 尝试从元素中提取
-                        match = re.search(r'<fromusername>(.*?)</fromusername>', original_content)
-                        if match:
-                            cmsg.sender_wxid = match.group(1)
-                            logger.debug(f"[WX849] XML消息：从XML元素提取的发送者ID: {cmsg.sender_wxid}")
-                        else:
-                            logger.debug("[WX849] XML消息：未找到fromusername")
-                except Exception as e:
-                    logger.debug(f"[WX849] XML消息：提取发送者失败: {e}")
-            
-            # 如果无法从XML提取，尝试传统的分割方法
-            if not cmsg.sender_wxid:
-                split_content = original_content.split(":\n", 1)
-                if len(split_content) > 1 and not split_content[0].startswith("<"):
-                    cmsg.sender_wxid = split_content[0]
-                    logger.debug(f"[WX849] XML消息：使用分割方法提取的发送者ID: {cmsg.sender_wxid}")
-                else:
-                    # 处理没有换行的情况
-                    split_content = original_content.split(":", 1)
-                    if len(split_content) > 1 and not split_content[0].startswith("<"):
-                        cmsg.sender_wxid = split_content[0]
-                        logger.debug(f"[WX849] XML消息：使用冒号分割提取的发送者ID: {cmsg.sender_wxid}")
-            
-            # 如果仍然无法提取，使用默认值
-            if not cmsg.sender_wxid:
-                cmsg.sender_wxid = f"未知用户_{cmsg.from_user_id}"
-                logger.debug(f"[WX849] XML消息：使用默认发送者ID: {cmsg.sender_wxid}")
-        else:
-            # 私聊消息
-            cmsg.sender_wxid = cmsg.from_user_id
-            cmsg.is_group = False
+        # appmsg 子类型，如 5(链接)、6(文件)、57(引用)
+        cmsg.app_type = cmsg.parsed.app_type
         
-        # 设置actual_user_id和actual_user_nickname
-        cmsg.actual_user_id = cmsg.sender_wxid or cmsg.from_user_id
-        cmsg.actual_user_nickname = cmsg.sender_wxid or cmsg.from_user_id
+        # 添加调试日志，记录原始XML内容
+        logger.debug(f"[WX849] 开始处理XML消息，消息ID: {cmsg.msg_id}, 内容长度: {len(cmsg.content)}, appmsg类型: {cmsg.app_type}")
         
         # 输出日志，显示完整XML内容
         logger.info(f"收到XML消息: ID:{cmsg.msg_id} 来自:{cmsg.from_user_id} 发送人:{cmsg.sender_wxid}\nXML内容: {cmsg.content}")
@@ -1577,11 +1198,9 @@ class WX849Channel(ChatChannel):
         
         logger.info(f"收到系统消息: ID:{cmsg.msg_id} 来自:{cmsg.from_user_id} 发送人:{cmsg.sender_wxid} 内容:{cmsg.content}")
 
-    async def _call_api(self, endpoint, params):
-        """通用API调用方法，用于直接访问WechatAPI的端点"""
+    async def _call_api(self, endpoint, params, timeout=None):
+        """通用API调用方法，用于直接访问WechatAPI的端点，timeout 为 aiohttp.ClientTimeout，默认使用共享会话的超时"""
         try:
-            import aiohttp
-            
             # 获取API配置
             api_host = conf().get("wx849_api_host", "127.0.0.1")
             api_port = conf().get("wx849_api_port", 9000)
@@ -1596,9 +1215,9 @@ class WX849Channel(ChatChannel):
             # 构建完整的API URL
             url = f"http://{api_host}:{api_port}{api_path_prefix}{endpoint}"
             
-            # 发送请求
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=params) as response:
+            # 发送请求，复用共享的HTTP连接池
+            async with WechatAPI.transport.shared_session() as session:
+                async with session.post(url, json=params, timeout=timeout or session.timeout) as response:
                     if response.status != 200:
                         logger.error(f"[WX849] API请求失败: {url}, 状态码: {response.status}")
                         return None
@@ -1642,34 +1261,43 @@ class WX849Channel(ChatChannel):
             logger.error(f"[WX849] 发送消息失败: {e}")
             return None
 
+    @staticmethod
+    def _encode_image(image_input):
+        """将图片(文件路径、BytesIO或bytes)编码为base64字符串，失败时返回None"""
+        if isinstance(image_input, str):  # 如果是文件路径字符串
+            if not os.path.exists(image_input):
+                logger.error(f"[WX849] 发送图片失败: 文件不存在 {image_input}")
+                return None
+            with open(image_input, "rb") as f:
+                image_data = f.read()
+        elif isinstance(image_input, io.BytesIO):
+            image_data = image_input.getvalue()
+        elif isinstance(image_input, bytes):
+            image_data = image_input
+        else:
+            logger.error(f"[WX849] 发送图片失败: 不支持的图片输入类型 {type(image_input)}")
+            return None
+        return base64.b64encode(image_data).decode('utf-8')
+
     async def _send_image(self, to_user_id, image_input):
         """发送图片的异步方法 (处理文件路径或BytesIO/bytes)"""
+        try:
+            image_base64 = self._encode_image(image_input)
+            if image_base64 is None:
+                return None
+            return await self._send_image_base64(to_user_id, image_base64)
+        except Exception as e:
+            logger.error(f"[WX849] 发送图片失败: {e}")
+            return None
+
+    async def _send_image_base64(self, to_user_id, image_base64):
+        """发送已编码为base64的图片"""
         try:
             # 检查接收者ID
             if not to_user_id:
                 logger.error("[WX849] 发送图片失败: 接收者ID为空")
                 return None
             
-            image_base64 = None
-            import base64
-            
-            if isinstance(image_input, str): # 如果是文件路径字符串
-                if not os.path.exists(image_input):
-                    logger.error(f"[WX849] 发送图片失败: 文件不存在 {image_input}")
-                    return None
-                with open(image_input, "rb") as f:
-                    image_data = f.read()
-                    image_base64 = base64.b64encode(image_data).decode('utf-8')
-            elif isinstance(image_input, io.BytesIO):
-                image_data = image_input.getvalue()
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
-            elif isinstance(image_input, bytes):
-                image_data = image_input
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
-            else:
-                logger.error(f"[WX849] 发送图片失败: 不支持的图片输入类型 {type(image_input)}")
-                return None
-            
             # 构建API参数
             params = {
                 "ToWxid": to_user_id,
@@ -1678,7 +1306,7 @@ class WX849Channel(ChatChannel):
             }
             
             # 调用API，修改端点为 /Msg/UploadImg
-            result = await self._call_api("/Msg/UploadImg", params) 
+            result = await self._call_api("/Msg/UploadImg", params, timeout=WechatAPI.transport.media_timeout()) 
             
             # 检查结果
             if result and isinstance(result, dict):
@@ -1692,8 +1320,106 @@ class WX849Channel(ChatChannel):
             logger.error(f"[WX849] 发送图片失败: {e}")
             return None
 
+    async def _fetch_image_url(self, img_url):
+        """流式下载网络图片到内存(复用共享连接池)，超过大小上限时放弃，返回base64字符串"""
+        logger.debug(f"[WX849] 开始下载图片, url={img_url}")
+        max_bytes = int(conf().get("wx849_image_download_max_mb", 20)) * 1024 * 1024
+        buffer = bytearray()
+        async with WechatAPI.transport.shared_session() as session:
+            async with session.get(img_url) as response:
+                response.raise_for_status()
+                if response.content_length and response.content_length > max_bytes:
+                    raise ValueError(f"图片大小 {response.content_length} 超过上限 {max_bytes}")
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    buffer.extend(chunk)
+                    if len(buffer) > max_bytes:
+                        raise ValueError(f"图片大小超过上限 {max_bytes}")
+        # 缩放和编码在线程池中进行，避免阻塞事件循环
+        return await asyncio.get_running_loop().run_in_executor(None, self._encode_image_payload, bytes(buffer))
+
+    @staticmethod
+    def _encode_image_payload(image_data):
+        """按 wx849_image_max_send_kb 压缩过大的图片，然后编码为base64"""
+        max_send = int(conf().get("wx849_image_max_send_kb", 0)) * 1024
+        if max_send and len(image_data) > max_send:
+            try:
+                image_data = _shrink_image(image_data, max_send)
+            except Exception as e:
+                logger.warning(f"[WX849] 压缩图片失败，发送原图: {e}")
+        return base64.b64encode(image_data).decode('utf-8')
+
+    async def _get_image_url_payload(self, img_url):
+        """获取网络图片的base64，短期内重复发送同一张图片时复用，并发请求只下载一次"""
+        now = time.monotonic()
+        cached = self._image_payloads.get(img_url)
+        if cached and cached[0] > now:
+            self._image_payloads.move_to_end(img_url)
+            return cached[1]
+        image_base64 = await self._image_flight.do(img_url, self._fetch_image_url, img_url)
+        ttl = conf().get("wx849_image_payload_ttl", 60)
+        if ttl:
+            self._image_payloads[img_url] = (time.monotonic() + ttl, image_base64)
+            self._image_payloads.move_to_end(img_url)
+            while len(self._image_payloads) > 16:
+                self._image_payloads.popitem(last=False)
+        return image_base64
+
+    async def _send_image_url(self, receiver, img_url, wait_turn):
+        """从网络下载图片并发送，下载过程不占用发送顺序"""
+        try:
+            image_base64 = await self._get_image_url_payload(img_url)
+        except Exception as e:
+            logger.error(f"[WX849] 下载图片失败: {img_url}, {e}")
+            return None
+        await wait_turn()
+        return await self._deliver(receiver, self._send_image_base64, receiver, image_base64)
+
+    async def _deliver(self, receiver, send_func, *args):
+        """经发送限速器调用发送接口，与 WechatAPI 的 send_*_message 共用同一组令牌桶"""
+        return await WechatAPI.governor.get_governor().submit(receiver, send_func, *args)
+
+    async def _send_in_order(self, receiver, send_coro_func):
+        """
+        按提交顺序向同一接收者发送消息
+        send_coro_func(wait_turn) 可以先完成下载、编码等准备工作，真正调用发送接口前 await wait_turn()，
+        这样多段回复的准备工作可以并发进行，而到达顺序保持不变
+        """
+        previous = self._send_tails.get(receiver)
+        turn = asyncio.get_running_loop().create_future()
+        self._send_tails[receiver] = turn
+
+        async def wait_turn():
+            if previous is not None:
+                # 本条发送被取消时不能连带取消前一条的完成标记
+                await asyncio.shield(previous)
+
+        def release(_=None):
+            if not turn.done():
+                turn.set_result(None)
+            if self._send_tails.get(receiver) is turn:
+                del self._send_tails[receiver]
+
+        try:
+            return await send_coro_func(wait_turn)
+        finally:
+            # send_coro_func 可能没有调用 wait_turn 就提前返回(如下载失败)或被取消，
+            # 此时要等前一条消息发送完成后再放行，否则后面的消息会抢在前一条之前发送
+            if previous is None or previous.done():
+                release()
+            else:
+                previous.add_done_callback(release)
+
+    def _submit(self, coro):
+        """将协程提交到通道的常驻事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
     def send(self, reply: Reply, context: Context):
-        """发送消息"""
+        """
+        发送消息
+        回复会提交到通道的常驻事件循环中异步发送，返回 concurrent.futures.Future，结果为API返回值，
+        发送失败(异常或API没有返回Success)时future抛出异常，由 ChatChannel._send 安排重试；
+        同一接收者的多条回复按调用顺序送达
+        """
         # 获取接收者ID
         receiver = context.get("receiver")
         if not receiver:
@@ -1703,110 +1429,85 @@ class WX849Channel(ChatChannel):
                 receiver = msg.from_user_id
         
         if not receiver:
-            logger.error("[WX849] 发送消息失败: 无法确定接收者ID")
-            return
-            
-        loop = asyncio.new_event_loop()
-        
-        if reply.type == ReplyType.TEXT:
-            reply.content = remove_markdown_symbol(reply.content)
-            result = loop.run_until_complete(self._send_message(receiver, reply.content))
-            if result and isinstance(result, dict) and result.get("Success", False):
-                logger.info(f"[WX849] 发送文本消息成功: 接收者: {receiver}")
-                if conf().get("log_level", "INFO") == "DEBUG":
-                    logger.debug(f"[WX849] 消息内容: {reply.content[:50]}...")
-            else:
-                logger.warning(f"[WX849] 发送文本消息可能失败: 接收者: {receiver}, 结果: {result}")
+            raise ValueError("[WX849] 发送消息失败: 无法确定接收者ID")
         
-        elif reply.type == ReplyType.ERROR or reply.type == ReplyType.INFO:
-            reply.content = remove_markdown_symbol(reply.content)
-            result = loop.run_until_complete(self._send_message(receiver, reply.content))
-            if result and isinstance(result, dict) and result.get("Success", False):
-                logger.info(f"[WX849] 发送消息成功: 接收者: {receiver}")
-                if conf().get("log_level", "INFO") == "DEBUG":
-                    logger.debug(f"[WX849] 消息内容: {reply.content[:50]}...")
-            else:
-                logger.warning(f"[WX849] 发送消息可能失败: 接收者: {receiver}, 结果: {result}")
+        if reply.type == ReplyType.TEXT or reply.type == ReplyType.ERROR or reply.type == ReplyType.INFO:
+            content = remove_markdown_symbol(reply.content)
+            reply.content = content
+            desc = "文本消息" if reply.type == ReplyType.TEXT else "消息"
+
+            async def send_func(wait_turn):
+                await wait_turn()
+                return await self._deliver(receiver, self._send_message, receiver, content)
         
         elif reply.type == ReplyType.IMAGE_URL:
             # 从网络下载图片并发送
             img_url = reply.content
-            logger.debug(f"[WX849] 开始下载图片, url={img_url}")
-            try:
-                pic_res = requests.get(img_url, stream=True)
-                # 使用临时文件保存图片
-                tmp_path = os.path.join(get_appdata_dir(), f"tmp_img_{int(time.time())}.png")
-                with open(tmp_path, 'wb') as f:
-                    for block in pic_res.iter_content(1024):
-                        f.write(block)
-                
-                # 使用我们的自定义方法发送图片
-                result = loop.run_until_complete(self._send_image(receiver, tmp_path))
-                
-                if result and isinstance(result, dict) and result.get("Success", False):
-                    logger.info(f"[WX849] 发送图片成功: 接收者: {receiver}")
-                else:
-                    logger.warning(f"[WX849] 发送图片可能失败: 接收者: {receiver}, 结果: {result}")
-                
-                # 删除临时文件
-                try:
-                    os.remove(tmp_path)
-                except Exception as e:
-                    logger.debug(f"[WX849] 删除临时图片文件失败: {e}")
-            except Exception as e:
-                logger.error(f"[WX849] 发送图片失败: {e}")
+            desc = "图片"
+
+            async def send_func(wait_turn):
+                return await self._send_image_url(receiver, img_url, wait_turn)
         
         elif reply.type == ReplyType.IMAGE: # 添加处理 ReplyType.IMAGE
-            image_input = reply.content
-            # 移除 os.path.exists 检查，交由 _send_image 处理
-            # 使用我们的自定义方法发送本地图片或BytesIO
-            result = loop.run_until_complete(self._send_image(receiver, image_input))
-            
-            if result and isinstance(result, dict) and result.get("Success", False):
-                logger.info(f"[WX849] 发送图片成功: 接收者: {receiver}")
-            else:
-                logger.warning(f"[WX849] 发送图片可能失败: 接收者: {receiver}, 结果: {result}")
+            # 在调用线程中读取并编码，调用方随后关闭或删除文件也不会影响发送
+            image_base64 = self._encode_image(reply.content)
+            if image_base64 is None:
+                raise ValueError(f"[WX849] 发送图片失败: 无法读取图片 {type(reply.content)}")
+            desc = "图片"
+
+            async def send_func(wait_turn):
+                await wait_turn()
+                return await self._deliver(receiver, self._send_image_base64, receiver, image_base64)
         
         else:
+            # 不支持的类型重试也不会成功，与 NotImplementedError 一样不重试
             logger.warning(f"[WX849] 不支持的回复类型: {reply.type}")
-        
-        loop.close() 
+            return
+
+        async def send_checked(wait_turn):
+            result = await send_func(wait_turn)
+            if not (result and isinstance(result, dict) and result.get("Success", False)):
+                raise RuntimeError(f"[WX849] 发送{desc}失败: 接收者: {receiver}, 结果: {result}")
+            return result
+
+        def on_done(future):
+            if future.cancelled() or future.exception() is not None:
+                # 失败由 ChatChannel._send 记录并安排重试
+                return
+            logger.info(f"[WX849] 发送{desc}成功: 接收者: {receiver}")
+            if reply.type != ReplyType.IMAGE and reply.type != ReplyType.IMAGE_URL and conf().get("log_level", "INFO") == "DEBUG":
+                logger.debug(f"[WX849] 消息内容: {reply.content[:50]}...")
+
+        future = self._submit(self._send_in_order(receiver, send_checked))
+        future.add_done_callback(on_done)
+        return future
+
+    async def _send_async(self, reply: Reply, context: Context):
+        """send 只是把发送任务提交到事件循环，异步流水线中直接调用，不经过发送线程池；本地图片需要读文件编码，放到线程池中"""
+        if reply.type == ReplyType.IMAGE:
+            await run_in_pool("send", self._send, reply, context)
+        else:
+            self._send(reply, context)
 
     async def _get_group_member_details(self, group_id):
-        """获取群成员详情"""
+        """获取群成员详情，同一个群的并发请求会被合并，所有调用方共享同一个结果"""
+        return await self._group_flight.do(("members", group_id), self._fetch_group_member_details, group_id)
+
+    def _refresh_group_members(self, group_id):
+        """在后台更新群成员详情，不等待结果"""
+        if self._group_flight.in_flight(("members", group_id)):
+            return
+        self._submit(self._get_group_member_details(group_id))
+
+    async def _fetch_group_member_details(self, group_id):
+        """从API获取群成员详情"""
         try:
             logger.debug(f"[WX849] 尝试获取群 {group_id} 的成员详情")
             
-            # 检查是否已存在群成员信息，并检查是否需要更新
-            # 定义群聊信息文件路径
-            tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-            if not os.path.exists(tmp_dir):
-                os.makedirs(tmp_dir)
-            
-            chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-            
-            # 读取现有的群聊信息（如果存在）
-            chatrooms_info = {}
-            if os.path.exists(chatrooms_file):
-                try:
-                    with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                        chatrooms_info = json.load(f)
-                    logger.debug(f"[WX849] 已加载 {len(chatrooms_info)} 个现有群聊信息")
-                except Exception as e:
-                    logger.error(f"[WX849] 加载现有群聊信息失败: {str(e)}")
-            
-            # 检查该群聊是否已存在且成员信息是否已更新
-            # 设定缓存有效期为24小时(86400秒)
-            cache_expiry = 86400
-            current_time = int(time.time())
-            
-            if (group_id in chatrooms_info and 
-                "members" in chatrooms_info[group_id] and 
-                len(chatrooms_info[group_id]["members"]) > 0 and
-                "last_update" in chatrooms_info[group_id] and
-                current_time - chatrooms_info[group_id]["last_update"] < cache_expiry):
+            # 检查该群聊是否已存在且成员信息未过期
+            if self.rooms.is_fresh(group_id, require_members=True):
                 logger.debug(f"[WX849] 群 {group_id} 成员信息已存在且未过期，跳过更新")
-                return chatrooms_info[group_id]
+                return self.rooms.get_room(group_id)
             
             logger.debug(f"[WX849] 群 {group_id} 成员信息不存在或已过期，开始更新")
             
@@ -1853,16 +1554,6 @@ class WX849Channel(ChatChannel):
                     logger.error(f"[WX849] 获取群成员详情失败: 响应中无NewChatroomData")
                     return None
                 
-                # 检查当前群聊是否已存在
-                if group_id not in chatrooms_info:
-                    chatrooms_info[group_id] = {
-                        "chatroomId": group_id,
-                        "nickName": group_id,
-                        "chatRoomOwner": "",
-                        "members": [],
-                        "last_update": int(time.time())
-                    }
-                
                 # 提取成员信息
                 member_count = new_chatroom_data.get("MemberCount", 0)
                 chat_room_members = new_chatroom_data.get("ChatRoomMember", [])
@@ -1891,20 +1582,8 @@ class WX849Channel(ChatChannel):
                     
                     members.append(member_info)
                 
-                # 更新群聊信息
-                chatrooms_info[group_id]["members"] = members
-                chatrooms_info[group_id]["last_update"] = int(time.time())
-                chatrooms_info[group_id]["memberCount"] = member_count
-                
-                # 同时更新群主信息
-                for member in members:
-                    if member.get("ChatroomMemberFlag") == 2049:  # 群主标志
-                        chatrooms_info[group_id]["chatRoomOwner"] = member.get("UserName", "")
-                        break
-                
-                # 保存到文件
-                with open(chatrooms_file, 'w', encoding='utf-8') as f:
-                    json.dump(chatrooms_info, f, ensure_ascii=False, indent=2)
+                # 更新群聊信息，由群聊目录负责写回文件
+                self.rooms.set_members(group_id, members, member_count)
                 
                 logger.info(f"[WX849] 已更新群聊 {group_id} 成员信息，成员数: {len(members)}")
                 
@@ -1920,94 +1599,46 @@ class WX849Channel(ChatChannel):
             return None
 
     async def _get_group_name(self, group_id):
+        """获取群名称，同一个群的并发请求会被合并"""
+        return await self._group_flight.do(("name", group_id), self._fetch_group_name, group_id)
+
+    async def _fetch_group_name(self, group_id):
         """获取群名称"""
         try:
             logger.debug(f"[WX849] 尝试获取群 {group_id} 的名称")
             
             # 检查缓存中是否有群名
             cache_key = f"group_name_{group_id}"
-            if hasattr(self, "group_name_cache") and cache_key in self.group_name_cache:
+            if cache_key in self.group_name_cache:
                 cached_name = self.group_name_cache[cache_key]
                 logger.debug(f"[WX849] 从缓存中获取群名: {cached_name}")
                 
-                # 检查是否需要更新群成员详情
-                tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-                chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-                
-                need_update = True
-                # 设定缓存有效期为24小时(86400秒)
-                cache_expiry = 86400
-                current_time = int(time.time())
-                
-                if os.path.exists(chatrooms_file):
-                    try:
-                        with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                            chatrooms_info = json.load(f)
-                        
-                        # 检查群信息是否存在且未过期
-                        if (group_id in chatrooms_info and 
-                            "last_update" in chatrooms_info[group_id] and 
-                            current_time - chatrooms_info[group_id]["last_update"] < cache_expiry and
-                            "members" in chatrooms_info[group_id] and 
-                            len(chatrooms_info[group_id]["members"]) > 0):
-                            logger.debug(f"[WX849] 群 {group_id} 信息已存在且未过期，跳过更新")
-                            need_update = False
-                    except Exception as e:
-                        logger.error(f"[WX849] 检查群信息缓存时出错: {e}")
+                # 检查群信息是否存在且未过期
+                need_update = not self.rooms.is_fresh(group_id, require_members=True)
                 
                 # 只有需要更新时才启动线程获取群成员详情
                 if need_update:
-                    logger.debug(f"[WX849] 群 {group_id} 信息需要更新，启动更新线程")
-                    threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+                    logger.debug(f"[WX849] 群 {group_id} 信息需要更新，后台更新群成员详情")
+                    self._refresh_group_members(group_id)
                 
                 return cached_name
             
-            # 检查文件中是否已经有群信息，且未过期
-            tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-            if not os.path.exists(tmp_dir):
-                os.makedirs(tmp_dir)
-            
-            chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-            
-            # 设定缓存有效期为24小时(86400秒)
-            cache_expiry = 86400
-            current_time = int(time.time())
-            
-            if os.path.exists(chatrooms_file):
-                try:
-                    with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                        chatrooms_info = json.load(f)
-                    
-                    # 检查群信息是否存在且未过期
-                    if (group_id in chatrooms_info and 
-                        "nickName" in chatrooms_info[group_id] and
-                        chatrooms_info[group_id]["nickName"] and
-                        chatrooms_info[group_id]["nickName"] != group_id and
-                        "last_update" in chatrooms_info[group_id] and 
-                        current_time - chatrooms_info[group_id]["last_update"] < cache_expiry):
-                        
-                        # 从文件中获取群名
-                        group_name = chatrooms_info[group_id]["nickName"]
-                        logger.debug(f"[WX849] 从文件缓存中获取群名: {group_name}")
-                        
-                        # 缓存群名
-                        if not hasattr(self, "group_name_cache"):
-                            self.group_name_cache = {}
-                        self.group_name_cache[cache_key] = group_name
-                        
-                        # 检查是否需要更新群成员详情
-                        need_update_members = not ("members" in chatrooms_info[group_id] and 
-                                                len(chatrooms_info[group_id]["members"]) > 0)
-                        
-                        if need_update_members:
-                            logger.debug(f"[WX849] 群 {group_id} 名称已缓存，但需要更新成员信息")
-                            threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
-                        else:
-                            logger.debug(f"[WX849] 群 {group_id} 信息已完整且未过期，无需更新")
-                        
-                        return group_name
-                except Exception as e:
-                    logger.error(f"[WX849] 从文件获取群名出错: {e}")
+            # 检查群聊目录中是否已经有群信息，且未过期
+            group_name = self.rooms.get_group_name(group_id)
+            if group_name and self.rooms.is_fresh(group_id):
+                logger.debug(f"[WX849] 从文件缓存中获取群名: {group_name}")
+                
+                # 缓存群名
+                self.group_name_cache[cache_key] = group_name
+                
+                # 检查是否需要更新群成员详情
+                if not self.rooms.has_members(group_id):
+                    logger.debug(f"[WX849] 群 {group_id} 名称已缓存，但需要更新成员信息")
+                    self._refresh_group_members(group_id)
+                else:
+                    logger.debug(f"[WX849] 群 {group_id} 信息已完整且未过期，无需更新")
+                
+                return group_name
             
             logger.debug(f"[WX849] 群 {group_id} 信息不存在或已过期，需要从API获取")
             
@@ -2037,18 +1668,8 @@ class WX849Channel(ChatChannel):
                 # 尝试使用群聊专用API
                 group_info = await self._call_api("/Group/GetChatRoomInfo", params)
                 
-                # 保存群聊详情到统一的JSON文件
+                # 保存群聊详情到群聊目录
                 try:
-                    # 读取现有的群聊信息（如果存在）
-                    chatrooms_info = {}
-                    if os.path.exists(chatrooms_file):
-                        try:
-                            with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                                chatrooms_info = json.load(f)
-                            logger.debug(f"[WX849] 已加载 {len(chatrooms_info)} 个现有群聊信息")
-                        except Exception as e:
-                            logger.error(f"[WX849] 加载现有群聊信息失败: {str(e)}")
-                    
                     # 提取必要的群聊信息
                     if group_info and isinstance(group_info, dict):
                         # 递归函数用于查找特定key的值
@@ -2109,38 +1730,17 @@ class WX849Channel(ChatChannel):
                                 if owner_id:
                                     break
                         
-                        # 检查群聊信息是否已存在
-                        if group_id in chatrooms_info:
-                            # 更新已有群聊信息
-                            if group_name:
-                                chatrooms_info[group_id]["nickName"] = group_name
-                            if owner_id:
-                                chatrooms_info[group_id]["chatRoomOwner"] = owner_id
-                            chatrooms_info[group_id]["last_update"] = int(time.time())
-                        else:
-                            # 创建新群聊信息
-                            chatrooms_info[group_id] = {
-                                "chatroomId": group_id,
-                                "nickName": group_name or group_id,
-                                "chatRoomOwner": owner_id or "",
-                                "members": [],
-                                "last_update": int(time.time())
-                            }
-                        
-                        # 保存到文件
-                        with open(chatrooms_file, 'w', encoding='utf-8') as f:
-                            json.dump(chatrooms_info, f, ensure_ascii=False, indent=2)
+                        # 更新或创建群聊信息，由群聊目录负责写回文件
+                        self.rooms.update_room(group_id, nick_name=group_name, owner=owner_id)
                         
                         logger.info(f"[WX849] 已更新群聊 {group_id} 基础信息")
                         
                         # 缓存群名
                         if group_name:
-                            if not hasattr(self, "group_name_cache"):
-                                self.group_name_cache = {}
                             self.group_name_cache[cache_key] = group_name
                             
                             # 异步获取群成员详情（不阻塞当前方法）
-                            threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+                            self._refresh_group_members(group_id)
                             
                             return group_name
                     
@@ -2167,12 +1767,10 @@ class WX849Channel(ChatChannel):
                         logger.debug(f"[WX849] 获取到群名称: {group_name}")
                         
                         # 缓存群名
-                        if not hasattr(self, "group_name_cache"):
-                            self.group_name_cache = {}
                         self.group_name_cache[cache_key] = group_name
                         
                         # 异步获取群成员详情
-                        threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+                        self._refresh_group_members(group_id)
                         
                         return group_name
                     else:
@@ -2188,12 +1786,10 @@ class WX849Channel(ChatChannel):
             # 如果无法获取群名，使用群ID作为名称
             logger.debug(f"[WX849] 无法获取群名称，使用群ID代替: {group_id}")
             # 缓存结果
-            if not hasattr(self, "group_name_cache"):
-                self.group_name_cache = {}
             self.group_name_cache[cache_key] = group_id
             
             # 尽管获取群名失败，仍然尝试获取群成员详情
-            threading.Thread(target=lambda: asyncio.run(self._get_group_member_details(group_id))).start()
+            self._refresh_group_members(group_id)
             
             return group_id
         except Exception as e:
@@ -2201,6 +1797,7 @@ class WX849Channel(ChatChannel):
             logger.error(f"[WX849] 详细错误: {traceback.format_exc()}")
             return group_id
 
+    @timed_stage("compose")
     def _compose_context(self, ctype: ContextType, content, **kwargs):
         """重写父类方法，构建消息上下文"""
         try:
@@ -2229,7 +1826,6 @@ class WX849Channel(ChatChannel):
                 context["session_id"] = msg.other_user_id or msg.from_user_id
                 
                 # 启动异步任务获取群名称并更新
-                loop = asyncio.get_event_loop()
                 try:
                     # 尝试创建异步任务获取群名
                     async def update_group_name():
@@ -2241,15 +1837,8 @@ class WX849Channel(ChatChannel):
                         except Exception as e:
                             logger.error(f"[WX849] 更新群名称失败: {e}")
                     
-                    # 使用已有事件循环运行更新任务
-                    def run_async_task():
-                        try:
-                            asyncio.run(update_group_name())
-                        except Exception as e:
-                            logger.error(f"[WX849] 异步获取群名称任务失败: {e}")
-                    
-                    # 启动线程执行异步任务
-                    threading.Thread(target=run_async_task).start()
+                    # 在通道事件循环中执行，同一个群的并发查询会被合并
+                    self._submit(update_group_name())
                 except Exception as e:
                     logger.error(f"[WX849] 创建获取群名称任务失败: {e}")
             else:
@@ -2285,45 +1874,20 @@ class WX849Channel(ChatChannel):
             return member_wxid
             
         try:
-            # 优先从缓存获取群成员信息
-            tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp")
-            chatrooms_file = os.path.join(tmp_dir, 'wx849_rooms.json')
-            
-            if os.path.exists(chatrooms_file):
-                with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                    chatrooms_info = json.load(f)
-                
-                if group_id in chatrooms_info and "members" in chatrooms_info[group_id]:
-                    for member in chatrooms_info[group_id]["members"]:
-                        if member.get("UserName") == member_wxid:
-                            # 优先使用群内显示名称(群昵称)
-                            if member.get("DisplayName"):
-                                logger.debug(f"[WX849] 获取到成员 {member_wxid} 的群昵称: {member.get('DisplayName')}")
-                                return member.get("DisplayName")
-                            # 其次使用成员昵称
-                            elif member.get("NickName"):
-                                logger.debug(f"[WX849] 获取到成员 {member_wxid} 的昵称: {member.get('NickName')}")
-                                return member.get("NickName")
+            # 优先从群聊目录获取群成员昵称
+            nickname = self.rooms.get_member_nickname(group_id, member_wxid)
+            if nickname:
+                logger.debug(f"[WX849] 获取到成员 {member_wxid} 的昵称: {nickname}")
+                return nickname
             
             # 如果缓存中没有，尝试更新群成员信息
             await self._get_group_member_details(group_id)
             
-            # 再次尝试从更新后的缓存中获取
-            if os.path.exists(chatrooms_file):
-                with open(chatrooms_file, 'r', encoding='utf-8') as f:
-                    chatrooms_info = json.load(f)
-                
-                if group_id in chatrooms_info and "members" in chatrooms_info[group_id]:
-                    for member in chatrooms_info[group_id]["members"]:
-                        if member.get("UserName") == member_wxid:
-                            # 优先使用群内显示名称
-                            if member.get("DisplayName"):
-                                logger.debug(f"[WX849] 更新后获取到成员 {member_wxid} 的群昵称: {member.get('DisplayName')}")
-                                return member.get("DisplayName")
-                            # 其次使用成员昵称
-                            elif member.get("NickName"):
-                                logger.debug(f"[WX849] 更新后获取到成员 {member_wxid} 的昵称: {member.get('NickName')}")
-                                return member.get("NickName")
+            # 再次尝试从更新后的群聊目录中获取
+            nickname = self.rooms.get_member_nickname(group_id, member_wxid)
+            if nickname:
+                logger.debug(f"[WX849] 更新后获取到成员 {member_wxid} 的昵称: {nickname}")
+                return nickname
         except Exception as e:
             logger.error(f"[WX849] 获取群成员昵称出错: {e}")
         
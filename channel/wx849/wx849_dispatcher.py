@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from channel.wx849.wx849_parser import _string_value, chatroom_id
+from common.log import logger
+from common.metrics import metrics
+from config import conf
+
+# 每批消息条数的分桶
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def conversation_id(msg, self_wxid=None):
+    """
+    从原始消息中取会话ID：群消息为群ID，私聊为对方wxid
+    """
+    group_id = chatroom_id(msg)
+    if group_id:
+        return group_id
+    from_user = _string_value(msg.get("fromUserName", msg.get("FromUserName", "")))
+    to_user = _string_value(msg.get("toUserName", msg.get("ToUserName", "")))
+    if self_wxid and from_user == self_wxid:
+        return to_user
+    return from_user
+
+
+class MessageDispatcher(object):
+    """
+    消息分发器
+
+    将一批拉取到的消息按会话拆分：同一会话内的消息按到达顺序串行处理(跨批次也保持顺序)，
+    不同会话的消息在线程池中并行处理，避免一个繁忙的群阻塞其他会话。
+    """
+
+    def __init__(self, handler, self_wxid_func=None, max_workers=None):
+        """
+        :param handler: 处理单条原始消息的函数 handler(msg)
+        :param self_wxid_func: 返回机器人自身wxid的函数，用于确定私聊的会话ID
+        :param max_workers: 并行处理的会话数上限
+        """
+        self.handler = handler
+        self.self_wxid_func = self_wxid_func
+        max_workers = max_workers or conf().get("wx849_dispatch_workers", 4)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wx849-dispatch")
+        self._lock = threading.Lock()
+        self._queues = {}  # 会话ID -> 待处理消息队列，存在即表示该会话正在被某个线程处理
+
+        self._batch_size = metrics.histogram("wx849_dispatch_batch_size", buckets=BATCH_SIZE_BUCKETS, doc="每次拉取到的消息条数")
+        self._batch_conversations = metrics.histogram("wx849_dispatch_batch_conversations", buckets=BATCH_SIZE_BUCKETS, doc="每批消息涉及的会话数")
+        self._queue_wait = metrics.histogram("wx849_dispatch_wait_seconds", doc="消息从拉取到开始处理的等待时间")
+        self._handle_time = metrics.histogram("wx849_dispatch_handle_seconds", doc="单条消息的处理耗时")
+        self._active = metrics.gauge("wx849_dispatch_active_conversations", doc="正在处理的会话数")
+
+    def dispatch(self, messages):
+        """分发一批消息，立即返回"""
+        if not messages:
+            return
+        self_wxid = self.self_wxid_func() if self.self_wxid_func else None
+        batches = {}
+        for msg in messages:
+            batches.setdefault(conversation_id(msg, self_wxid), []).append(msg)
+        self._batch_size.observe(len(messages))
+        self._batch_conversations.observe(len(batches))
+
+        now = time.monotonic()
+        with self._lock:
+            for conv_id, msgs in batches.items():
+                queue = self._queues.get(conv_id)
+                if queue is not None:
+                    # 该会话正在处理中，追加到队列末尾，由当前线程继续处理
+                    queue.extend((msg, now) for msg in msgs)
+                    continue
+                self._queues[conv_id] = deque((msg, now) for msg in msgs)
+                self._active.inc()
+                self._pool.submit(self._drain, conv_id)
+
+    def _drain(self, conv_id):
+        while True:
+            with self._lock:
+                queue = self._queues[conv_id]
+                if not queue:
+                    del self._queues[conv_id]
+                    self._active.dec()
+                    return
+                msg, enqueue_time = queue.popleft()
+            start = time.monotonic()
+            self._queue_wait.observe(start - enqueue_time)
+            try:
+                self.handler(msg)
+            except Exception as e:
+                logger.exception(f"[WX849] 处理消息出错: {e}")
+            self._handle_time.observe(time.monotonic() - start)
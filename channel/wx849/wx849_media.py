@@ -0,0 +1,171 @@
+import asyncio
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from common.log import logger
+from common.metrics import metrics
+from common.singleflight import AsyncSingleFlight
+from common.tmp_dir import TmpDir
+from config import conf
+
+
+def content_key(*parts):
+    """没有内容md5时(如语音)，用来源标识计算缓存key"""
+    return hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class MediaCache(object):
+    """
+    按内容哈希寻址的媒体磁盘缓存
+
+    文件名为 "<md5><扩展名>"，同一张图片/表情被转发多次只下载和解码一次；
+    总大小超过配额时按最近访问时间淘汰；同一文件的并发下载会合并为一次请求。
+    fetch 只能在一个事件循环中调用(通道的常驻事件循环)，其余方法线程安全。
+    缓存目录在第一次写入时才创建，默认位于 TmpDir() 下的 wx849_media。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or conf().get("wx849_media_cache_dir") or os.path.join(TmpDir.tmpFilePath, "wx849_media")
+        if max_bytes is None:
+            max_bytes = int(conf().get("wx849_media_cache_max_mb", 512)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 文件名 -> 大小，按访问时间从旧到新
+        self._total = 0
+        self._flight = AsyncSingleFlight("wx849_media")
+
+        self._bytes = metrics.gauge("wx849_media_cache_bytes", doc="媒体缓存占用的磁盘空间")
+        self._evictions = metrics.counter("wx849_media_cache_evictions_total", doc="因超出配额被淘汰的缓存文件数")
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.cache_dir):
+            # 还没有写入过缓存
+            return
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+        self._bytes.set(self._total)
+        self._evict()
+        logger.debug(f"[WX849] 媒体缓存已加载: {len(self._entries)} 个文件, {self._total / 1024 / 1024:.1f}MB")
+
+    def path(self, key, ext=""):
+        return os.path.join(self.cache_dir, f"{key}{ext}")
+
+    def lookup(self, key, ext=""):
+        """查询缓存，命中时返回文件路径并更新访问顺序，否则返回None"""
+        name = f"{key}{ext}"
+        with self._lock:
+            hit = name in self._entries
+            if hit:
+                self._entries.move_to_end(name)
+        path = self.path(key, ext)
+        if hit and os.path.exists(path):
+            try:
+                # 更新mtime，重启后仍能按访问顺序淘汰
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+        if hit:
+            # 文件被外部删除
+            self._remove(name)
+        return None
+
+    async def fetch(self, kind, key, ext, fetch_func):
+        """
+        获取媒体文件路径，未命中时调用 fetch_func 下载
+        :param kind: 媒体类型(image/voice/video/emoji)，用于统计命中率
+        :param key: 内容md5
+        :param ext: 文件扩展名
+        :param fetch_func: 协程函数，返回文件内容(bytes)或base64字符串
+        :return: 缓存文件路径
+        """
+        path = self.lookup(key, ext)
+        if path:
+            metrics.counter("wx849_media_cache_hits_total", labels={"kind": kind}, doc="媒体缓存命中次数").inc()
+            return path
+        metrics.counter("wx849_media_cache_misses_total", labels={"kind": kind}, doc="媒体缓存未命中次数").inc()
+        return await self._flight.do(f"{key}{ext}", self._download, key, ext, fetch_func)
+
+    async def _download(self, key, ext, fetch_func):
+        data = await fetch_func()
+        if not data:
+            raise ValueError(f"媒体下载结果为空: {key}{ext}")
+        # base64解码和写盘放到线程池，避免阻塞事件循环
+        return await asyncio.get_running_loop().run_in_executor(None, self.store, key, ext, data)
+
+    def store(self, key, ext, data):
+        """写入缓存文件(原子替换)，返回文件路径"""
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key, ext)
+        fd, tmp_path = tempfile.mkstemp(prefix=".wx849_media.", suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        name = f"{key}{ext}"
+        with self._lock:
+            self._total += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+        self._evict(keep=name)
+        return path
+
+    def _remove(self, name):
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is None:
+                return
+            self._total -= size
+        self._bytes.set(self._total)
+
+    def _evict(self, keep=None):
+        removed = []
+        with self._lock:
+            # keep 是刚写入的文件(位于末尾)，即使单个文件超过配额也保留
+            while self._total > self.max_bytes and len(self._entries) > (1 if keep else 0):
+                name, size = self._entries.popitem(last=False)
+                self._total -= size
+                removed.append(name)
+        self._bytes.set(self._total)
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            self._evictions.inc()
+
+    def materialize(self, cache_path, dest_path):
+        """
+        把缓存文件放到消息的 content 路径：优先硬链接，失败时复制。
+        下游处理完会删除 content 文件(如语音识别)，不能直接使用缓存文件。
+        """
+        if os.path.exists(dest_path):
+            return dest_path
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        try:
+            os.link(cache_path, dest_path)
+        except OSError:
+            shutil.copyfile(cache_path, dest_path)
+        return dest_path
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
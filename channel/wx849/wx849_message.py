@@ -1,11 +1,11 @@
 import os
 import time
 import json
-import xml.etree.ElementTree as ET
 from typing import Dict, Any
 
 from bridge.context import ContextType
 from channel.chat_message import ChatMessage
+from channel.wx849.wx849_parser import _string_value, parse_message
 from config import conf
 
 class WX849Message(ChatMessage):
@@ -44,27 +44,13 @@ class WX849Message(ChatMessage):
         self.actual_user_id = ""    # 实际发送者ID
         self.actual_user_nickname = "" # 实际发送者昵称
         
-        # 尝试从MsgSource中提取机器人在群内的昵称
-        try:
-            msg_source = msg.get("MsgSource", "")
-            if msg_source and ("<msgsource>" in msg_source.lower() or msg_source.startswith("<")):
-                root = ET.fromstring(msg_source if "<msgsource>" in msg_source.lower() else f"<msgsource>{msg_source}</msgsource>")
-                
-                # 查找displayname或其他可能包含群昵称的字段
-                for tag in ["selfDisplayName", "displayname", "nickname"]:
-                    elem = root.find(f".//{tag}")
-                    if elem is not None and elem.text:
-                        self.self_display_name = elem.text
-                        break
-        except Exception as e:
-            # 解析失败，保持为空字符串
-            pass
+        # 单遍解析：发送者、@列表、机器人群昵称、XML属性
+        self.parsed = parse_message(msg, self.content, self.from_user_id, is_group)
+        self.self_display_name = self.parsed.self_display_name
     
     def _get_string_value(self, value):
         """确保值为字符串类型"""
-        if isinstance(value, dict):
-            return value.get("string", "")
-        return str(value) if value is not None else ""
+        return _string_value(value)
     
     # 以下是公开接口方法，提供给外部使用
     def get_content(self):
@@ -0,0 +1,249 @@
+"""
+WX849 原始消息的单遍解析
+
+一次扫描取出发送者、@列表、机器人群昵称以及 XML 内容中媒体元素的属性(aeskey/md5/voiceurl/length 等)
+和常用子元素(fromusername、appmsg type)，避免同一段内容被多次 split 和 ET.fromstring。
+"""
+import html
+import re
+
+# MsgSource 中关心的元素
+_MSG_SOURCE_RE = re.compile(
+    r"<(atuserlist|selfDisplayName|displayname|nickname|username|alias|fromusername)>"
+    r"\s*(?:<!\[CDATA\[)?(.*?)(?:\]\]>)?\s*</\1>",
+    re.S,
+)
+
+# 消息内容(XML)中携带媒体属性的主元素，只需要扫描这一个标签的属性
+_MEDIA_TAG_RE = re.compile(r"<(img|voicemsg|videomsg|emoji|appmsg|pat)\b([^>]*)>")
+_ATTR_RE = re.compile(r"([A-Za-z_][\w-]*)\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+_ATTR_NAME_RE = re.compile(r"^[A-Za-z_][\w-]*$")
+# 消息内容(XML)中关心的子元素
+_CONTENT_ELEMENTS = ("fromusername", "type")
+
+# 机器人群昵称的取值优先级
+_SELF_NAME_TAGS = ("selfDisplayName", "displayname", "nickname")
+# <msg> XML中可能包含发送者的元素，按优先级排列
+_CONTENT_SENDER_TAGS = ("username", "fromusername", "sender", "from")
+# MsgSource 中可能包含发送者的元素
+_SOURCE_SENDER_TAGS = ("username", "alias", "fromusername")
+# 原始消息中可能包含发送者/@列表的字段
+_SENDER_FIELDS = ("SenderUserName", "sender", "senderId", "fromUser")
+_AT_FIELDS = ("AtUserList", "at_list", "atlist")
+
+
+class ParsedMessage(object):
+    """解析结果"""
+
+    __slots__ = ("is_group", "sender_wxid", "body", "at_list", "self_display_name", "elements", "_attr_text", "_attrs")
+
+    def __init__(self):
+        self.is_group = False
+        self.sender_wxid = ""  # 群消息的实际发送者，无法确定时为空
+        self.body = ""  # 去掉 "wxid:\n" 前缀后的消息内容
+        self.at_list = []  # 被@的wxid列表
+        self.self_display_name = ""  # 机器人在群内的昵称
+        self.elements = {}  # 消息XML的主元素名(tag)以及 fromusername/type 子元素，取第一次出现的值
+        self._attr_text = ""  # 主元素的属性原文，首次访问 attrs 时才解析
+        self._attrs = None
+
+    @property
+    def attrs(self):
+        """消息XML主元素(img/voicemsg/videomsg/emoji等)的属性"""
+        if self._attrs is None:
+            self._attrs = _parse_attrs(self._attr_text)
+        return self._attrs
+
+    @property
+    def app_type(self):
+        """appmsg 的子类型(type元素)，不存在时为None"""
+        return self.elements.get("type")
+
+    def attr(self, name, default=None):
+        return self.attrs.get(name, default)
+
+
+def _unescape(value):
+    return html.unescape(value) if "&" in value else value
+
+
+def _parse_attrs(text):
+    """解析 name="value" 形式的属性串"""
+    if not text:
+        return {}
+    attrs = {}
+    if "'" not in text:
+        # 常见情况：全部是双引号属性，按引号切分比正则快
+        parts = text.split('"')
+        for i in range(0, len(parts) - 1, 2):
+            name = parts[i].strip()
+            if not name.endswith("="):
+                break
+            name = name[:-1].rstrip()
+            if _ATTR_NAME_RE.match(name) and name not in attrs:
+                attrs[name] = _unescape(parts[i + 1])
+        else:
+            return attrs
+        attrs = {}
+    for m in _ATTR_RE.finditer(text):
+        name = m.group(1)
+        if name not in attrs:
+            value = m.group(2) if m.group(2) is not None else m.group(3)
+            attrs[name] = _unescape(value)
+    return attrs
+
+
+def _find_element(text, tag):
+    """取第一个 <tag>...</tag> 的文本(去掉CDATA)，不存在时返回None"""
+    start = text.find(f"<{tag}>")
+    if start < 0:
+        return None
+    start += len(tag) + 2
+    end = text.find(f"</{tag}>", start)
+    if end < 0:
+        return None
+    value = text[start:end].strip()
+    if value.startswith("<![CDATA[") and value.endswith("]]>"):
+        value = value[9:-3]
+    return _unescape(value)
+
+
+def _is_msg_xml(content):
+    """内容是否为根元素为 <msg> 的XML(允许有 <?xml ...?> 声明)"""
+    text = content.lstrip()
+    if text.startswith("<?xml"):
+        end = text.find("?>")
+        text = text[end + 2:].lstrip() if end > 0 else ""
+    return text.startswith("<msg>") or text.startswith("<msg ")
+
+
+def _string_value(value):
+    """原始消息的字段可能是字符串，也可能是 {"string": ...}，统一取为字符串"""
+    if isinstance(value, dict):
+        return value.get("string", "")
+    return str(value) if value is not None else ""
+
+
+def chatroom_id(msg):
+    """原始消息所属的群ID：roomId，或以@chatroom结尾的发送方/接收方，不是群消息时返回空字符串"""
+    room_id = _string_value(msg.get("roomId"))
+    if room_id:
+        return room_id
+    from_user = _string_value(msg.get("fromUserName", msg.get("FromUserName", "")))
+    if from_user.endswith("@chatroom"):
+        return from_user
+    to_user = _string_value(msg.get("toUserName", msg.get("ToUserName", "")))
+    if to_user.endswith("@chatroom"):
+        return to_user
+    return ""
+
+
+def is_group_message(msg):
+    """根据原始消息判断是否为群消息：roomId，或发送方/接收方为群ID"""
+    return bool(chatroom_id(msg))
+
+
+def source_self_name(msg):
+    """MsgSource 中机器人的群昵称，与 parse_message 的 self_display_name 取值一致，没有时返回空字符串"""
+    msg_source = msg.get("MsgSource", "")
+    if not msg_source or not isinstance(msg_source, str):
+        return ""
+    for tag in _SELF_NAME_TAGS:
+        value = _find_element(msg_source, tag)
+        if value:
+            return value.strip()
+    return ""
+
+
+def split_sender(content):
+    """拆分 "wxid:\\n内容" 或 "wxid:内容"，返回 (发送者, 内容)，无法拆分时发送者为空"""
+    if not content or content[0] == "<":
+        return "", content
+    idx = content.find(":\n")
+    if idx > 0:
+        return content[:idx], content[idx + 2:]
+    idx = content.find(":")
+    if idx > 0:
+        return content[:idx], content[idx + 1:]
+    return "", content
+
+
+def parse_message(msg, content, from_user_id="", is_group=False):
+    """
+    解析一条原始消息
+    :param msg: 原始消息字典
+    :param content: 消息内容字符串
+    :param from_user_id: 消息来源ID(群消息为群ID)
+    :param is_group: 是否已识别为群消息
+    :return: ParsedMessage
+    """
+    result = ParsedMessage()
+    result.is_group = bool(is_group or (from_user_id and from_user_id.endswith("@chatroom")))
+    content = content or ""
+
+    # 1. 群消息内容前的发送者前缀
+    if result.is_group:
+        sender, body = split_sender(content)
+        if sender and "<" not in sender:
+            result.sender_wxid = sender
+            content = body
+    result.body = content
+
+    # 2. 消息XML：定位媒体主元素(属性按需解析)，子元素用字符串查找
+    if content.lstrip().startswith("<"):
+        m = _MEDIA_TAG_RE.search(content)
+        if m:
+            result.elements["tag"] = m.group(1)
+            result._attr_text = m.group(2)
+        for tag in _CONTENT_ELEMENTS:
+            value = _find_element(content, tag)
+            if value is not None:
+                result.elements[tag] = value
+
+    # 3. MsgSource：@列表、机器人群昵称、发送者
+    source = {}
+    msg_source = msg.get("MsgSource", "") if msg else ""
+    if msg_source and isinstance(msg_source, str) and "<" in msg_source:
+        for m in _MSG_SOURCE_RE.finditer(msg_source):
+            source.setdefault(m.group(1), m.group(2))
+    atuserlist = source.get("atuserlist")
+    if atuserlist:
+        result.at_list = [x for x in atuserlist.strip(",").split(",") if x]
+    for tag in _SELF_NAME_TAGS:
+        if source.get(tag):
+            result.self_display_name = source[tag]
+            break
+
+    if msg:
+        if not result.at_list:
+            for key in _AT_FIELDS:
+                at_value = msg.get(key)
+                if isinstance(at_value, list):
+                    result.at_list = [str(x) for x in at_value if x]
+                elif isinstance(at_value, str):
+                    result.at_list = [x for x in at_value.strip(",").split(",") if x]
+                if result.at_list:
+                    break
+
+    # 4. 前缀中没有发送者时的兜底：<msg> XML中的username/fromusername等元素、主元素的fromusername属性、MsgSource、消息字段
+    if result.is_group and not result.sender_wxid:
+        sender = None
+        if _is_msg_xml(content):
+            for tag in _CONTENT_SENDER_TAGS:
+                sender = result.elements.get(tag) or _find_element(content, tag)
+                if sender:
+                    break
+        sender = sender or result.attrs.get("fromusername")
+        if not sender:
+            for tag in _SOURCE_SENDER_TAGS:
+                if source.get(tag):
+                    sender = source[tag]
+                    break
+        if not sender and msg:
+            for key in _SENDER_FIELDS:
+                if msg.get(key):
+                    sender = _string_value(msg[key])
+                    break
+        if sender and "<" not in sender:
+            result.sender_wxid = sender
+    return result
@@ -0,0 +1,105 @@
+import random
+
+from common.log import logger
+from common.metrics import metrics
+from config import conf
+
+SYNC_MODE_AUTO = "auto"  # 根据服务端行为自动判断是否为长轮询
+SYNC_MODE_LONGPOLL = "longpoll"  # 服务端 /Msg/Sync 会挂起请求直到有新消息
+SYNC_MODE_POLL = "poll"  # 普通轮询，只使用自适应间隔
+
+LONGPOLL_CONFIRM_POLLS = 3  # 连续多少次空请求被服务端挂起后才认为支持长轮询
+LONGPOLL_RELEASE_POLLS = 5  # 识别为长轮询后，连续多少次空请求没有被挂起时退回自适应轮询
+
+
+class AdaptivePoller(object):
+    """
+    /Msg/Sync 拉取节奏控制
+
+    - 长轮询：服务端挂起请求等待新消息时，返回后立即发起下一次请求
+    - 自适应轮询：有消息时使用最小间隔，空闲且请求没有被挂起时指数退避并加入随机抖动
+    - auto 模式下连续多次空请求都被挂起才切换为长轮询，连续多次没有被挂起时再切换回来，避免偶发的慢请求导致空转
+    - 出错时按错误退避间隔重试
+    """
+
+    def __init__(self, mode=None, min_interval=None, max_interval=None, error_max_interval=None, longpoll_threshold=None):
+        self.mode = mode or conf().get("wx849_sync_mode", SYNC_MODE_AUTO)
+        self.min_interval = min_interval if min_interval is not None else conf().get("wx849_poll_min_interval", 0.1)
+        self.max_interval = max_interval if max_interval is not None else conf().get("wx849_poll_max_interval", 2)
+        self.error_max_interval = error_max_interval if error_max_interval is not None else conf().get("wx849_poll_error_max_interval", 30)
+        # 空结果的请求耗时超过该值，认为服务端挂起了请求(长轮询)
+        self.longpoll_threshold = longpoll_threshold if longpoll_threshold is not None else conf().get("wx849_longpoll_threshold", 1.0)
+        self.longpoll_detected = self.mode == SYNC_MODE_LONGPOLL
+        self._idle_interval = self.min_interval
+        self._error_interval = 1.0
+        self._held_streak = 0  # 连续被服务端挂起的空请求数
+        self._fast_streak = 0  # 连续没有被挂起的空请求数
+
+        self._polls = metrics.counter("wx849_polls_total", doc="Msg/Sync 请求次数")
+        self._empty_polls = metrics.counter("wx849_empty_polls_total", doc="没有新消息的 Msg/Sync 请求次数")
+        self._errors = metrics.counter("wx849_poll_errors_total", doc="Msg/Sync 请求失败次数")
+        self._received = metrics.counter("wx849_messages_received_total", doc="拉取到的消息数")
+        self._latency = metrics.histogram("wx849_poll_latency_seconds", doc="Msg/Sync 请求耗时")
+        self._delay = metrics.gauge("wx849_poll_delay_seconds", doc="下一次拉取前的等待时间")
+
+    def on_success(self, count, latency, has_more=False):
+        """
+        记录一次成功的拉取，返回下一次拉取前需要等待的秒数
+        :param count: 本次拉取到的消息数
+        :param latency: 本次请求耗时
+        :param has_more: 服务端是否提示还有未拉取的消息(ContinueFlag)
+        """
+        self._polls.inc()
+        self._latency.observe(latency)
+        self._error_interval = 1.0
+        if count:
+            self._received.inc(count)
+            self._idle_interval = self.min_interval
+            return self._set_delay(0 if has_more else self.min_interval)
+
+        self._empty_polls.inc()
+        if has_more:
+            return self._set_delay(0)
+        held = latency >= self.longpoll_threshold
+        if self.mode == SYNC_MODE_AUTO:
+            self._update_longpoll(held, latency)
+        if held and self.longpoll_detected and self.mode != SYNC_MODE_POLL:
+            # 服务端已经替我们等待过了，立即发起下一次请求
+            return self._set_delay(0)
+
+        # 服务端没有挂起请求(或还没有确认长轮询)，指数退避避免空转
+        delay = self._jitter(self._idle_interval)
+        self._idle_interval = min(self._idle_interval * 2, self.max_interval)
+        return self._set_delay(delay)
+
+    def _update_longpoll(self, held, latency):
+        """根据连续空请求是否被挂起，切换长轮询识别结果"""
+        if held:
+            self._held_streak += 1
+            self._fast_streak = 0
+        else:
+            self._fast_streak += 1
+            self._held_streak = 0
+        if not self.longpoll_detected and self._held_streak >= LONGPOLL_CONFIRM_POLLS:
+            self.longpoll_detected = True
+            logger.info(f"[WX849] 检测到 Msg/Sync 支持长轮询(空请求耗时 {latency:.2f}s)，切换为长轮询模式")
+        elif self.longpoll_detected and self._fast_streak >= LONGPOLL_RELEASE_POLLS:
+            self.longpoll_detected = False
+            logger.info(f"[WX849] Msg/Sync 连续 {self._fast_streak} 次空请求没有被挂起，切换回自适应轮询")
+
+    def on_error(self):
+        """记录一次失败的拉取，返回下一次拉取前需要等待的秒数"""
+        self._polls.inc()
+        self._errors.inc()
+        delay = self._jitter(self._error_interval)
+        self._error_interval = min(self._error_interval * 2, self.error_max_interval)
+        return self._set_delay(delay)
+
+    @staticmethod
+    def _jitter(interval):
+        # 一半固定、一半随机，避免多个实例同时重试
+        return interval / 2 + random.uniform(0, interval / 2)
+
+    def _set_delay(self, delay):
+        self._delay.set(delay)
+        return delay
@@ -0,0 +1,91 @@
+from channel.chat_channel import check_contain, check_prefix
+from channel.wx849.wx849_parser import _string_value, chatroom_id, source_self_name, split_sender
+from common.metrics import metrics
+from config import conf
+
+# 文本消息和语音消息的原始类型
+TEXT_TYPES = (1, "1", "Text")
+VOICE_TYPES = (34, "34", "Voice")
+# 原始消息中可能包含@列表的字段
+AT_FIELDS = ("MsgSource", "AtUserList", "at_list", "atlist")
+
+
+class GroupPrefilter(object):
+    """
+    群消息的第一道过滤
+
+    只根据原始消息(群ID、MsgSource中的@列表、前缀/关键词、消息类型)判断消息是否可能触发机器人，
+    在创建 WX849Message 和解析之前丢弃一定不会触发的消息。判断是保守的：无法确定时放行，
+    由 handle_group 和 ChatChannel._compose_context 做完整判断。
+    """
+
+    def __init__(self, rooms, self_wxid_func, self_name_func=None):
+        """
+        :param rooms: 群聊信息目录，用于按群ID取群名检查白名单、取机器人的群昵称
+        :param self_wxid_func: 返回机器人wxid的函数
+        :param self_name_func: 返回机器人微信昵称的函数
+        """
+        self.rooms = rooms
+        self.self_wxid_func = self_wxid_func
+        self.self_name_func = self_name_func
+        self._accepted = metrics.counter("wx849_prefilter_accepted_total", doc="通过预过滤的群消息数")
+
+    def _reject(self, reason):
+        metrics.counter("wx849_prefilter_rejected_total", labels={"reason": reason}, doc="被预过滤丢弃的群消息数").inc()
+        return False
+
+    def accept(self, msg):
+        """判断群消息是否可能触发机器人，返回False的消息可以直接丢弃"""
+        config = conf()
+        group_id = chatroom_id(msg)
+
+        # 1. 群白名单：群名已知且不在白名单中
+        white_list = config.get("group_name_white_list", ["ALL_GROUP"])
+        if "ALL_GROUP" not in white_list and group_id not in white_list:
+            group_name = self.rooms.get_group_name(group_id)
+            if group_name and group_name not in white_list \
+                    and not check_contain(group_name, config.get("group_name_keyword_white_list", [])):
+                return self._reject("whitelist")
+
+        msg_type = msg.get("type", msg.get("Type", msg.get("MsgType", 0)))
+        # 2. 语音：未开启群语音识别时不会处理
+        if msg_type in VOICE_TYPES:
+            if config.get("group_speech_recognition") != True:
+                return self._reject("voice")
+            self._accepted.inc()
+            return True
+        # 其他非文本消息(图片、XML、系统消息等)可能被插件或后续消息使用，全部放行
+        if msg_type not in TEXT_TYPES:
+            self._accepted.inc()
+            return True
+
+        # 3. 文本：必须匹配前缀、关键词或@机器人
+        content = _string_value(msg.get("content", msg.get("Content", "")))
+        sender, body = split_sender(content)
+        if sender and "<" not in sender:
+            content = body
+        if check_prefix(content, config.get("group_chat_prefix", [])) is not None \
+                or check_contain(content, config.get("group_chat_keyword", [])) is not None:
+            self._accepted.inc()
+            return True
+        # @机器人：@列表(MsgSource等字段)中包含机器人wxid，或内容中@了机器人的昵称/群昵称
+        self_wxid = self.self_wxid_func() if self.self_wxid_func else None
+        if self_wxid and any(self_wxid in str(msg.get(key) or "") for key in AT_FIELDS):
+            self._accepted.inc()
+            return True
+        if "@" in content and self._mentions_self(msg, group_id, self_wxid, content):
+            self._accepted.inc()
+            return True
+        return self._reject("no_trigger")
+
+    def _mentions_self(self, msg, group_id, self_wxid, content):
+        """内容中是否@了机器人，@其他成员或邮箱地址不算；还不知道机器人的昵称时无法判断，放行"""
+        names = [source_self_name(msg)]
+        if self.self_name_func:
+            names.append(self.self_name_func())
+        if self_wxid:
+            names.append(self.rooms.get_member_nickname(group_id, self_wxid))
+        names = [name for name in names if name]
+        if not names:
+            return True
+        return any(f"@{name}" in content for name in names)
@@ -0,0 +1,194 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+from common.log import logger
+from common.singleton import singleton
+from config import conf
+
+ROOMS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "tmp", "wx849_rooms.json")
+
+
+class ChatroomDirectory(object):
+    """
+    群聊信息目录 - wx849_rooms.json 的内存索引，通道通过 get_chatroom_directory() 取进程内共享的实例
+
+    启动时加载一次文件，之后按群ID、(群ID, wxid) 在内存中 O(1) 查询；
+    修改只标记为脏数据，由后台线程定期原子写回磁盘。
+    """
+
+    def __init__(self, file_path=ROOMS_FILE):
+        self.file_path = file_path
+        self.ttl = conf().get("wx849_rooms_cache_ttl", 86400)  # 群信息有效期，过期后需要重新从API获取
+        self.flush_interval = conf().get("wx849_rooms_flush_interval", 5)  # 脏数据写回磁盘的间隔(秒)
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # 串行化写回，避免较旧的快照覆盖较新的快照
+        self._rooms = {}  # 群ID -> 群信息(与文件结构一致)
+        self._members = {}  # 群ID -> {wxid: 成员信息}
+        self._dirty = False
+        self._dirty_event = threading.Event()
+        self._closed = threading.Event()
+        self._load()
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="wx849-rooms-flush")
+        self._flush_thread.daemon = True
+        self._flush_thread.start()
+        atexit.register(self.flush)
+
+    def _load(self):
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                rooms = json.load(f)
+            if not isinstance(rooms, dict):
+                logger.error(f"[WX849] 群聊缓存文件格式错误: {self.file_path}")
+                return
+            with self._lock:
+                self._rooms = rooms
+                self._members = {group_id: self._index_members(room) for group_id, room in rooms.items()}
+            logger.info(f"[WX849] 已加载 {len(rooms)} 个群聊信息到内存")
+        except Exception as e:
+            logger.error(f"[WX849] 加载群聊缓存失败: {e}")
+
+    @staticmethod
+    def _index_members(room):
+        members = room.get("members") if isinstance(room, dict) else None
+        if not isinstance(members, list):
+            return {}
+        return {m.get("UserName"): m for m in members if isinstance(m, dict) and m.get("UserName")}
+
+    def get_room(self, group_id):
+        """获取群信息，不存在时返回None"""
+        return self._rooms.get(group_id)
+
+    def get_group_name(self, group_id):
+        """获取群名称，未知时返回None"""
+        room = self._rooms.get(group_id)
+        if room:
+            name = room.get("nickName")
+            if name and name != group_id:
+                return name
+        return None
+
+    def get_member(self, group_id, wxid):
+        """获取群成员信息，不存在时返回None"""
+        members = self._members.get(group_id)
+        return members.get(wxid) if members else None
+
+    def get_member_nickname(self, group_id, wxid):
+        """获取群成员昵称，优先群内显示名称，其次微信昵称"""
+        member = self.get_member(group_id, wxid)
+        if member:
+            return member.get("DisplayName") or member.get("NickName") or None
+        return None
+
+    def has_members(self, group_id):
+        return bool(self._members.get(group_id))
+
+    def is_fresh(self, group_id, require_members=False):
+        """群信息是否存在且未过期"""
+        room = self._rooms.get(group_id)
+        if not room or "last_update" not in room:
+            return False
+        if require_members and not self.has_members(group_id):
+            return False
+        return int(time.time()) - room["last_update"] < self.ttl
+
+    def update_room(self, group_id, nick_name=None, owner=None):
+        """更新群基础信息，群不存在时新建"""
+        with self._lock:
+            room = self._rooms.get(group_id)
+            if room is None:
+                room = self._new_room(group_id, nick_name, owner)
+                self._rooms[group_id] = room
+                self._members[group_id] = {}
+            else:
+                if nick_name:
+                    room["nickName"] = nick_name
+                if owner:
+                    room["chatRoomOwner"] = owner
+                room["last_update"] = int(time.time())
+            self._mark_dirty()
+            return room
+
+    def set_members(self, group_id, members, member_count=None):
+        """整体替换群成员列表"""
+        with self._lock:
+            room = self._rooms.get(group_id)
+            if room is None:
+                room = self._new_room(group_id)
+                self._rooms[group_id] = room
+            room["members"] = members
+            room["last_update"] = int(time.time())
+            if member_count is not None:
+                room["memberCount"] = member_count
+            # 同时更新群主信息
+            for member in members:
+                if member.get("ChatroomMemberFlag") == 2049:  # 群主标志
+                    room["chatRoomOwner"] = member.get("UserName", "")
+                    break
+            self._members[group_id] = self._index_members(room)
+            self._mark_dirty()
+            return room
+
+    @staticmethod
+    def _new_room(group_id, nick_name=None, owner=None):
+        return {
+            "chatroomId": group_id,
+            "nickName": nick_name or group_id,
+            "chatRoomOwner": owner or "",
+            "members": [],
+            "last_update": int(time.time()),
+        }
+
+    def _mark_dirty(self):
+        self._dirty = True
+        self._dirty_event.set()
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._dirty_event.wait()
+            # 合并一段时间内的多次修改，只写一次文件；关闭时立即结束等待
+            self._closed.wait(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        """停止后台写回线程，并将未写回的修改写入磁盘"""
+        self._closed.set()
+        self._dirty_event.set()
+        self._flush_thread.join()
+        atexit.unregister(self.flush)
+        self.flush()
+
+    def flush(self):
+        """将内存中的群信息原子写回磁盘"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._dirty_event.clear()
+                data = json.dumps(self._rooms, ensure_ascii=False, indent=2)
+            tmp_path = None
+            try:
+                dir_name = os.path.dirname(self.file_path)
+                os.makedirs(dir_name, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(prefix=".wx849_rooms.", suffix=".tmp", dir=dir_name)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.file_path)
+                logger.debug(f"[WX849] 已写回 {len(self._rooms)} 个群聊信息到 {self.file_path}")
+            except Exception as e:
+                logger.error(f"[WX849] 保存群聊缓存失败: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                self._mark_dirty()
+
+
+# 进程内共享的群聊信息目录，使用默认的 wx849_rooms.json
+get_chatroom_directory = singleton(ChatroomDirectory)
@@ -0,0 +1,51 @@
+class MaxCountIndex(object):
+    """
+    键 -> 计数，增减计数和取计数最大的键都是O(1)
+
+    按计数分桶(计数 -> 该计数的键)，并记录当前最大计数；计数减到0的键不再保存。
+    最大计数所在的桶变空时逐级向下查找，下降的总步数不超过增加的总数，均摊O(1)。
+    计数相同时返回最早达到该计数的键。非线程安全，由调用方加锁。
+    """
+
+    def __init__(self):
+        self._counts = {}  # 键 -> 计数
+        self._buckets = {}  # 计数 -> {键: None}，按达到该计数的先后排列
+        self._max = 0
+
+    def __len__(self):
+        return len(self._counts)
+
+    def count(self, key):
+        return self._counts.get(key, 0)
+
+    def add(self, key, delta=1):
+        """计数增加delta(可以为负数)，结果不能小于0"""
+        old = self._counts.get(key, 0)
+        new = old + delta
+        if new < 0:
+            raise ValueError("count of {} would be negative: {}".format(key, new))
+        if new == old:
+            return
+        if old:
+            bucket = self._buckets[old]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[old]
+        if new:
+            self._counts[key] = new
+            self._buckets.setdefault(new, {})[key] = None
+            self._max = max(self._max, new)
+        else:
+            del self._counts[key]
+        while self._max and self._max not in self._buckets:
+            self._max -= 1
+
+    def remove(self, key):
+        """清零键的计数"""
+        self.add(key, -self.count(key))
+
+    def max_key(self):
+        """计数最大的键，没有计数大于0的键时返回None"""
+        if not self._max:
+            return None
+        return next(iter(self._buckets[self._max]))
@@ -0,0 +1,48 @@
+import heapq
+import itertools
+import threading
+import time
+
+from common.log import logger
+
+
+class DelayScheduler(object):
+    """
+    延迟任务调度器
+
+    所有延迟任务保存在一个按到期时间排序的堆中，由一个后台线程在到期时执行。
+    到期的任务应当很快返回(例如把真正的工作提交到线程池)，等待期间不占用任何工作线程。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._heap = []  # (到期时间, 序号, fn, args, kwargs)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def call_later(self, delay, fn, *args, **kwargs):
+        """delay秒后在调度线程中执行 fn(*args, **kwargs)"""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + max(0, delay), next(self._seq), fn, args, kwargs))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self):
+        return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        _, _, fn, args, kwargs = heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"[delay_scheduler] {self.name} task error: {e}")
@@ -0,0 +1,51 @@
+from collections import deque
+
+
+class WeightedFairQueue(object):
+    """
+    按类别加权公平出队的FIFO队列(stride调度)
+
+    每个类别一个先进先出队列，出队时选择虚拟时间最小的非空类别，并把该类别的虚拟时间增加 1/权重，
+    所以各类别都有元素排队时，出队次数按权重比例分配，任何类别都不会被饿死。
+    空闲的类别重新有元素时，虚拟时间不低于当前的全局虚拟时间，不会因为空闲而积累额度。
+    非线程安全，由调用方加锁。
+    """
+
+    def __init__(self, weights=None, default_weight=1):
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self._queues = {}  # 类别 -> 元素队列
+        self._pass = {}  # 类别 -> 虚拟时间
+        self._vtime = 0.0  # 最近一次出队的虚拟时间
+        self._len = 0
+
+    def set_weights(self, weights):
+        self.weights = dict(weights or {})
+
+    def _weight(self, cls):
+        return max(float(self.weights.get(cls, self.default_weight)), 1e-3)
+
+    def append(self, item, cls=None):
+        queue = self._queues.get(cls)
+        if queue is None:
+            queue = self._queues[cls] = deque()
+        if not queue:
+            self._pass[cls] = max(self._pass.get(cls, 0.0), self._vtime)
+        queue.append(item)
+        self._len += 1
+
+    def popleft(self):
+        """弹出虚拟时间最小的类别中最早的元素，返回 (元素, 类别)，队列为空时抛出IndexError"""
+        if not self._len:
+            raise IndexError("pop from an empty WeightedFairQueue")
+        cls = min((c for c, q in self._queues.items() if q), key=lambda c: self._pass[c])
+        self._vtime = self._pass[cls]
+        self._pass[cls] += 1.0 / self._weight(cls)
+        self._len -= 1
+        return self._queues[cls].popleft(), cls
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
@@ -0,0 +1,128 @@
+"""
+共享的HTTP连接
+
+bot、语音、翻译和插件访问外部接口时通过 request/get/post 发送请求，复用 requests.Session 保持长连接，
+避免每次请求都重新建立TCP和TLS连接。
+
+- 配置中的接口地址(*_api_base、*_base_url)所在的主机各自使用一个会话；其余主机(图片链接、插件临时访问的地址等)
+  共用一个会话，其中每个主机的连接池数量有上限，超过时关闭最久未使用的连接池，不会随访问过的主机无限增长
+
+- 未指定timeout时使用配置的连接超时和读取超时，流式响应的读取超时是两次收到数据之间的最长间隔
+- 连接失败时自动重试；GET等幂等请求在读取失败或返回429/502/503/504时也会重试，POST不会重复发送
+- 按主机统计请求耗时(到收到响应头为止)和失败次数，未配置的主机统一记为 host="other"
+- 会话不保存cookie，不同用户、不同api key的请求之间互不影响
+"""
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common.metrics import metrics
+from config import conf
+
+OTHER_HOST = "other"  # 未配置的主机共用的会话和指标标签
+OTHER_HOST_POOLS = 16  # 共用会话中最多保持连接池的主机数
+
+_sessions = {}  # 配置的接口主机 scheme://host:port 或 OTHER_HOST -> requests.Session
+_api_hosts = None  # 配置的接口主机，第一次请求时从配置中读取
+_lock = threading.Lock()
+
+
+def _host_key(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _configured_hosts():
+    global _api_hosts
+    if _api_hosts is None:
+        hosts = set()
+        for key, value in conf().items():
+            if key.endswith(("_api_base", "_base_url")) and isinstance(value, str) and value.startswith(("http://", "https://")):
+                hosts.add(_host_key(value))
+        _api_hosts = frozenset(hosts)
+    return _api_hosts
+
+
+def _session_key(url):
+    key = _host_key(url)
+    return key if key in _configured_hosts() else OTHER_HOST
+
+
+def _create_session(pool_connections=1):
+    retries = conf().get("http_max_retries", 2)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # 只重试幂等请求，连接失败时请求尚未发出，所有请求都会重试
+        raise_on_status=False,
+    )
+    pool_size = conf().get("http_pool_size", 32)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session(url):
+    """返回url所在主机的共享会话，未配置的主机返回共用的会话"""
+    key = _session_key(url)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _create_session(OTHER_HOST_POOLS if key == OTHER_HOST else 1)
+    return session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """与 requests.request 参数相同，复用主机的长连接"""
+    if timeout is None:
+        timeout = (conf().get("http_connect_timeout", 10), conf().get("http_read_timeout", 180))
+    key = _session_key(url)
+    labels = {"host": urlsplit(url).netloc if key != OTHER_HOST else OTHER_HOST}
+    start = time.monotonic()
+    try:
+        response = get_session(url).request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException:
+        metrics.counter("http_client_errors_total", labels=labels, doc="外部HTTP请求失败(异常或状态码>=400)的次数").inc()
+        raise
+    finally:
+        metrics.histogram("http_client_request_seconds", labels=labels, doc="外部HTTP请求耗时(到收到响应头为止)").observe(time.monotonic() - start)
+    if response.status_code >= 400:
+        metrics.counter("http_client_errors_total", labels=labels, doc="外部HTTP请求失败(异常或状态码>=400)的次数").inc()
+    return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
+
+
+def close_all():
+    """关闭所有共享会话，下次请求时重新读取配置的接口主机"""
+    global _api_hosts
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        _api_hosts = None
+    for session in sessions:
+        session.close()
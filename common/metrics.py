@@ -0,0 +1,256 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认的耗时分桶(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    def __init__(self, name, labels=None, doc=""):
+        self.name = name
+        self.labels = labels or {}
+        self.doc = doc
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class Gauge:
+    """可增可减的瞬时值"""
+
+    def __init__(self, name, labels=None, doc=""):
+        self.name = name
+        self.labels = labels or {}
+        self.doc = doc
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def get(self):
+        return self.value
+
+
+class Histogram:
+    """分桶直方图，记录次数、总和以及每个桶的累计次数"""
+
+    def __init__(self, name, labels=None, doc="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels or {}
+        self.doc = doc
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[idx] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, q):
+        """根据分桶估算分位数，q取值0~1，没有数据时返回None"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = q * self.count
+            cumulative = 0
+            for i, cnt in enumerate(self.bucket_counts):
+                cumulative += cnt
+                if cumulative >= target:
+                    return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class _Timer:
+    """记录with代码块耗时的上下文管理器"""
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.monotonic() - self.start)
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """进程内指标注册表，同名同标签的指标只会创建一次"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.enabled = False  # 是否记录耗时(timer/timed)，未开启时只多一次判断
+
+    def _get_or_create(self, cls, name, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = cls(name, labels=labels, **kwargs)
+                    self._metrics[key] = metric
+        return metric
+
+    def counter(self, name, labels=None, doc=""):
+        return self._get_or_create(Counter, name, labels, doc=doc)
+
+    def gauge(self, name, labels=None, doc=""):
+        return self._get_or_create(Gauge, name, labels, doc=doc)
+
+    def histogram(self, name, labels=None, doc="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, labels, doc=doc, buckets=buckets)
+
+    def collect(self):
+        """返回当前所有指标的列表"""
+        with self._lock:
+            return list(self._metrics.values())
+
+    def timer(self, name, labels=None, doc=""):
+        """with metrics.timer(...): 记录代码块耗时到直方图，未开启时不记录"""
+        if not self.enabled:
+            return _NOOP_TIMER
+        return _Timer(self.histogram(name, labels, doc))
+
+    def timed(self, name, labels=None, doc=""):
+        """记录函数(包括协程函数)耗时的装饰器，未开启时不记录"""
+
+        def decorator(func):
+            histogram = self.histogram(name, labels, doc)
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    start = time.monotonic()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.monotonic() - start)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.monotonic()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.monotonic() - start)
+
+            return wrapper
+
+        return decorator
+
+    def render(self):
+        """以Prometheus文本格式输出所有指标"""
+        groups = {}
+        for metric in self.collect():
+            groups.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name in sorted(groups):
+            group = groups[name]
+            first = group[0]
+            metric_type = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[type(first)]
+            if first.doc:
+                lines.append(f"# HELP {name} {first.doc}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for metric in group:
+                if isinstance(metric, Histogram):
+                    with metric._lock:
+                        counts = list(metric.bucket_counts)
+                        count, total = metric.count, metric.sum
+                    cumulative = 0
+                    for bound, cnt in zip(metric.buckets + (float("inf"),), counts):
+                        cumulative += cnt
+                        lines.append(f"{name}_bucket{_format_labels(metric.labels, {'le': _format_value(float(bound))})} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(metric.labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(metric.labels)} {count}")
+                else:
+                    lines.append(f"{name}{_format_labels(metric.labels)} {_format_value(metric.get())}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """在后台线程中提供 http://host:port/metrics，返回 HTTPServer"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
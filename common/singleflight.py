@@ -0,0 +1,66 @@
+import asyncio
+
+from common.metrics import metrics
+
+
+class _LeaderCancelled(Exception):
+    """执行方被取消，等待方需要重新发起调用"""
+
+
+class AsyncSingleFlight:
+    """
+    合并相同key的并发异步调用
+
+    同一个key同时只执行一次，期间的其他调用方等待并共享同一个结果(或异常)；
+    执行方被取消时由第一个等待方接替重新执行，其余等待方改为等待新的调用；
+    max_concurrency 限制同时执行的不同key的调用数量。
+    同一个实例只能在一个事件循环中使用。
+    """
+
+    def __init__(self, name, max_concurrency=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._calls = {}  # key -> asyncio.Future
+        self._semaphore = None
+        self._executions = metrics.counter("singleflight_executions_total", labels={"name": name}, doc="实际执行的调用次数")
+        self._coalesced = metrics.counter("singleflight_coalesced_total", labels={"name": name}, doc="被合并到进行中调用的次数")
+
+    async def do(self, key, func, *args, **kwargs):
+        """执行 await func(*args, **kwargs)，相同key的进行中调用会被复用"""
+        future = self._calls.get(key)
+        while future is not None:
+            self._coalesced.inc()
+            try:
+                # shield: 某个等待方被取消时不影响其他等待方
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                future = self._calls.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            self._executions.inc()
+            if self.max_concurrency:
+                if self._semaphore is None:
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                async with self._semaphore:
+                    result = await func(*args, **kwargs)
+            else:
+                result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            # 不能直接取消future，否则等待方会收到不是由自己引起的CancelledError
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 标记异常已被读取，没有等待方时不打印警告
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._calls.pop(key, None)
+
+    def in_flight(self, key):
+        return key in self._calls
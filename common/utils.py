@@ -32,7 +32,8 @@ def compress_imgfile(file, max_size):
     while True:
         out_buf = io.BytesIO()
         rgb_image.save(out_buf, "JPEG", quality=quality)
-        if fsize(out_buf) <= max_size:
+        # 质量降到下限仍超出时返回当前结果，避免死循环
+        if fsize(out_buf) <= max_size or quality <= 10:
             return out_buf
         quality -= 5
 
@@ -0,0 +1,190 @@
+import asyncio
+import functools
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from common.log import logger
+from common.metrics import metrics
+
+_pools = {}  # 名称 -> 线程池，供异步代码按名称取用
+
+
+def get_pool(name):
+    return _pools.get(name)
+
+
+async def run_in_pool(name, fn, *args, **kwargs):
+    """在名为name的线程池中执行同步函数并等待结果，用于在异步流水线中调用同步的bot、插件和文件处理"""
+    pool = _pools.get(name)
+    if pool is None:
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+    return await asyncio.wrap_future(pool.submit(fn, *args, **kwargs))
+
+
+class AdaptiveThreadPool(object):
+    """
+    大小自适应的线程池
+
+    线程数在 [min_workers, max_workers] 之间变化：根据任务到达速率和平均执行耗时(Little定律)估算需要的线程数，
+    有任务排队且线程数低于估算值时新建线程，空闲超过 idle_timeout 的多余线程自动退出。
+    submit 返回 concurrent.futures.Future，用法与 ThreadPoolExecutor 相同；
+    submit_keyed 保证同一个key的任务按提交顺序逐个执行。
+    """
+
+    def __init__(self, name, min_workers=1, max_workers=8, idle_timeout=60, initializer=None):
+        self.name = name
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.idle_timeout = idle_timeout
+        self._initializer = initializer  # 每个工作线程启动时调用，与 ThreadPoolExecutor 的 initializer 相同
+        self._shutdown = False
+        self._cond = threading.Condition()
+        self._queue = deque()  # (future, fn, args, kwargs, 提交时间, key)
+        self._keyed = {}  # key -> 等待前一个任务完成的任务队列，存在即表示该key有任务在排队或执行
+        self._workers = 0
+        self._idle = 0
+        self._target = self.min_workers
+        # 任务到达速率和执行耗时的指数滑动平均，用于估算需要的线程数
+        self._interval = None  # 任务到达间隔
+        self._service_time = 0.0
+        self._last_submit = None
+
+        labels = {"pool": name}
+        self._size_gauge = metrics.gauge("worker_pool_size", labels=labels, doc="线程池当前线程数")
+        self._busy_gauge = metrics.gauge("worker_pool_busy", labels=labels, doc="线程池正在执行任务的线程数")
+        self._depth_gauge = metrics.gauge("worker_pool_queue_depth", labels=labels, doc="线程池排队等待的任务数")
+        self._saturation_gauge = metrics.gauge("worker_pool_saturation", labels=labels, doc="忙碌线程数占线程数上限的比例")
+        self._target_gauge = metrics.gauge("worker_pool_target", labels=labels, doc="根据耗时估算的目标线程数")
+        self._wait_hist = metrics.histogram("worker_pool_wait_seconds", labels=labels, doc="任务在线程池中的排队时间")
+        self._run_hist = metrics.histogram("worker_pool_run_seconds", labels=labels, doc="任务的执行耗时")
+        _pools[name] = self
+
+    def set_bounds(self, min_workers=None, max_workers=None):
+        """修改线程数上下限，多余的线程在空闲时退出"""
+        with self._cond:
+            if min_workers is not None:
+                self.min_workers = max(1, int(min_workers))
+            if max_workers is not None:
+                self.max_workers = max(self.min_workers, int(max_workers))
+            self._update_target()
+            self._cond.notify_all()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def submit(self, fn, *args, **kwargs):
+        return self._submit(None, fn, args, kwargs)
+
+    def submit_keyed(self, key, fn, *args, **kwargs):
+        """同一个key的任务串行执行，不同key之间并行"""
+        return self._submit(key, fn, args, kwargs)
+
+    def _submit(self, key, fn, args, kwargs):
+        future = Future()
+        now = time.monotonic()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if self._last_submit is not None:
+                interval = now - self._last_submit
+                self._interval = interval if self._interval is None else 0.8 * self._interval + 0.2 * interval
+            self._last_submit = now
+            item = (future, fn, args, kwargs, now, key)
+            if key is not None:
+                pending = self._keyed.get(key)
+                if pending is not None:
+                    # 该key已有任务在排队或执行，等它完成后再入队
+                    pending.append(item)
+                    return future
+                self._keyed[key] = deque()
+            self._enqueue(item)
+        return future
+
+    def _enqueue(self, item):
+        self._queue.append(item)
+        self._depth_gauge.set(len(self._queue))
+        self._update_target()
+        if self._idle > 0:
+            self._cond.notify()
+        elif self._workers < self._target:
+            self._spawn()
+
+    def _update_target(self):
+        # Little定律：需要的并发数 ≈ 到达速率 × 平均耗时，留25%余量；排队时至少比当前多一个线程
+        estimate = self.min_workers
+        if self._service_time and self._interval is not None:
+            # 长时间没有新任务时到达速率随之下降
+            interval = max(self._interval, time.monotonic() - self._last_submit, 1e-3)
+            estimate = math.ceil(self._service_time / interval * 1.25)
+        if self._queue and self._idle == 0:
+            estimate = max(estimate, self._workers + 1)
+        self._target = min(self.max_workers, max(self.min_workers, estimate))
+        self._target_gauge.set(self._target)
+
+    def _spawn(self):
+        self._workers += 1
+        self._size_gauge.set(self._workers)
+        thread = threading.Thread(target=self._worker, name=f"{self.name}-pool-{self._workers}", daemon=True)
+        thread.start()
+
+    def _worker(self):
+        if self._initializer:
+            try:
+                self._initializer()
+            except Exception as e:
+                logger.exception(f"[worker_pool] {self.name} initializer error: {e}")
+        while True:
+            with self._cond:
+                idle_since = time.monotonic()
+                while not self._queue:
+                    self._update_target()
+                    if self._shutdown or (self._workers > self._target and time.monotonic() - idle_since >= self.idle_timeout) \
+                            or self._workers > self.max_workers:
+                        self._workers -= 1
+                        self._size_gauge.set(self._workers)
+                        return
+                    self._idle += 1
+                    self._cond.wait(self.idle_timeout)
+                    self._idle -= 1
+                future, fn, args, kwargs, submitted, key = self._queue.popleft()
+                self._depth_gauge.set(len(self._queue))
+                busy = self._workers - self._idle
+                self._busy_gauge.set(busy)
+                self._saturation_gauge.set(busy / self.max_workers)
+
+            if future.set_running_or_notify_cancel():
+                start = time.monotonic()
+                self._wait_hist.observe(start - submitted)
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                elapsed = time.monotonic() - start
+                self._run_hist.observe(elapsed)
+            else:
+                elapsed = None
+
+            with self._cond:
+                if elapsed is not None:
+                    self._service_time = elapsed if not self._service_time else 0.8 * self._service_time + 0.2 * elapsed
+                if key is not None:
+                    pending = self._keyed[key]
+                    if pending:
+                        self._enqueue(pending.popleft())
+                    else:
+                        del self._keyed[key]
+                self._update_target()
+                busy = self._workers - self._idle - 1
+                self._busy_gauge.set(busy)
+                self._saturation_gauge.set(busy / self.max_workers)
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
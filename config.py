@@ -56,6 +56,30 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "llm_pool_min_workers": 4,  # 处理消息(调用模型)线程池的最少线程数，线程数根据消息量和处理耗时在上下限之间自动调整
+    "llm_pool_max_workers": 32,  # 处理消息(调用模型)线程池的最多线程数
+    "media_pool_min_workers": 1,  # 处理图片、视频、文件消息线程池的最少线程数
+    "media_pool_max_workers": 4,  # 处理图片、视频、文件消息和语音转码线程池的最多线程数
+    "send_pool_min_workers": 1,  # 发送回复线程池的最少线程数
+    "send_pool_max_workers": 4,  # 发送回复线程池的最多线程数，同一接收者的回复按顺序发送
+    "session_queue_max_size": 0,  # 每个会话最多排队的消息数，0表示不限制
+    "global_queue_max_size": 0,  # 所有会话合计最多排队的消息数，0表示不限制
+    "queue_overflow_policy": "drop_oldest",  # 队列满时的处理策略: drop_oldest 丢弃最早的消息(全局队列满时从排队最多的会话中丢弃), drop_newest 丢弃新消息, merge 文字消息合并到上一条排队的消息, busy_reply 丢弃新消息并回复繁忙提示
+    "queue_busy_reply": "消息太多了，请稍后再试",  # queue_overflow_policy 为 busy_reply 时的提示语
+    "queue_max_age": 0,  # 消息排队超过该时间(秒)后不再处理，0表示不限制
+    "traffic_class_weights": {"admin": 8, "vip": 4, "private": 2, "group": 1},  # 各类会话的调度权重，都有消息排队时按权重比例分配处理机会：管理员、user_datas中vip为真的用户、私聊、群聊
+    "coalesce_window": 0,  # 同一会话连续发送的文字消息在该静默时间(秒)内合并为一条再处理，0表示不合并，#开头的命令和非文字消息不合并
+    "coalesce_max_wait": 5,  # 合并消息时最多等待的时间(秒)，持续发送时也会在该时间后处理
+    "send_retry_max": 2,  # 回复发送失败后的最多重试次数
+    "send_retry_base_delay": 3,  # 第一次重试前的等待时间(秒)，之后每次翻倍并加随机抖动，等待期间不占用线程
+    "send_retry_per_recipient": 5,  # 每个接收者最多同时等待重试的回复数，超过的回复和重试用尽的回复记录到 send_dead_letter.log
+    "async_pipeline": False,  # 是否使用异步消息处理流水线，开启后等待模型回复不占用线程，目前支持wx849通道
+    "metrics_port": 0,  # 以Prometheus文本格式提供运行指标(各阶段/插件/bot耗时、队列长度、线程池使用率等)的本地端口，0表示不开启
+    "metrics_host": "127.0.0.1",  # 指标接口监听的地址
+    "http_pool_size": 32,  # 访问bot、语音、翻译等外部接口时每个主机保持的最大连接数，应不小于llm_pool_max_workers
+    "http_connect_timeout": 10,  # 外部接口的连接超时(秒)
+    "http_read_timeout": 180,  # 外部接口的读取超时(秒)，流式响应为两次收到数据之间的最长间隔
+    "http_max_retries": 2,  # 连接失败时的重试次数，GET等幂等请求在读取失败或返回429/5xx时也会重试
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     "group_exit_msg": "",  # 退出群聊的消息
@@ -107,6 +131,14 @@ available_setting = {
     "dify_app_type": "chatbot", # dify助手类型 chatbot(对应聊天助手或对话流)/agent(对应Agent)/workflow(对应工作流，则默认为chatbot
     "dify_conversation_max_messages": 5, # dify目前不支持设置历史消息长度，暂时使用超过最大消息数清空会话的策略，缺点是没有滑动窗口，会突然丢失历史消息，当设置的值小于等于0，则不限制历史消息长度
     "dify_error_reply": "", # dify bot错误时给用户的回复
+    "dify_stream_reply": False, # 流式回复：chatbot/chatflow/agent应用边生成边发送已完整的段落，缩短用户等到第一条消息的时间
+    "dify_stream_min_chars": 50, # 流式回复每段的最少字数，不足时继续累积
+    "dify_stream_flush_interval": 2, # 流式回复按句子切分时两段之间的最短间隔(秒)，段落、工具调用和文件处总是切分
+    "dify_request_timeout": 180, # 异步流水线中单次请求dify的截止时间(秒)，包括排队等待和读取完整的回复；流式回复只限制到收到第一个事件，之后两次收到数据的间隔不超过http_read_timeout
+    "dify_max_concurrency": 20, # 异步流水线中同一个dify api key同时进行的最大请求数，0表示不限制
+    "dify_download_concurrency": 4, # 同时下载dify回复中图片和文件的最大数量，同一条回复中的图片和文件并行下载、按原顺序发送
+    "dify_download_max_mb": 20, # dify回复中单个图片或文件的下载大小上限(MB)，超过时回复链接
+    "dify_upload_cache_ttl": 3600, # 图片识别时上传到dify的文件缓存时间(秒)，期间相同图片直接复用upload_file_id，应不超过dify保留上传文件的时间
     # coze配置
     "coze_api_base": "https://api.coze.cn",
     "coze_api_key": "xxx",
@@ -186,6 +218,30 @@ available_setting = {
     "wx849_api_host": "127.0.0.1",  # 微信849协议API地址
     "wx849_api_port": 9000,  # 微信849协议API端口
     "wx849_protocol_version": "849",  # 微信849协议版本，可选: "849", "855", "ipad"
+    "wx849_rooms_cache_ttl": 86400,  # 群聊信息缓存有效期(秒)，过期后重新从API获取
+    "wx849_rooms_flush_interval": 5,  # 群聊信息写回 tmp/wx849_rooms.json 的间隔(秒)
+    "wx849_sync_mode": "auto",  # 消息拉取模式: auto(自动检测长轮询)、longpoll、poll
+    "wx849_poll_min_interval": 0.1,  # 有新消息时的拉取间隔(秒)
+    "wx849_poll_max_interval": 2,  # 空闲时拉取间隔的上限(秒)，空闲期间按指数退避逐渐增大
+    "wx849_poll_error_max_interval": 30,  # 拉取出错时的最大退避间隔(秒)
+    "wx849_longpoll_threshold": 1.0,  # 连续多次空请求耗时超过该值(秒)视为服务端支持长轮询
+    "wx849_http_pool_size": 100,  # 与WechatAPI服务之间的HTTP连接池大小
+    "wx849_http_keepalive": 60,  # 空闲HTTP连接保持时间(秒)
+    "wx849_http_timeout": 60,  # WechatAPI请求等待响应数据的超时(秒)，两次收到数据之间的最长间隔，不限制上传时间
+    "wx849_http_media_timeout": 300,  # 上传图片、发送视频/语音/文件等媒体接口等待响应的超时(秒)
+    "wx849_group_fetch_concurrency": 4,  # 同时获取群信息/群成员的最大请求数，同一个群的并发请求会合并为一次
+    "wx849_dispatch_workers": 4,  # 并行处理消息的会话数，同一会话内的消息始终按顺序处理
+    "wx849_media_cache_dir": "",  # 媒体缓存目录，为空时使用 tmp/wx849_media
+    "wx849_media_cache_max_mb": 512,  # 媒体缓存的磁盘配额(MB)，超出时淘汰最久未使用的文件
+    "wx849_media_download_timeout": 60,  # 单个图片/语音/视频/表情下载的超时时间(秒)
+    "wx849_image_download_max_mb": 20,  # 回复网络图片(IMAGE_URL)时允许下载的最大图片大小(MB)
+    "wx849_image_max_send_kb": 0,  # 发送图片超过该大小(KB)时先缩小并重新压缩，0表示不压缩
+    "wx849_image_payload_ttl": 60,  # 同一网络图片编码结果的复用时间(秒)，发给多个接收者时只下载一次
+    "wx849_send_global_rate": 2,  # 全局每秒最多发送的消息数，0表示不限制
+    "wx849_send_global_burst": 5,  # 全局允许的突发消息数
+    "wx849_send_recipient_rate": 1,  # 每个接收者每秒最多发送的消息数，0表示不限制
+    "wx849_send_recipient_burst": 3,  # 每个接收者允许的突发消息数(多段回复可连续发出)
+    "wx849_group_prefilter": False,  # 解析群消息前先按原始消息判断是否可能触发(前缀/关键词/@/白名单)，不可能触发的直接丢弃
     "log_level": "INFO",
 
     # chatgpt指令自定义触发词
@@ -0,0 +1,202 @@
+"""Dify API 的异步客户端
+
+接口与 ChatClient 对应，基于 aiohttp，供异步消息处理流水线使用，等待 Dify 回复时不占用线程。
+
+- 每次调用都有截止时间(timeout，秒)，包括等待并发名额、建立连接和读取完整响应，超时抛出 asyncio.TimeoutError；
+  流式响应的截止时间只限制到收到第一个事件为止，之后两次收到数据的间隔不超过 idle_timeout，持续输出的长回答不会被截断
+- 同一个 api key 同时进行的请求数不超过 max_concurrency，限制在同一事件循环内的所有客户端实例之间共享
+- 调用方的任务被取消时(例如 ChatChannel.cancel_session)，进行中的请求随之中断，释放连接和并发名额
+- HTTP状态码 >= 400 时抛出 DifyAPIError
+
+会话与事件循环绑定：每个事件循环各自持有一个 aiohttp 会话，复用到 Dify 的长连接。
+"""
+import asyncio
+import json
+import weakref
+
+import aiohttp
+
+_sessions = weakref.WeakKeyDictionary()  # 事件循环 -> aiohttp会话
+_limiters = weakref.WeakKeyDictionary()  # 事件循环 -> {api_key: asyncio.Semaphore}
+
+
+class DifyAPIError(Exception):
+    def __init__(self, status, text):
+        super().__init__(f"dify api error, status={status}, body={text}")
+        self.status = status
+        self.text = text
+
+
+def _get_session():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+        session = _sessions[loop] = aiohttp.ClientSession(connector=connector)
+    return session
+
+
+async def close_session():
+    """关闭当前事件循环的共享会话，在事件循环结束前调用"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+class _Deadline(object):
+    def __init__(self, timeout):
+        self.loop = asyncio.get_running_loop()
+        self.at = self.loop.time() + timeout
+
+    def remaining(self):
+        remaining = self.at - self.loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return remaining
+
+
+class AsyncDifyClient(object):
+    def __init__(self, api_key, base_url: str = 'https://api.dify.ai/v1', timeout=120, max_concurrency=0, idle_timeout=None):
+        """
+        :param timeout: 默认的单次调用截止时间(秒)
+        :param max_concurrency: 同一个 api key 同时进行的最大请求数，0表示不限制
+        :param idle_timeout: 流式响应收到第一个事件后，两次收到数据之间的最长间隔(秒)，默认与timeout相同
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout or timeout
+        self.max_concurrency = max_concurrency
+
+    def _semaphore(self):
+        if not self.max_concurrency:
+            return None
+        limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+        semaphore = limiters.get(self.api_key)
+        if semaphore is None:
+            semaphore = limiters[self.api_key] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _headers(self, content_type="application/json"):
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if content_type:
+            headers["Content-Type"] = content_type
+        return headers
+
+    async def _request(self, method, endpoint, json=None, params=None, data=None, timeout=None):
+        """发送请求并返回解析后的JSON"""
+        deadline = _Deadline(timeout or self.timeout)
+        semaphore = self._semaphore()
+        if semaphore:
+            await asyncio.wait_for(semaphore.acquire(), deadline.remaining())
+        try:
+            if params:
+                params = {k: v for k, v in params.items() if v is not None}
+            headers = self._headers(content_type="application/json" if data is None else None)
+            request = _get_session().request(method, f"{self.base_url}{endpoint}", json=json, params=params,
+                                             data=data, headers=headers)
+            async with await asyncio.wait_for(request, deadline.remaining()) as response:
+                text = await asyncio.wait_for(response.text(), deadline.remaining())
+                if response.status >= 400:
+                    raise DifyAPIError(response.status, text)
+                return _loads(text)
+        finally:
+            if semaphore:
+                semaphore.release()
+
+    async def _stream(self, endpoint, payload, timeout=None):
+        """
+        发送流式请求，逐个返回SSE事件(dict)；提前结束迭代时需要调用 aclose() 释放连接
+        截止时间限制到收到第一个事件为止，之后每次读取的等待时间不超过 idle_timeout
+        """
+        deadline = _Deadline(timeout or self.timeout)
+        semaphore = self._semaphore()
+        if semaphore:
+            await asyncio.wait_for(semaphore.acquire(), deadline.remaining())
+        response = None
+        try:
+            request = _get_session().post(f"{self.base_url}{endpoint}", json=payload, headers=self._headers())
+            response = await asyncio.wait_for(request, deadline.remaining())
+            if response.status >= 400:
+                raise DifyAPIError(response.status, await asyncio.wait_for(response.text(), deadline.remaining()))
+            buffer = b""
+            started = False
+            while True:
+                wait = self.idle_timeout if started else deadline.remaining()
+                chunk = await asyncio.wait_for(response.content.readany(), wait)
+                if not chunk:
+                    break
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    event = _parse_sse_line(line)
+                    if event is not None:
+                        started = True
+                        yield event
+            event = _parse_sse_line(buffer)
+            if event is not None:
+                yield event
+        finally:
+            if response is not None:
+                response.release()
+            if semaphore:
+                semaphore.release()
+
+    async def create_chat_message(self, inputs, query, user, conversation_id=None, files=None, timeout=None):
+        """blocking 模式的对话，返回完整的响应"""
+        data = _chat_payload(inputs, query, user, "blocking", conversation_id, files)
+        return await self._request("POST", "/chat-messages", json=data, timeout=timeout)
+
+    def stream_chat_message(self, inputs, query, user, conversation_id=None, files=None, timeout=None):
+        """streaming 模式的对话，返回SSE事件的异步迭代器"""
+        data = _chat_payload(inputs, query, user, "streaming", conversation_id, files)
+        return self._stream("/chat-messages", data, timeout=timeout)
+
+    async def run_workflow(self, inputs, user, timeout=None):
+        data = {"inputs": inputs, "response_mode": "blocking", "user": user}
+        return await self._request("POST", "/workflows/run", json=data, timeout=timeout)
+
+    async def file_upload(self, user, file_name, content: bytes, mime_type=None, timeout=None):
+        form = aiohttp.FormData()
+        form.add_field("user", user)
+        form.add_field("file", content, filename=file_name, content_type=mime_type or "application/octet-stream")
+        return await self._request("POST", "/files/upload", data=form, timeout=timeout)
+
+    async def get_conversations(self, user, last_id=None, limit=None, pinned=None, timeout=None):
+        params = {"user": user, "last_id": last_id, "limit": limit, "pinned": pinned}
+        return await self._request("GET", "/conversations", params=params, timeout=timeout)
+
+    async def get_conversation_messages(self, user, conversation_id=None, first_id=None, limit=None, timeout=None):
+        params = {"user": user, "conversation_id": conversation_id, "first_id": first_id, "limit": limit}
+        return await self._request("GET", "/messages", params=params, timeout=timeout)
+
+    async def rename_conversation(self, conversation_id, name, user, timeout=None):
+        data = {"name": name, "user": user}
+        return await self._request("POST", f"/conversations/{conversation_id}/name", json=data, timeout=timeout)
+
+    async def delete_conversation(self, conversation_id, user, timeout=None):
+        return await self._request("DELETE", f"/conversations/{conversation_id}", json={"user": user}, timeout=timeout)
+
+
+def _chat_payload(inputs, query, user, response_mode, conversation_id, files):
+    data = {"inputs": inputs, "query": query, "user": user, "response_mode": response_mode, "files": files}
+    if conversation_id:
+        data["conversation_id"] = conversation_id
+    return data
+
+
+def _loads(text):
+    return json.loads(text) if text else {}
+
+
+def _parse_sse_line(line: bytes):
+    line = line.strip()
+    if not line.startswith(b"data:"):
+        return None
+    data = line[len(b"data:"):].strip()
+    if not data:
+        return None
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        return None
@@ -2,9 +2,11 @@ import requests
 
 
 class DifyClient:
-    def __init__(self, api_key, base_url: str = 'https://api.dify.ai/v1'):
+    def __init__(self, api_key, base_url: str = 'https://api.dify.ai/v1', requester=None):
         self.api_key = api_key
         self.base_url = base_url
+        # 发送请求的函数，参数与 requests.request 相同，可传入复用连接的实现
+        self.requester = requester or requests.request
 
     def _send_request(self, method, endpoint, json=None, params=None, stream=False):
         headers = {
@@ -13,7 +15,7 @@ class DifyClient:
         }
 
         url = f"{self.base_url}{endpoint}"
-        response = requests.request(method, url, json=json, params=params, headers=headers, stream=stream)
+        response = self.requester(method, url, json=json, params=params, headers=headers, stream=stream)
 
         return response
 
@@ -23,7 +25,7 @@ class DifyClient:
         }
 
         url = f"{self.base_url}{endpoint}"
-        response = requests.request(method, url, data=data, headers=headers, files=files)
+        response = self.requester(method, url, data=data, headers=headers, files=files)
 
         return response
 
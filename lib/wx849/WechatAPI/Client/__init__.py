@@ -1,9 +1,11 @@
 try:
     # 尝试使用相对导入
     from ..errors import *
+    from ..transport import shared_session
 except ImportError:
     # 回退到绝对导入
     from WechatAPI.errors import *
+    from WechatAPI.transport import shared_session
 from .base import WechatAPIClientBase, Proxy, Section
 from .chatroom import ChatroomMixin
 from .friend import FriendMixin
@@ -89,15 +91,13 @@ class WechatAPIClient(LoginMixin, MessageMixin, FriendMixin, ChatroomMixin, User
         if not self.wxid:
             raise UserLoggedOut("请先登录")
             
-        import aiohttp
-        
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             # 使用正确的参数调用 Sync 接口
             # Scene=0 适用于消息同步，根据KeyBuf持续获取新消息
             json_param = {"Wxid": self.wxid, "Scene": 0, "Synckey": self._last_key_buf}
             logger.debug(f"[WX849 API] 调用Sync接口，参数: {json_param}")
-            response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Msg/Sync', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Msg/Sync', json=json_param) as response:
+                json_resp = await response.json()
             
             # 记录返回数据的简要信息（避免日志过大）
             logger.debug(f"[WX849 API] Sync 接口返回状态: {json_resp.get('Success')}")
@@ -1,10 +1,9 @@
 from typing import Union, Any
 
-import aiohttp
-
 from .base import *
 from .protect import protector
 from ..errors import *
+from ..transport import shared_session
 
 
 class ChatroomMixin(WechatAPIClientBase):
@@ -23,10 +22,10 @@ class ChatroomMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "ChatRoomName": chatroom, "ToWxids": wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/AddChatroomMember', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/AddChatroomMember', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return True
@@ -45,10 +44,10 @@ class ChatroomMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "QID": chatroom}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetChatroomInfoDetail', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetChatroomInfoDetail', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 data = dict(json_resp.get("Data"))
@@ -71,10 +70,10 @@ class ChatroomMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "QID": chatroom}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetChatroomInfo', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetChatroomInfo', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data").get("ContactList")[0]
@@ -93,10 +92,10 @@ class ChatroomMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "QID": chatroom}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetChatroomMemberDetail', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetChatroomMemberDetail', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data").get("NewChatroomData").get("ChatRoomMember")
@@ -117,10 +116,10 @@ class ChatroomMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(86400):
             raise BanProtection("获取二维码需要在登录后24小时才可使用")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "QID": chatroom}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetQRCode', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetQRCode', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 data = json_resp.get("Data")
@@ -146,10 +145,10 @@ class ChatroomMixin(WechatAPIClientBase):
         if isinstance(wxid, list):
             wxid = ",".join(wxid)
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "ChatRoomName": chatroom, "ToWxids": wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/InviteChatroomMember', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/InviteChatroomMember', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return True
@@ -169,10 +168,10 @@ class ChatroomMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "QID": chatroom, "ToWxid": wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetSomeMemberInfo', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Group/GetSomeMemberInfo', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
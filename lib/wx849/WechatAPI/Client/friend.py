@@ -1,10 +1,9 @@
 from typing import Union
 
-import aiohttp
-
 from .base import *
 from .protect import protector
 from ..errors import *
+from ..transport import shared_session
 
 
 class FriendMixin(WechatAPIClientBase):
@@ -35,10 +34,10 @@ class FriendMixin(WechatAPIClientBase):
         elif not self.ignore_protect and protector.check(14400):
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "Scene": scene, "V1": v1, "V2": v2}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/PassVerify', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/PassVerify', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return True
@@ -60,10 +59,10 @@ class FriendMixin(WechatAPIClientBase):
         if isinstance(wxid, list):
             wxid = ",".join(wxid)
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "RequestWxids": wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetContact', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetContact', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 contact_list = json_resp.get("Data").get("ContactList")
@@ -93,10 +92,10 @@ class FriendMixin(WechatAPIClientBase):
             wxid = ",".join(wxid)
 
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "Towxids": wxid, "Chatroom": chatroom}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetContractDetail', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetContractDetail', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data").get("ContactList")
@@ -116,10 +115,10 @@ class FriendMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "CurrentWxcontactSeq": wx_seq, "CurrentChatroomContactSeq": chatroom_seq}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetContractList', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetContractList', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
@@ -141,7 +140,7 @@ class FriendMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {
                 "Wxid": self.wxid,
                 "CurrentWxcontactSeq": wx_seq,
@@ -149,8 +148,8 @@ class FriendMixin(WechatAPIClientBase):
                 "Offset": offset,
                 "Limit": limit
             }
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetTotalContractList', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/Friend/GetTotalContractList', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
@@ -1,7 +1,6 @@
-import aiohttp
-
 from .base import *
 from ..errors import *
+from ..transport import shared_session
 
 
 class HongBaoMixin(WechatAPIClientBase):
@@ -19,10 +18,10 @@ class HongBaoMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "Xml": xml, "EncryptKey": encrypt_key, "EncryptUserinfo": encrypt_userinfo,"InWay": "1"}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/TenPay/Receivewxhb', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/TenPay/Receivewxhb', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
@@ -1,8 +1,7 @@
-import aiohttp
-
 from .base import *
 from .protect import protector
 from ..errors import *
+from ..transport import shared_session
 # from loguru import logger
 
 class PyqMixin(WechatAPIClientBase):
@@ -26,11 +25,11 @@ class PyqMixin(WechatAPIClientBase):
         if not wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": wxid,"Fristpagemd5": "", "Maxid": max_id}
             # response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Login/GetCacheInfo', data=json_param)
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/GetList', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/GetList', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 # logger.info("账号信息:{}",json_resp.get("Data"))
@@ -59,11 +58,11 @@ class PyqMixin(WechatAPIClientBase):
         if not wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": wxid, "Fristpagemd5": "", "Maxid": max_id, "Towxid": Towxid}
             # 使用正确的GetDetail接口获取特定用户的朋友圈
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/GetDetail', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/GetDetail', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 # logger.info("账号信息:{}",json_resp.get("Data"))
@@ -92,10 +91,10 @@ class PyqMixin(WechatAPIClientBase):
         if not self.wxid and not wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": wxid, "Id": id,"Content":Content,"Type":type,"ReplyCommnetId":ReplyCommnetId}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/Comment', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/Comment', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
@@ -114,10 +113,10 @@ class PyqMixin(WechatAPIClientBase):
         if not self.wxid and not wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": wxid, "Synckey": ""}
-            response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/MmSnsSync', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/VXAPI/FriendCircle/MmSnsSync', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
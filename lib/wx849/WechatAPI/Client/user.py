@@ -1,8 +1,7 @@
-import aiohttp
-
 from .base import *
 from .protect import protector
 from ..errors import *
+from ..transport import shared_session
 # from loguru import logger
 
 class UserMixin(WechatAPIClientBase):
@@ -25,11 +24,11 @@ class UserMixin(WechatAPIClientBase):
         if not wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"wxid": wxid}
             # response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Login/GetCacheInfo', data=json_param)
-            response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/User/GetContractProfile', data=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/User/GetContractProfile', data=json_param) as response:
+                json_resp = await response.json()
             
             if json_resp.get("Success"):
                 # logger.info("账号信息:{}",json_resp.get("Data"))
@@ -56,10 +55,10 @@ class UserMixin(WechatAPIClientBase):
         elif protector.check(14400) and not self.ignore_protect:
             raise BanProtection("风控保护: 新设备登录后4小时内请挂机")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid, "Style": style}
-            response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/User/GetQRCode', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/User/GetQRCode', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data").get("qrcode").get("buffer")
@@ -102,11 +101,11 @@ class UserMixin(WechatAPIClientBase):
         if not wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"wxid": wxid}
             # response = await session.post(f'http://{self.ip}:{self.port}/VXAPI/Login/GetCacheInfo', data=json_param)
-            response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Label/GetList', data=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Label/GetList', data=json_param) as response:
+                json_resp = await response.json()
             
             if json_resp.get("Success"):
                 # logger.info("账号信息:{}",json_resp.get("Data"))
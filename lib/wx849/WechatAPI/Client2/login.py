@@ -9,6 +9,7 @@ import qrcode
 from .base import *
 from .protect import protector
 from ..errors import *
+from ..transport import shared_session
 
 
 class LoginMixin(WechatAPIClientBase):
@@ -19,9 +20,9 @@ class LoginMixin(WechatAPIClientBase):
             bool: 如果WechatAPI正在运行返回True，否则返回False。
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                response = await session.get(f'http://{self.ip}:{self.port}/api/IsRunning')
-                return await response.text() == 'OK'
+            async with shared_session() as session:
+                async with session.get(f'http://{self.ip}:{self.port}/api/IsRunning') as response:
+                    return await response.text() == 'OK'
         except aiohttp.client_exceptions.ClientConnectorError:
             return False
 
@@ -40,15 +41,15 @@ class LoginMixin(WechatAPIClientBase):
         Raises:
             根据error_handler处理错误
         """
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {'DeviceName': device_name, 'DeviceID': device_id}
             if proxy:
                 json_param['ProxyInfo'] = {'ProxyIp': f'{proxy.ip}:{proxy.port}',
                                            'ProxyPassword': proxy.password,
                                            'ProxyUser': proxy.username}
 
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/GetQRPad1', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/GetQRPad1', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
 
@@ -81,23 +82,23 @@ class LoginMixin(WechatAPIClientBase):
         Raises:
             根据error_handler处理错误
         """
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"uuid": uuid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/CheckQR', data=json_param)
-            if response.content_type == 'application/json':
-                json_resp = await response.json()
-                if json_resp and json_resp.get("Success"):
-                    if json_resp.get("Data").get("acctSectResp", ""):
-                        self.wxid = json_resp.get("Data").get("acctSectResp").get("userName")
-                        self.nickname = json_resp.get("Data").get("acctSectResp").get("nickName")
-                        protector.update_login_status(device_id=device_id)
-                        return True, json_resp.get("Data")
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/CheckQR', data=json_param) as response:
+                if response.content_type == 'application/json':
+                    json_resp = await response.json()
+                    if json_resp and json_resp.get("Success"):
+                        if json_resp.get("Data").get("acctSectResp", ""):
+                            self.wxid = json_resp.get("Data").get("acctSectResp").get("userName")
+                            self.nickname = json_resp.get("Data").get("acctSectResp").get("nickName")
+                            protector.update_login_status(device_id=device_id)
+                            return True, json_resp.get("Data")
+                        else:
+                            return False, json_resp.get("Data").get("expiredTime")
                     else:
-                        return False, json_resp.get("Data").get("expiredTime")
+                        return False,"错误"
                 else:
                     return False,"错误"
-            else:
-                return False,"错误"
 
     async def log_out(self) -> bool:
         """登出当前账号。
@@ -112,10 +113,10 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/Logout', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/Logout', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return True
@@ -144,10 +145,10 @@ class LoginMixin(WechatAPIClientBase):
         if not wxid and self.wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/Awaken', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/Awaken', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success") and json_resp.get("Data").get("QrCodeResponse").get("Uuid"):
                 return json_resp.get("Data").get("QrCodeResponse").get("Uuid")
@@ -178,10 +179,10 @@ class LoginMixin(WechatAPIClientBase):
         if not wxid and self.wxid:
             wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"wxid": wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/TwiceAutoAuth', data=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/TwiceAutoAuth', data=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
@@ -199,10 +200,10 @@ class LoginMixin(WechatAPIClientBase):
             dict: 返回缓存信息，如果未提供wxid且未登录返回空字典
         """
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"wxid": wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/GetCacheInfo', data=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/GetCacheInfo', data=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data")
@@ -222,10 +223,10 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/HeartBeatLong', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/HeartBeatLong', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return True
@@ -246,10 +247,10 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"wxid": self.wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/HeartBeat', data=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/HeartBeat', data=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return True
@@ -270,10 +271,10 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/AutoHeartbeatStop', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/AutoHeartbeatStop', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return True
@@ -293,10 +294,10 @@ class LoginMixin(WechatAPIClientBase):
         if not self.wxid:
             raise UserLoggedOut("请先登录")
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Login/AutoHeartbeatStatus', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Login/AutoHeartbeatStatus', json=json_param) as response:
+                json_resp = await response.json()
 
             if json_resp.get("Success"):
                 return json_resp.get("Data").get("Running")
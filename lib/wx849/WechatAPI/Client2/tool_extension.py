@@ -1,7 +1,7 @@
-import aiohttp
 import base64
 from .base import WechatAPIClientBase
 from ..errors import UserLoggedOut
+from ..transport import shared_session
 from loguru import logger
 
 class ToolExtensionMixin(WechatAPIClientBase):
@@ -27,7 +27,7 @@ class ToolExtensionMixin(WechatAPIClientBase):
         if not to_wxid:
             to_wxid = self.wxid
 
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             # 根据提供的API文档构造请求参数
             json_param = {
                 "Wxid": self.wxid,
@@ -42,57 +42,56 @@ class ToolExtensionMixin(WechatAPIClientBase):
             }
 
             logger.debug(f"尝试下载图片: MsgId={msg_id}, ToWxid={to_wxid}, DataLen={data_len}")
-            response = await session.post(f'http://{self.ip}:{self.port}/api/Tools/DownloadImg', json=json_param)
-
-            try:
-                json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}/api/Tools/DownloadImg', json=json_param) as response:
+                try:
+                    json_resp = await response.json()
 
-                if json_resp.get("Success"):
-                    logger.info(f"获取消息图片成功: MsgId={msg_id}")
-                    # 尝试从不同的响应格式中获取图片数据
-                    data = json_resp.get("Data")
+                    if json_resp.get("Success"):
+                        logger.info(f"获取消息图片成功: MsgId={msg_id}")
+                        # 尝试从不同的响应格式中获取图片数据
+                        data = json_resp.get("Data")
 
-                    if isinstance(data, dict):
-                        # 如果是字典，尝试获取buffer字段
-                        if "buffer" in data:
-                            return base64.b64decode(data["buffer"])
-                        elif "data" in data and isinstance(data["data"], dict) and "buffer" in data["data"]:
-                            return base64.b64decode(data["data"]["buffer"])
-                        else:
-                            # 如果没有buffer字段，尝试直接解码整个data
+                        if isinstance(data, dict):
+                            # 如果是字典，尝试获取buffer字段
+                            if "buffer" in data:
+                                return base64.b64decode(data["buffer"])
+                            elif "data" in data and isinstance(data["data"], dict) and "buffer" in data["data"]:
+                                return base64.b64decode(data["data"]["buffer"])
+                            else:
+                                # 如果没有buffer字段，尝试直接解码整个data
+                                try:
+                                    return base64.b64decode(str(data))
+                                except:
+                                    logger.error(f"无法解析图片数据字典: {data}")
+                        elif isinstance(data, str):
+                            # 如果是字符串，直接解码
                             try:
-                                return base64.b64decode(str(data))
+                                return base64.b64decode(data)
                             except:
-                                logger.error(f"无法解析图片数据字典: {data}")
-                    elif isinstance(data, str):
-                        # 如果是字符串，直接解码
-                        try:
-                            return base64.b64decode(data)
-                        except:
-                            logger.error(f"无法解析图片数据字符串: {data[:100]}...")
+                                logger.error(f"无法解析图片数据字符串: {data[:100]}...")
+                        else:
+                            logger.error(f"无法解析图片数据类型: {type(data)}")
                     else:
-                        logger.error(f"无法解析图片数据类型: {type(data)}")
-                else:
-                    error_msg = json_resp.get("Message", "Unknown error")
-                    logger.error(f"下载图片失败: {error_msg}")
-                    self.error_handler(json_resp)
-            except Exception as e:
-                logger.error(f"解析图片响应失败: {e}")
-                # 尝试直接获取二进制数据
-                try:
-                    raw_data = await response.read()
-                    if raw_data and len(raw_data) > 100:  # 确保有足够的数据
-                        logger.info(f"成功获取图片二进制数据: {len(raw_data)} 字节")
-                        return raw_data
-                except Exception as bin_err:
-                    logger.error(f"获取图片二进制数据失败: {bin_err}")
+                        error_msg = json_resp.get("Message", "Unknown error")
+                        logger.error(f"下载图片失败: {error_msg}")
+                        self.error_handler(json_resp)
+                except Exception as e:
+                    logger.error(f"解析图片响应失败: {e}")
+                    # 尝试直接获取二进制数据
+                    try:
+                        raw_data = await response.read()
+                        if raw_data and len(raw_data) > 100:  # 确保有足够的数据
+                            logger.info(f"成功获取图片二进制数据: {len(raw_data)} 字节")
+                            return raw_data
+                    except Exception as bin_err:
+                        logger.error(f"获取图片二进制数据失败: {bin_err}")
 
             # 如果所有方法都失败，尝试使用另一个API端点
             try:
                 logger.debug(f"尝试使用备用API端点下载图片: MsgId={msg_id}")
                 simple_param = {"Wxid": self.wxid, "MsgId": int(msg_id)}
-                response = await session.post(f'http://{self.ip}:{self.port}/api/Msg/GetMsgImage', json=simple_param)
-                json_resp = await response.json()
+                async with session.post(f'http://{self.ip}:{self.port}/api/Msg/GetMsgImage', json=simple_param) as response:
+                    json_resp = await response.json()
 
                 if json_resp.get("Success"):
                     data = json_resp.get("Data")
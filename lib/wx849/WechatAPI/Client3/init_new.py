@@ -1,9 +1,11 @@
 try:
     # 尝试使用相对导入
     from ..errors import *
+    from ..transport import shared_session
 except ImportError:
     # 回退到绝对导入
     from WechatAPI.errors import *
+    from WechatAPI.transport import shared_session
 from .base import WechatAPIClientBase, Proxy, Section
 from .chatroom import ChatroomMixin
 from .friend import FriendMixin
@@ -81,11 +83,10 @@ class WechatAPIClient(LoginMixin, MessageMixin, FriendMixin, ChatroomMixin, User
         if not self.wxid:
             raise UserLoggedOut("请先登录")
             
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
+        async with shared_session() as session:
             json_param = {"Wxid": self.wxid}
-            response = await session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Msg/GetNewMsg', json=json_param)
-            json_resp = await response.json()
+            async with session.post(f'http://{self.ip}:{self.port}{self.api_path_prefix}/Msg/GetNewMsg', json=json_param) as response:
+                json_resp = await response.json()
             
             if json_resp.get("Success"):
                 return json_resp.get("Data", [])
@@ -3,11 +3,13 @@ try:
     from .Server.WechatAPIServer import *
     from .Client import *
     from .errors import *
+    from . import governor, transport
 except ImportError:
     # 回退到绝对导入
     from WechatAPI.Server.WechatAPIServer import *
     from WechatAPI.Client import *
     from WechatAPI.errors import *
+    from WechatAPI import governor, transport
 
 __name__ = "WechatAPI"
 __version__ = "1.0.0"
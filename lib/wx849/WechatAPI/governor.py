@@ -0,0 +1,236 @@
+"""WechatAPI 发送限速
+
+所有发送消息的请求都经过 :class:`OutboundGovernor`：全局和每个接收者各有一个令牌桶，
+允许一定的突发；同一接收者的消息按提交顺序逐条发送，不同接收者之间可以并行。
+刚发送过消息的接收者(多段回复的后续部分)优先于其他积压的消息。
+
+限速器与事件循环绑定：每个事件循环各自持有一个实例，通过 :func:`get_governor` 获取。
+"""
+import asyncio
+import time
+import weakref
+from collections import deque
+from typing import Callable, Optional
+
+from loguru import logger
+
+# 限速默认配置，可通过 configure() 修改
+_settings = {
+    "global_rate": 2.0,  # 全局每秒发送条数
+    "global_burst": 5,  # 全局突发条数
+    "recipient_rate": 1.0,  # 单个接收者每秒发送条数
+    "recipient_burst": 3,  # 单个接收者突发条数
+    "continuation_window": 5.0,  # 接收者上一条消息发出后多久内的新消息视为多段回复的后续部分(秒)
+}
+
+# 事件循环 -> 限速器
+_governors = weakref.WeakKeyDictionary()
+
+# 发送回调: hook(recipient, wait, depth)，wait 为排队等待时间，depth 为剩余排队数
+_observer: Optional[Callable[[str, float, int], None]] = None
+
+
+def configure(**kwargs):
+    """修改限速配置，只对之后新建的限速器生效
+
+    Args:
+        global_rate (float): 全局每秒发送条数
+        global_burst (int): 全局突发条数
+        recipient_rate (float): 单个接收者每秒发送条数
+        recipient_burst (int): 单个接收者突发条数
+        continuation_window (float): 多段回复的判定时间窗口(秒)
+    """
+    for key, value in kwargs.items():
+        if key not in _settings:
+            raise ValueError(f"未知的限速配置: {key}")
+        if value is not None:
+            _settings[key] = value
+
+
+def set_observer(hook: Optional[Callable[[str, float, int], None]]):
+    """设置发送回调，用于统计排队时间和队列长度
+
+    Args:
+        hook: 回调函数 hook(recipient, wait, depth)，传 None 取消
+    """
+    global _observer
+    _observer = hook
+
+
+def _report(recipient, wait, depth):
+    hook = _observer
+    if hook is None:
+        return
+    try:
+        hook(recipient, wait, depth)
+    except Exception as e:
+        logger.debug(f"发送回调出错: {e}")
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 burst 个"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now) -> float:
+        """距离有可用令牌还需等待的秒数，0 表示现在可用"""
+        self._refill(now)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class OutboundGovernor:
+    """发送调度器，rate 为 0 表示不限速"""
+
+    def __init__(self, global_rate=None, global_burst=None, recipient_rate=None, recipient_burst=None,
+                 continuation_window=None):
+        self.recipient_rate = _settings["recipient_rate"] if recipient_rate is None else recipient_rate
+        self.recipient_burst = _settings["recipient_burst"] if recipient_burst is None else recipient_burst
+        self.continuation_window = _settings["continuation_window"] if continuation_window is None else continuation_window
+        self._global = TokenBucket(_settings["global_rate"] if global_rate is None else global_rate,
+                                   _settings["global_burst"] if global_burst is None else global_burst)
+        self._buckets = {}  # 接收者 -> TokenBucket
+        self._queues = {}  # 接收者 -> deque[(入队时间, func, args, kwargs, future)]
+        self._busy = set()  # 正在发送的接收者
+        self._last_sent = {}  # 接收者 -> 上一条消息发送完成的时间
+        self._depth = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._sending = set()  # 持有发送任务的引用，避免被垃圾回收
+
+    @property
+    def depth(self) -> int:
+        """排队等待发送的消息数"""
+        return self._depth
+
+    async def submit(self, recipient, func, *args, **kwargs):
+        """排队发送，返回 await func(*args, **kwargs) 的结果"""
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(recipient, deque()).append((time.monotonic(), func, args, kwargs, future))
+        self._depth += 1
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    def _bucket(self, recipient):
+        bucket = self._buckets.get(recipient)
+        if bucket is None:
+            bucket = self._buckets[recipient] = TokenBucket(self.recipient_rate, self.recipient_burst)
+        return bucket
+
+    def _pick(self, now):
+        """
+        选择下一个发送的接收者
+        :return: (接收者, 0) 或 (None, 需要等待的秒数)，没有可发送的消息时等待时间为 None
+        """
+        best = None
+        min_delay = None
+        for recipient, queue in self._queues.items():
+            if not queue or recipient in self._busy:
+                continue
+            delay = self._bucket(recipient).delay(now)
+            if delay > 0:
+                min_delay = delay if min_delay is None else min(min_delay, delay)
+                continue
+            # 多段回复的后续部分优先，其次按排队先后
+            last = self._last_sent.get(recipient)
+            continuation = last is not None and now - last <= self.continuation_window
+            rank = (not continuation, queue[0][0])
+            if best is None or rank < best[0]:
+                best = (rank, recipient)
+        if best is None:
+            return None, min_delay
+        return best[1], 0
+
+    def _cleanup(self, now):
+        """清理空闲接收者的状态，令牌已补满的桶可以丢弃"""
+        for recipient in [r for r, q in self._queues.items() if not q and r not in self._busy]:
+            del self._queues[recipient]
+        for recipient in [r for r, b in self._buckets.items() if r not in self._queues and b.full(now)]:
+            del self._buckets[recipient]
+        for recipient in [r for r, t in self._last_sent.items() if now - t > self.continuation_window]:
+            del self._last_sent[recipient]
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            if self._depth == 0:
+                self._cleanup(now)
+                return
+            recipient, delay = self._pick(now)
+            if recipient is None:
+                # 没有可发送的接收者：等待令牌补充，或等待新消息/发送完成
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            enqueued, func, args, kwargs, future = self._queues[recipient].popleft()
+            self._depth -= 1
+            if future.done():
+                # 调用方已取消，不占用令牌
+                continue
+            self._global.take(now)
+            self._bucket(recipient).take(now)
+            self._busy.add(recipient)
+            _report(recipient, now - enqueued, self._depth)
+            task = asyncio.create_task(self._send(recipient, func, args, kwargs, future))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+            if len(self._buckets) > 1024:
+                self._cleanup(now)
+
+    async def _send(self, recipient, func, args, kwargs, future):
+        try:
+            result = await func(*args, **kwargs)
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        except BaseException:
+            # 发送被取消(CancelledError 不是 Exception 的子类)，同时取消调用方的 future，否则 submit() 会一直等待
+            if not future.done():
+                future.cancel()
+            raise
+        finally:
+            self._busy.discard(recipient)
+            self._last_sent[recipient] = time.monotonic()
+            self._wakeup.set()
+
+
+def get_governor() -> OutboundGovernor:
+    """获取当前事件循环的限速器，不存在时新建
+
+    必须在事件循环中调用。
+    """
+    loop = asyncio.get_running_loop()
+    governor = _governors.get(loop)
+    if governor is None:
+        governor = _governors[loop] = OutboundGovernor()
+    return governor
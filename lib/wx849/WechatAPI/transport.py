@@ -0,0 +1,154 @@
+"""WechatAPI 共享 HTTP 传输层
+
+所有 Client 的 Mixin 以及上层通道都通过 :func:`shared_session` 获取同一个 aiohttp 会话，
+复用到 849 服务的 TCP 连接，而不是每次请求都新建 ``aiohttp.ClientSession``。
+
+会话与事件循环绑定：只有通过 :func:`bind_loop` 登记的常驻事件循环持有共享会话，由 :func:`close_session` 关闭；
+其他事件循环(如插件通过 ``asyncio.run`` 临时创建的)上的请求每次使用独立会话，用完即关闭，不会遗留未关闭的连接。
+"""
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+import aiohttp
+from loguru import logger
+
+# 连接池与超时的默认配置，可通过 configure() 修改
+_settings = {
+    "limit": 100,  # 连接池最大连接数
+    "limit_per_host": 30,  # 单个主机的最大连接数
+    "keepalive_timeout": 60,  # 空闲连接保持时间(秒)
+    "read_timeout": 60,  # 等待响应数据的超时(秒)，两次收到数据之间的最长间隔，不限制上传请求体的时间
+    "media_read_timeout": 300,  # 上传和发送视频、语音、文件等媒体接口的读取超时(秒)
+    "connect_timeout": 10,  # 建立连接超时(秒)
+}
+
+# 常驻事件循环 -> 会话
+_sessions = weakref.WeakKeyDictionary()
+# 通过 bind_loop() 登记的常驻事件循环
+_resident_loops = weakref.WeakSet()
+
+# 请求耗时回调: hook(method, path, elapsed, status)，请求异常时 status 为 None
+_latency_hook: Optional[Callable[[str, str, float, Optional[int]], None]] = None
+
+
+def configure(**kwargs):
+    """修改连接池与超时配置，只对之后新建的会话生效
+
+    Args:
+        limit (int): 连接池最大连接数
+        limit_per_host (int): 单个主机的最大连接数
+        keepalive_timeout (float): 空闲连接保持时间(秒)
+        read_timeout (float): 等待响应数据的超时(秒)
+        media_read_timeout (float): 媒体接口的读取超时(秒)
+        connect_timeout (float): 建立连接超时(秒)
+    """
+    for key, value in kwargs.items():
+        if key not in _settings:
+            raise ValueError(f"未知的传输层配置: {key}")
+        if value is not None:
+            _settings[key] = value
+
+
+def set_latency_hook(hook: Optional[Callable[[str, str, float, Optional[int]], None]]):
+    """设置请求耗时回调，用于按接口统计延迟
+
+    Args:
+        hook: 回调函数 hook(method, path, elapsed, status)，传 None 取消
+    """
+    global _latency_hook
+    _latency_hook = hook
+
+
+def _report(method, path, elapsed, status):
+    hook = _latency_hook
+    if hook is None:
+        return
+    try:
+        hook(method, path, elapsed, status)
+    except Exception as e:
+        logger.debug(f"请求耗时回调出错: {e}")
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.start = time.monotonic()
+
+
+async def _on_request_end(session, ctx, params):
+    _report(params.method, params.url.path, time.monotonic() - ctx.start, params.response.status)
+
+
+async def _on_request_exception(session, ctx, params):
+    _report(params.method, params.url.path, time.monotonic() - ctx.start, None)
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=_settings["limit"],
+        limit_per_host=_settings["limit_per_host"],
+        keepalive_timeout=_settings["keepalive_timeout"],
+    )
+    # 不设置总超时，大文件上传只要连接和读取没有停滞就不会被中断
+    timeout = aiohttp.ClientTimeout(total=None, connect=_settings["connect_timeout"], sock_read=_settings["read_timeout"])
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_request_exception.append(_on_request_exception)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace_config])
+
+
+def media_timeout() -> aiohttp.ClientTimeout:
+    """上传和发送媒体的接口使用的超时，服务端处理大文件需要更长时间才返回，用法: session.post(url, timeout=media_timeout())"""
+    return aiohttp.ClientTimeout(total=None, connect=_settings["connect_timeout"], sock_read=_settings["media_read_timeout"])
+
+
+def bind_loop(loop: asyncio.AbstractEventLoop):
+    """登记常驻事件循环，之后该事件循环上的 :func:`shared_session` 复用同一个会话
+
+    Args:
+        loop: 常驻事件循环，结束前需在其中调用 :func:`close_session`
+    """
+    _resident_loops.add(loop)
+
+
+def get_session() -> aiohttp.ClientSession:
+    """获取当前事件循环的共享会话，不存在或已关闭时新建
+
+    必须在事件循环中调用，调用方负责在事件循环结束前调用 :func:`close_session`。
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _create_session()
+        _sessions[loop] = session
+    return session
+
+
+@asynccontextmanager
+async def shared_session():
+    """以 ``async with`` 方式使用共享会话，常驻事件循环上退出时不会关闭会话
+
+    不在常驻事件循环上时使用独立会话，退出时关闭。用法与 ``aiohttp.ClientSession()`` 相同::
+
+        async with shared_session() as session:
+            async with session.post(url, json=json_param) as response:
+                json_resp = await response.json()
+    """
+    if asyncio.get_running_loop() in _resident_loops:
+        yield get_session()
+        return
+    session = _create_session()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def close_session():
+    """关闭当前事件循环的共享会话，在事件循环结束前调用"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
@@ -8,7 +8,6 @@ import time
 import random
 import asyncio
 import nest_asyncio
-import requests
 from newspaper import Article
 import newspaper
 from bs4 import BeautifulSoup
@@ -25,6 +24,7 @@ except Exception as e:
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common import http_client
 from common.log import logger
 from plugins import *
 
@@ -122,7 +122,7 @@ class JinaSum(Plugin):
             logger.debug(f"[JinaSum] openai_chat_url: {openai_chat_url}, openai_headers: {openai_headers}, openai_payload: {openai_payload}")
             
             # 发送请求获取摘要
-            response = requests.post(openai_chat_url, headers=openai_headers, json=openai_payload, timeout=60)
+            response = http_client.post(openai_chat_url, headers=openai_headers, json=openai_payload, timeout=60)
             response.raise_for_status()
             result = response.json()['choices'][0]['message']['content']
             
@@ -175,7 +175,7 @@ class JinaSum(Plugin):
             logger.debug(f"[JinaSum] 使用Jina提取内容: {target_url}")
             jina_url = self._get_jina_url(target_url)
             headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"}
-            response = requests.get(jina_url, headers=headers, timeout=60)
+            response = http_client.get(jina_url, headers=headers, timeout=60)
             response.raise_for_status()
             return response.text
         except Exception as e:
@@ -203,7 +203,7 @@ class JinaSum(Plugin):
                         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
                         "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8"
                     }
-                    response = requests.head(url, headers=headers, allow_redirects=True, timeout=10)
+                    response = http_client.head(url, headers=headers, allow_redirects=True, timeout=10)
                     if response.status_code == 200:
                         real_url = response.url
                         logger.debug(f"[JinaSum] B站短链接解析结果: {real_url}")
@@ -237,8 +237,7 @@ class JinaSum(Plugin):
                     }
                     
                     # 直接请求
-                    session = requests.Session()
-                    response = session.get(url, headers=headers, cookies=cookies, timeout=20)
+                    response = http_client.get(url, headers=headers, cookies=cookies, timeout=20)
                     response.raise_for_status()
                     
                     # 使用BeautifulSoup解析
@@ -285,8 +284,7 @@ class JinaSum(Plugin):
                 article = Article(url, language='zh')
                 
                 # 手动下载
-                session = requests.Session()
-                response = session.get(url, headers=headers, timeout=30)
+                response = http_client.get(url, headers=headers, timeout=30)
                 response.raise_for_status()
                 
                 # 设置html内容
@@ -371,12 +369,9 @@ class JinaSum(Plugin):
             # 添加随机延迟
             time.sleep(random.uniform(0.5, 2))
             
-            # 创建会话
-            session = requests.Session()
-            
             # 发送请求
             logger.debug(f"[JinaSum] 通用方法请求: {url}")
-            response = session.get(url, headers=headers, timeout=30)
+            response = http_client.get(url, headers=headers, timeout=30)
             response.raise_for_status()
             
             # 确保编码正确
@@ -544,7 +539,7 @@ class JinaSum(Plugin):
                 }
             
             # 获取页面
-            response = session.get(url, headers=headers, timeout=30)
+            response = http_client.get(url, headers=headers, timeout=30)
             
             # 执行JavaScript (设置超时，防止无限等待)
             logger.debug("[JinaSum] 开始执行JavaScript")
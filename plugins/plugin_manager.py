@@ -1,5 +1,6 @@
 # encoding:utf-8
 
+import asyncio
 import importlib
 import importlib.util
 import json
@@ -7,8 +8,10 @@ import os
 import sys
 
 from common.log import logger
+from common.metrics import metrics
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
+from common.worker_pool import run_in_pool
 from config import conf, remove_plugin_config, write_plugin_config
 
 from .event import *
@@ -194,7 +197,35 @@ class PluginManager:
                 if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
                     logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
                     instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context, *args, **kwargs)
+                    handler = instance.handlers[e_context.event]
+                    with self._handler_timer(name, e_context):
+                        if asyncio.iscoroutinefunction(handler):
+                            # 异步插件在同步流水线中使用临时事件循环执行
+                            asyncio.run(handler(e_context, *args, **kwargs))
+                        else:
+                            handler(e_context, *args, **kwargs)
+                    if e_context.is_break():
+                        e_context["breaked_by"] = name
+                        logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
+        return e_context
+
+    @staticmethod
+    def _handler_timer(name, e_context: EventContext):
+        return metrics.timer("plugin_handler_seconds", {"plugin": name, "event": e_context.event.name}, doc="插件事件处理函数的耗时")
+
+    async def emit_event_async(self, e_context: EventContext, *args, **kwargs):
+        """emit_event 的协程版本：协程处理函数直接await，同步处理函数在llm线程池中执行"""
+        if e_context.event in self.listening_plugins:
+            for name in self.listening_plugins[e_context.event]:
+                if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
+                    logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
+                    instance = self.instances[name]
+                    handler = instance.handlers[e_context.event]
+                    with self._handler_timer(name, e_context):
+                        if asyncio.iscoroutinefunction(handler):
+                            await handler(e_context, *args, **kwargs)
+                        else:
+                            await run_in_pool("llm", handler, e_context, *args, **kwargs)
                     if e_context.is_break():
                         e_context["breaked_by"] = name
                         logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import unittest
+
+from aiohttp import web
+
+from lib.dify.async_dify_client import AsyncDifyClient, DifyAPIError, close_session
+
+
+class _StubDify(object):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def chat(self, request):
+        body = await request.json()
+        if request.headers.get("Authorization") != "Bearer app-test":
+            return web.json_response({"code": "unauthorized"}, status=401)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if body["response_mode"] == "blocking":
+                await asyncio.sleep(self.delay)
+                return web.json_response({"answer": body["query"], "conversation_id": "c1"})
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for piece in ("he", "llo"):
+                event = {"event": "message", "answer": piece, "conversation_id": "c1"}
+                # 故意把一个事件拆成两次写入
+                data = f"data: {json.dumps(event)}\n\n".encode()
+                await response.write(data[:7])
+                await response.write(data[7:])
+                await asyncio.sleep(self.delay)
+            await response.write(b'data: {"event": "message_end", "conversation_id": "c1"}\n\n')
+            return response
+        finally:
+            self.in_flight -= 1
+
+
+class TestAsyncDifyClient(unittest.TestCase):
+    def run_with_server(self, stub, scenario):
+        async def main():
+            app = web.Application()
+            app.router.add_post("/v1/chat-messages", stub.chat)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                return await scenario(f"http://127.0.0.1:{port}/v1")
+            finally:
+                await close_session()
+                await runner.cleanup()
+
+        return asyncio.run(main())
+
+    def test_concurrency_limit_per_key(self):
+        """测试同一个api key的并发请求数受限，不同客户端实例共享限制"""
+        stub = _StubDify(delay=0.05)
+
+        async def scenario(base):
+            clients = [AsyncDifyClient("app-test", base, max_concurrency=2) for _ in range(3)]
+            results = await asyncio.gather(*[clients[i % 3].create_chat_message({}, f"q{i}", "u") for i in range(6)])
+            return [r["answer"] for r in results]
+
+        self.assertEqual(self.run_with_server(stub, scenario), [f"q{i}" for i in range(6)])
+        self.assertEqual(stub.max_in_flight, 2)
+
+    def test_deadline_and_errors(self):
+        """测试超过截止时间抛出TimeoutError并释放并发名额，HTTP错误抛出DifyAPIError"""
+        stub = _StubDify(delay=0.5)
+
+        async def scenario(base):
+            client = AsyncDifyClient("app-test", base, max_concurrency=1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.create_chat_message({}, "slow", "u", timeout=0.1)
+            stub.delay = 0
+            self.assertEqual((await client.create_chat_message({}, "fast", "u", timeout=1))["answer"], "fast")
+            with self.assertRaises(DifyAPIError) as cm:
+                await AsyncDifyClient("app-bad", base).create_chat_message({}, "q", "u")
+            self.assertEqual(cm.exception.status, 401)
+
+        self.run_with_server(stub, scenario)
+
+    def test_stream_idle_timeout(self):
+        """测试流式响应的截止时间只限制到第一个事件，之后按两次数据之间的间隔判断超时"""
+        stub = _StubDify(delay=0.1)
+
+        async def scenario(base):
+            client = AsyncDifyClient("app-test", base, timeout=0.15)
+            events = [e async for e in client.stream_chat_message({}, "q", "u")]
+            self.assertEqual(events[-1]["event"], "message_end")
+            stub.delay = 0.3
+            with self.assertRaises(asyncio.TimeoutError):
+                async for _ in client.stream_chat_message({}, "q", "u"):
+                    pass
+
+        self.run_with_server(stub, scenario)
+
+    def test_stream_and_cancel(self):
+        """测试流式事件解析，以及调用方任务取消时中断请求并释放并发名额"""
+        stub = _StubDify(delay=0.01)
+
+        async def scenario(base):
+            client = AsyncDifyClient("app-test", base, max_concurrency=1)
+            events = [e async for e in client.stream_chat_message({}, "q", "u")]
+            self.assertEqual([e["event"] for e in events], ["message", "message", "message_end"])
+            self.assertEqual("".join(e.get("answer", "") for e in events), "hello")
+
+            stub.delay = 1
+
+            async def consume():
+                async for _ in client.stream_chat_message({}, "q", "u"):
+                    pass
+
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            stub.delay = 0
+            return (await client.create_chat_message({}, "after", "u", timeout=1))["answer"]
+
+        self.assertEqual(self.run_with_server(stub, scenario), "after")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from bot.bot import Bot
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from channel.chat_channel import ChatChannel
+from common.count_index import MaxCountIndex
+from common.fair_queue import WeightedFairQueue
+
+
+class AsyncChannel(ChatChannel):
+    def __init__(self, loop):
+        # 每个实例使用独立的调度状态，避免与其他测试的consume线程共享
+        self.sessions = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.ready_sessions = WeightedFairQueue()
+        self.ready_set = set()
+        self.droppable = MaxCountIndex()
+        self.async_loop = loop
+        self.sent = []
+        super().__init__()
+
+    async def async_build_reply_content(self, query, context=None):
+        await asyncio.sleep(0.2)
+        return Reply(ReplyType.TEXT, "re:" + query)
+
+    def send(self, reply, context):
+        self.sent.append((context["receiver"], reply.content))
+
+
+class SyncBot(Bot):
+    def reply(self, query, context=None):
+        return Reply(ReplyType.TEXT, threading.current_thread().name)
+
+
+class TestAsyncPipeline(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def test_concurrent_sessions(self):
+        """测试异步流水线中大量会话同时等待回复，不需要对应数量的线程"""
+        channel = AsyncChannel(self.loop)
+        threads = threading.active_count()
+        for i in range(200):
+            channel.produce(Context(ContextType.TEXT, f"m{i}", kwargs={"session_id": f"s{i}", "receiver": f"s{i}"}))
+        deadline = time.monotonic() + 5
+        while len(channel.sent) < 200 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(len(channel.sent), 200)
+        self.assertIn(("s7", "re:m7"), channel.sent)
+        self.assertLess(threading.active_count() - threads, 20)
+
+    def test_sync_bot_adapter(self):
+        """测试同步bot的async_reply在llm线程池中执行"""
+        reply = asyncio.run_coroutine_threadsafe(SyncBot().async_reply("hi"), self.loop).result(5)
+        self.assertTrue(reply.content.startswith("llm-pool"))
+
+
+if __name__ == "__main__":
+    unittest.main()
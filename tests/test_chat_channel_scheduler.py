@@ -0,0 +1,184 @@
+import threading
+import time
+import unittest
+
+from bridge.context import Context, ContextType
+from channel.chat_channel import ChatChannel
+from common.count_index import MaxCountIndex
+from common.fair_queue import WeightedFairQueue
+from config import conf
+
+
+class RecordChannel(ChatChannel):
+    def __init__(self, delay=0.0):
+        # 每个实例使用独立的调度状态，避免与其他测试的consume线程共享
+        self.sessions = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.ready_sessions = WeightedFairQueue()
+        self.ready_set = set()
+        self.droppable = MaxCountIndex()
+        self.coalescing = {}
+        self.delay = delay
+        self.handled = []
+        self.running = {}
+        self.max_running = {}
+        self.record_lock = threading.Lock()
+        super().__init__()
+
+    def _handle(self, context):
+        session_id = context["session_id"]
+        with self.record_lock:
+            self.running[session_id] = self.running.get(session_id, 0) + 1
+            self.max_running[session_id] = max(self.max_running.get(session_id, 0), self.running[session_id])
+        time.sleep(self.delay)
+        with self.record_lock:
+            self.running[session_id] -= 1
+            self.handled.append((session_id, context.content))
+
+
+def _context(session_id, content):
+    return Context(ContextType.TEXT, content, kwargs={"session_id": session_id})
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestChatChannelScheduler(unittest.TestCase):
+    def setUp(self):
+        self._saved = {k: conf().get(k) for k in ("concurrency_in_session", "session_queue_max_size", "global_queue_max_size",
+                                                  "queue_overflow_policy", "queue_max_age", "coalesce_window")}
+
+    def tearDown(self):
+        for key, value in self._saved.items():
+            conf()[key] = value
+
+    def _overflow(self, policy, session_id):
+        """第一条消息处理中时再发送4条，session队列最多排队2条"""
+        conf()["concurrency_in_session"] = 1
+        conf()["session_queue_max_size"] = 2
+        conf()["queue_overflow_policy"] = policy
+        channel = RecordChannel(delay=0.1)
+        channel.produce(_context(session_id, "0"))
+        self.assertTrue(_wait(lambda: channel.running.get(session_id) == 1))
+        for i in range(1, 5):
+            channel.produce(_context(session_id, str(i)))
+        self.assertTrue(_wait(lambda: not channel.sessions))
+        return [c for _, c in channel.handled]
+
+    def test_session_order_and_cleanup(self):
+        """测试并发为1时session内按顺序处理，处理完后session被删除"""
+        conf()["concurrency_in_session"] = 1
+        channel = RecordChannel(delay=0.01)
+        for i in range(5):
+            for s in ("a", "b"):
+                channel.produce(_context(s, f"{s}{i}"))
+        self.assertTrue(_wait(lambda: len(channel.handled) == 10))
+        for s in ("a", "b"):
+            self.assertEqual([c for sid, c in channel.handled if sid == s], [f"{s}{i}" for i in range(5)])
+            self.assertEqual(channel.max_running[s], 1)
+        self.assertTrue(_wait(lambda: not channel.sessions))
+
+    def test_concurrency_limit(self):
+        """测试session内并发不超过 concurrency_in_session"""
+        conf()["concurrency_in_session"] = 2
+        channel = RecordChannel(delay=0.05)
+        for i in range(6):
+            channel.produce(_context("c", str(i)))
+        self.assertTrue(_wait(lambda: len(channel.handled) == 6))
+        self.assertEqual(channel.max_running["c"], 2)
+
+    def test_cancel_session(self):
+        """测试取消session时清空排队的消息"""
+        conf()["concurrency_in_session"] = 1
+        channel = RecordChannel(delay=0.1)
+        for i in range(5):
+            channel.produce(_context("d", str(i)))
+        time.sleep(0.02)
+        channel.cancel_session("d")
+        self.assertTrue(_wait(lambda: not channel.sessions))
+        self.assertLess(len(channel.handled), 5)
+        self.assertEqual(len(channel.droppable), 0)
+
+        # 静默期内等待合并的消息还没有进入session队列，取消后也不能再被处理
+        conf()["coalesce_window"] = 0.1
+        handled = len(channel.handled)
+        for content in ("你好", "请问"):
+            channel.produce(_context("d", content))
+            channel.produce(_context("d2", content))
+        channel.cancel_session("d")
+        channel.cancel_all_session()
+        self.assertEqual(channel.coalescing, {})
+        time.sleep(0.3)
+        self.assertEqual(len(channel.handled), handled)
+
+    def test_overflow_policies(self):
+        """测试队列满时的丢弃和合并策略"""
+        self.assertEqual(self._overflow("drop_oldest", "e"), ["0", "3", "4"])
+        self.assertEqual(self._overflow("drop_newest", "f"), ["0", "1", "2"])
+        self.assertEqual(self._overflow("merge", "g"), ["0", "1", "2\n3\n4"])
+
+    def test_drop_oldest_keeps_admin_command(self):
+        """测试drop_oldest不丢弃排在队首的管理命令"""
+        conf()["concurrency_in_session"] = 1
+        conf()["session_queue_max_size"] = 2
+        conf()["queue_overflow_policy"] = "drop_oldest"
+        channel = RecordChannel(delay=0.1)
+        channel.produce(_context("h", "0"))
+        self.assertTrue(_wait(lambda: channel.running.get("h") == 1))
+        for content in ("1", "#help", "2", "3"):
+            channel.produce(_context("h", content))
+        self.assertTrue(_wait(lambda: not channel.sessions))
+        self.assertEqual([c for _, c in channel.handled], ["0", "#help", "2", "3"])
+        self.assertEqual(len(channel.droppable), 0)
+
+    def test_drop_oldest_global_limit(self):
+        """测试全局队列满而session队列未满时，从排队最多的session中丢弃"""
+        conf()["concurrency_in_session"] = 1
+        conf()["global_queue_max_size"] = 3
+        conf()["queue_overflow_policy"] = "drop_oldest"
+        channel = RecordChannel(delay=0.1)
+        channel.produce(_context("i", "i0"))
+        channel.produce(_context("j", "j0"))
+        self.assertTrue(_wait(lambda: channel.running.get("i") == 1 and channel.running.get("j") == 1))
+        for content in ("i1", "i2", "j1", "j2"):
+            channel.produce(_context(content[0], content))
+        self.assertTrue(_wait(lambda: not channel.sessions))
+        self.assertEqual([c for sid, c in channel.handled if sid == "i"], ["i0", "i2"])
+        self.assertEqual([c for sid, c in channel.handled if sid == "j"], ["j0", "j1", "j2"])
+        self.assertEqual(len(channel.droppable), 0)
+
+    def test_expire(self):
+        """测试排队超过 queue_max_age 的消息被丢弃"""
+        conf()["concurrency_in_session"] = 1
+        conf()["queue_max_age"] = 0.05
+        channel = RecordChannel(delay=0.1)
+        for i in range(3):
+            channel.produce(_context("h", str(i)))
+        self.assertTrue(_wait(lambda: not channel.sessions))
+        self.assertEqual(channel.handled, [("h", "0")])
+        self.assertEqual(channel.queued, 0)
+
+    def test_coalesce(self):
+        """测试静默期内的连续文字消息合并为一条，命令和其他类型的消息不合并"""
+        conf()["concurrency_in_session"] = 1
+        conf()["coalesce_window"] = 0.1
+        channel = RecordChannel()
+        for content in ("你好", "请问", "#help", "天气怎么样"):
+            channel.produce(_context("i", content))
+        self.assertTrue(_wait(lambda: len(channel.handled) == 2))
+        self.assertEqual([c for _, c in channel.handled], ["#help", "你好\n请问\n天气怎么样"])
+
+        channel.produce(_context("j", "看看这张图"))
+        channel.produce(Context(ContextType.IMAGE, "/tmp/a.png", kwargs={"session_id": "j"}))
+        self.assertTrue(_wait(lambda: len(channel.handled) == 4))
+        self.assertEqual([c for _, c in channel.handled[2:]], ["看看这张图", "/tmp/a.png"])
+
+
+if __name__ == "__main__":
+    unittest.main()
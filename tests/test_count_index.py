@@ -0,0 +1,37 @@
+import unittest
+
+from common.count_index import MaxCountIndex
+
+
+class TestMaxCountIndex(unittest.TestCase):
+    def test_max_key(self):
+        """测试增减计数后取计数最大的键，计数相同时取最早达到的键"""
+        index = MaxCountIndex()
+        self.assertIsNone(index.max_key())
+        index.add("a", 2)
+        index.add("b")
+        index.add("b")
+        self.assertEqual(index.max_key(), "a")
+        index.add("b")
+        self.assertEqual(index.max_key(), "b")
+        index.add("b", -2)
+        self.assertEqual(index.max_key(), "a")
+        self.assertEqual((index.count("a"), index.count("b"), index.count("c")), (2, 1, 0))
+
+    def test_remove(self):
+        """测试清零后键不再保存，全部清零后没有最大键"""
+        index = MaxCountIndex()
+        index.add("a", 5)
+        index.add("b", 1)
+        index.remove("a")
+        self.assertEqual(index.max_key(), "b")
+        index.add("b", -1)
+        index.remove("c")
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.max_key())
+        with self.assertRaises(ValueError):
+            index.add("a", -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
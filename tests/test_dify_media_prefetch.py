@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bot.dify.dify_bot import DifyBot
+from bot.dify.dify_session import DifySession
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+from config import conf
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with _Handler.lock:
+            _Handler.in_flight += 1
+            _Handler.max_in_flight = max(_Handler.max_in_flight, _Handler.in_flight)
+        try:
+            time.sleep(0.3)
+            if self.path.startswith("/missing"):
+                self._reply(404, b"not found")
+            elif self.path.startswith("/big"):
+                self._reply(200, b"x" * (2 * 1024 * 1024))
+            else:
+                self._reply(200, self.path.encode())
+        finally:
+            with _Handler.lock:
+                _Handler.in_flight -= 1
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Channel(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append(reply)
+
+
+class TestDifyMediaPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._conf = {k: conf().get(k) for k in ("dify_download_max_mb", "dify_download_concurrency")}
+        conf().update({"dify_download_max_mb": 1, "dify_download_concurrency": 4})
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        conf().update(self._conf)
+
+    def test_parallel_download_in_order(self):
+        """测试图片并行下载、按原顺序发送，下载失败和超过大小上限时回复链接"""
+        answer = (f"第一张 ![a]({self.base}/a.png) 第二张 ![b]({self.base}/missing.png) "
+                  f"第三张 ![c]({self.base}/big.png) ![d]({self.base}/d.png)")
+        channel = _Channel()
+        context = Context(ContextType.TEXT, "q", {"channel": channel, "isgroup": False})
+        session = DifySession("s1", "u1")
+
+        start = time.monotonic()
+        final_reply, err = DifyBot()._chatbot_reply({"answer": answer, "conversation_id": "c1"}, session, context)
+        elapsed = time.monotonic() - start
+
+        self.assertIsNone(err)
+        replies = channel.sent + [final_reply]
+        types = [r.type for r in replies]
+        self.assertEqual(types, [ReplyType.TEXT, ReplyType.IMAGE, ReplyType.TEXT, ReplyType.TEXT,
+                                 ReplyType.TEXT, ReplyType.TEXT, ReplyType.IMAGE])
+        self.assertEqual(replies[1].content.read(), b"/a.png")
+        self.assertEqual(replies[3].content, f"图片链接：{self.base}/missing.png")
+        self.assertEqual(replies[5].content, f"图片链接：{self.base}/big.png")
+        self.assertGreater(_Handler.max_in_flight, 1)
+        self.assertLess(elapsed, 1.0)  # 串行下载需要1.2秒以上
+
+    def test_agent_files_sent_in_order(self):
+        """测试agent回复中的文件并行下载，与文字按原顺序发送"""
+        msgs = [
+            {"type": "message_file", "content": {"url": f"{self.base}/a.png"}},
+            {"type": "agent_message", "content": "中间的文字"},
+            {"type": "message_file", "content": {"url": f"{self.base}/b.png"}},
+            {"type": "agent_message", "content": "结束"},
+        ]
+        channel = _Channel()
+        context = Context(ContextType.TEXT, "q", {"channel": channel, "isgroup": False})
+
+        start = time.monotonic()
+        final_reply, err = DifyBot()._agent_reply(msgs, "c1", DifySession("s2", "u1"), context)
+        elapsed = time.monotonic() - start
+
+        self.assertIsNone(err)
+        self.assertEqual([r.type for r in channel.sent], [ReplyType.IMAGE, ReplyType.TEXT, ReplyType.IMAGE])
+        self.assertEqual(channel.sent[2].content.read(), b"/b.png")
+        self.assertEqual(final_reply.content, "结束")
+        self.assertLess(elapsed, 0.55)  # 串行下载需要0.6秒以上
+
+
+if __name__ == "__main__":
+    unittest.main()
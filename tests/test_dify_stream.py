@@ -0,0 +1,34 @@
+import unittest
+
+from bot.dify.dify_stream import StreamSegmenter
+
+
+class TestStreamSegmenter(unittest.TestCase):
+    def test_split_on_boundaries(self):
+        """测试在段落和句子边界切分，不足最少字数时继续累积"""
+        segmenter = StreamSegmenter(min_chars=10, flush_interval=0)
+        self.assertEqual(segmenter.feed("你好。"), [])
+        self.assertEqual(segmenter.feed("今天天气很好，适合出门散步。明天"), ["你好。今天天气很好，适合出门散步。"])
+        self.assertEqual(segmenter.feed("可能会下雨，记得带伞\n\n"), ["明天可能会下雨，记得带伞"])
+        self.assertEqual(segmenter.feed("see https://a.b/c.d?x=1 ok"), [])
+        self.assertEqual(segmenter.flush(), "see https://a.b/c.d?x=1 ok")
+        self.assertEqual(segmenter.flush(), "")
+
+    def test_flush_interval(self):
+        """测试距上次切分不足间隔时只在段落边界切分"""
+        segmenter = StreamSegmenter(min_chars=5, flush_interval=60)
+        self.assertEqual(segmenter.feed("第一句话说完了。第二句"), ["第一句话说完了。"])
+        self.assertEqual(segmenter.feed("话也说完了。"), [])
+        self.assertEqual(segmenter.feed("\n\n第三段"), ["第二句话也说完了。"])
+
+    def test_no_split_inside_code_or_link(self):
+        """测试不在未闭合的代码块和markdown链接中间切分"""
+        segmenter = StreamSegmenter(min_chars=5, flush_interval=0)
+        self.assertEqual(segmenter.feed("代码如下：\n```\nx = 1. \n\n"), [])
+        self.assertEqual(segmenter.feed("```\n\n"), ["代码如下：\n```\nx = 1. \n\n```"])
+        self.assertEqual(segmenter.feed("图片 ![img](/files/a.png?sign=1. "), [])
+        self.assertEqual(segmenter.feed("2) 结束。"), ["图片 ![img](/files/a.png?sign=1. 2) 结束。"])
+
+
+if __name__ == "__main__":
+    unittest.main()
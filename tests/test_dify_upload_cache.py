@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from bot.dify.dify_upload_cache import UploadCache
+
+
+class TestUploadCache(unittest.TestCase):
+    def test_concurrent_uploads_coalesced_and_cached(self):
+        """测试同一个key的并发上传只执行一次，之后直接命中缓存"""
+        cache = UploadCache(ttl=60)
+        calls = []
+
+        def upload():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"id": "f1"}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_upload("k", upload))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [{"id": "f1"}] * 5)
+        self.assertEqual(cache.get_or_upload("k", upload), {"id": "f1"})
+        self.assertEqual(len(calls), 1)
+
+    def test_failure_not_cached(self):
+        """测试上传失败的结果不缓存，下次重新上传"""
+        cache = UploadCache(ttl=60)
+        self.assertIsNone(cache.get_or_upload("k", lambda: None))
+        with self.assertRaises(RuntimeError):
+            cache.get_or_upload("k", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+        self.assertEqual(cache.get_or_upload("k", lambda: {"id": "f2"}), {"id": "f2"})
+
+    def test_async_shares_cache_with_sync(self):
+        """测试异步上传的并发合并，以及与同步调用共享缓存"""
+        cache = UploadCache(ttl=60)
+        calls = []
+
+        async def upload():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"id": "f3"}
+
+        async def main():
+            return await asyncio.gather(*[cache.get_or_upload_async("k", upload) for _ in range(3)])
+
+        self.assertEqual(asyncio.run(main()), [{"id": "f3"}] * 3)
+        self.assertEqual(cache.get_or_upload("k", lambda: {"id": "other"}), {"id": "f3"})
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from common.fair_queue import WeightedFairQueue
+
+
+class TestWeightedFairQueue(unittest.TestCase):
+    def test_weighted_share(self):
+        """测试各类别都排队时出队次数按权重比例分配，类别内先进先出"""
+        queue = WeightedFairQueue({"private": 2, "group": 1})
+        for i in range(30):
+            queue.append(f"g{i}", "group")
+            queue.append(f"p{i}", "private")
+        popped = [queue.popleft() for _ in range(30)]
+        classes = [cls for _, cls in popped]
+        self.assertEqual(classes.count("private"), 20)
+        self.assertEqual(classes.count("group"), 10)
+        self.assertEqual([item for item, cls in popped if cls == "group"], [f"g{i}" for i in range(10)])
+        self.assertEqual(len(queue), 30)
+
+    def test_idle_class_no_credit(self):
+        """测试空闲类别重新排队时不会因空闲积累额度而连续出队"""
+        queue = WeightedFairQueue({"private": 1, "group": 1})
+        for i in range(10):
+            queue.append(i, "group")
+        for _ in range(8):
+            queue.popleft()
+        queue.append("p0", "private")
+        queue.append("p1", "private")
+        queue.append(10, "group")
+        classes = [queue.popleft()[1] for _ in range(4)]
+        self.assertEqual(sorted(classes[:2]), ["group", "private"])
+        self.assertRaises(IndexError, lambda: [queue.popleft() for _ in range(2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
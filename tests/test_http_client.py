@@ -0,0 +1,89 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import http_client
+from common.metrics import metrics
+from config import conf
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持长连接
+    connections = set()
+    failures = 0
+
+    def setup(self):
+        super().setup()
+        _Handler.connections.add(self.client_address)
+
+    def do_GET(self):
+        if self.path == "/flaky" and _Handler.failures:
+            _Handler.failures -= 1
+            self._reply(503, b"busy")
+        else:
+            self._reply(200, b"ok", {"Set-Cookie": "sid=1"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply(503 if self.path == "/flaky" else 200, self.headers.get("Cookie", "").encode())
+
+    def _reply(self, status, body, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        _Handler.connections = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._dify_api_base = conf().get("dify_api_base")
+
+    def tearDown(self):
+        conf()["dify_api_base"] = self._dify_api_base
+        http_client.close_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive_and_metrics(self):
+        """测试配置的接口主机复用连接，并按主机记录耗时"""
+        conf()["dify_api_base"] = self.base + "/v1"
+        http_client.close_all()
+        host = self.base[len("http://"):]
+        before = metrics.histogram("http_client_request_seconds", labels={"host": host}).count
+        for _ in range(5):
+            self.assertEqual(http_client.get(self.base + "/").text, "ok")
+        self.assertEqual(len(_Handler.connections), 1)
+        self.assertEqual(metrics.histogram("http_client_request_seconds", labels={"host": host}).count - before, 5)
+
+    def test_other_hosts_share_session(self):
+        """测试未配置的主机共用一个会话，指标统一记为 other"""
+        other = f"http://localhost:{self.server.server_address[1]}"
+        before = metrics.histogram("http_client_request_seconds", labels={"host": "other"}).count
+        self.assertIs(http_client.get_session(self.base + "/"), http_client.get_session(other + "/"))
+        http_client.get(self.base + "/")
+        http_client.get(other + "/")
+        self.assertEqual(metrics.histogram("http_client_request_seconds", labels={"host": "other"}).count - before, 2)
+
+    def test_retry_idempotent_only(self):
+        """测试GET在503时重试，POST不重复发送"""
+        _Handler.failures = 1
+        self.assertEqual(http_client.get(self.base + "/flaky").status_code, 200)
+        self.assertEqual(http_client.post(self.base + "/flaky", json={}).status_code, 503)
+
+    def test_no_shared_cookies(self):
+        """测试共享会话不保存响应中的cookie"""
+        http_client.get(self.base + "/")
+        self.assertEqual(http_client.post(self.base + "/", json={}).text, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
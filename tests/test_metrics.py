@@ -0,0 +1,57 @@
+import asyncio
+import unittest
+import urllib.request
+
+from common.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    def test_timed_disabled_and_enabled(self):
+        """测试未开启时不记录耗时，开启后同步和协程函数都会记录"""
+        registry = MetricsRegistry()
+
+        @registry.timed("stage_seconds", {"stage": "sync"})
+        def work(x):
+            return x * 2
+
+        @registry.timed("stage_seconds", {"stage": "async"})
+        async def async_work(x):
+            return x * 3
+
+        self.assertEqual(work(1), 2)
+        with registry.timer("block_seconds"):
+            pass
+        self.assertEqual(registry.histogram("stage_seconds", {"stage": "sync"}).count, 0)
+        self.assertEqual(registry.histogram("block_seconds").count, 0)
+
+        registry.enabled = True
+        self.assertEqual(work(2), 4)
+        self.assertEqual(asyncio.run(async_work(2)), 6)
+        with registry.timer("block_seconds"):
+            pass
+        self.assertEqual(registry.histogram("stage_seconds", {"stage": "sync"}).count, 1)
+        self.assertEqual(registry.histogram("stage_seconds", {"stage": "async"}).count, 1)
+        self.assertEqual(registry.histogram("block_seconds").count, 1)
+
+    def test_http_server(self):
+        """测试指标接口输出Prometheus文本格式"""
+        registry = MetricsRegistry()
+        registry.counter("requests_total", {"path": 'a"b'}, doc="请求数").inc(3)
+        registry.histogram("latency_seconds", buckets=(0.1, 1)).observe(0.5)
+        server = registry.start_http_server(0)
+        try:
+            port = server.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as resp:
+                self.assertTrue(resp.headers["Content-Type"].startswith("text/plain"))
+                body = resp.read().decode("utf-8")
+        finally:
+            server.shutdown()
+        self.assertIn("# TYPE requests_total counter", body)
+        self.assertIn('requests_total{path="a\\"b"} 3', body)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 0', body)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 1', body)
+        self.assertIn("latency_seconds_count 1", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from channel.chat_channel import ChatChannel
+from common.count_index import MaxCountIndex
+from common.fair_queue import WeightedFairQueue
+from config import conf
+
+
+class FlakyChannel(ChatChannel):
+    def __init__(self, failures):
+        self.sessions = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.ready_sessions = WeightedFairQueue()
+        self.ready_set = set()
+        self.droppable = MaxCountIndex()
+        self.retry_pending = {}
+        self.failures = failures
+        self.attempts = []
+        super().__init__()
+
+    def send(self, reply, context):
+        self.attempts.append(time.monotonic())
+        if len(self.attempts) <= self.failures:
+            raise ConnectionError("send failed")
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class _RetryTestCase(unittest.TestCase):
+    def setUp(self):
+        self._saved = {k: conf().get(k) for k in ("appdata_dir", "send_retry_base_delay", "send_retry_max")}
+        self.tmp = tempfile.TemporaryDirectory()
+        conf()["appdata_dir"] = self.tmp.name
+        conf()["send_retry_base_delay"] = 0.05
+        conf()["send_retry_max"] = 2
+
+    def tearDown(self):
+        for key, value in self._saved.items():
+            conf()[key] = value
+        self.tmp.cleanup()
+
+    def _context(self):
+        return Context(ContextType.TEXT, "hi", kwargs={"receiver": "wxid_a", "session_id": "wxid_a"})
+
+
+class TestSendRetry(_RetryTestCase):
+    def test_retry_without_blocking(self):
+        """测试发送失败时立即返回，由调度器延迟重试"""
+        channel = FlakyChannel(failures=1)
+        start = time.monotonic()
+        channel._send(Reply(ReplyType.TEXT, "hello"), self._context())
+        self.assertLess(time.monotonic() - start, 0.03)
+        self.assertTrue(_wait(lambda: len(channel.attempts) == 2))
+        self.assertGreaterEqual(channel.attempts[1] - channel.attempts[0], 0.03)
+        self.assertEqual(channel.retry_pending, {})
+
+    def test_dead_letter(self):
+        """测试重试用尽后写入死信日志"""
+        channel = FlakyChannel(failures=10)
+        channel._send(Reply(ReplyType.TEXT, "hello"), self._context())
+        path = os.path.join(self.tmp.name, "send_dead_letter.log")
+        self.assertTrue(_wait(lambda: os.path.exists(path)))
+        self.assertEqual(len(channel.attempts), 3)
+        with open(path, encoding="utf-8") as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record["receiver"], "wxid_a")
+        self.assertEqual(record["retry_cnt"], 2)
+        self.assertEqual(record["content"], "hello")
+
+
+class TestWX849SendRetry(_RetryTestCase):
+    def setUp(self):
+        super().setUp()
+        from channel.wx849.wx849_channel import WX849Channel
+
+        self.channel = WX849Channel()
+        self.channel.wxid = "wxid_bot"
+        self.thread = threading.Thread(target=self.channel.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.calls = []
+
+    def tearDown(self):
+        self.channel.loop.call_soon_threadsafe(self.channel.loop.stop)
+        self.thread.join()
+        super().tearDown()
+
+    def _fake_api(self, results):
+        async def call_api(path, params):
+            self.calls.append(params["Content"])
+            return results[min(len(self.calls), len(results)) - 1]
+
+        self.channel._call_api = call_api
+
+    def test_retry_failed_result(self):
+        """测试wx849发送返回Success为False时，由 ChatChannel._send 安排重试"""
+        self._fake_api([{"Success": False, "Message": "busy"}, None, {"Success": True}])
+        self.channel._send(Reply(ReplyType.TEXT, "hello"), self._context())
+        self.assertTrue(_wait(lambda: len(self.calls) == 3))
+        time.sleep(0.2)
+        self.assertEqual(self.calls, ["hello"] * 3)
+
+    def test_dead_letter_after_failures(self):
+        """测试wx849发送一直失败时重试用尽后写入死信日志"""
+        self._fake_api([{"Success": False}])
+        self.channel._send(Reply(ReplyType.TEXT, "hello"), self._context())
+        path = os.path.join(self.tmp.name, "send_dead_letter.log")
+        self.assertTrue(_wait(lambda: os.path.exists(path)))
+        self.assertEqual(len(self.calls), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+
+from common.singleflight import AsyncSingleFlight
+
+
+class TestAsyncSingleFlight(unittest.TestCase):
+    def test_coalesce(self):
+        """测试相同key的并发调用只执行一次并共享结果，不同key分别执行，完成后可以再次执行"""
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(0.05)
+            return f"value-{key}"
+
+        async def main():
+            flight = AsyncSingleFlight("test_coalesce")
+            results = await asyncio.gather(*[flight.do(k, fetch, k) for k in ("a", "a", "b", "a")])
+            self.assertFalse(flight.in_flight("a"))
+            results.append(await flight.do("a", fetch, "a"))
+            return results
+
+        self.assertEqual(asyncio.run(main()), ["value-a", "value-a", "value-b", "value-a", "value-a"])
+        self.assertEqual(calls, ["a", "b", "a"])
+
+    def test_error_propagation(self):
+        """测试执行出错时所有等待方都收到同一个异常，之后的调用重新执行"""
+        attempts = []
+
+        async def fetch():
+            attempts.append(1)
+            await asyncio.sleep(0.05)
+            if len(attempts) == 1:
+                raise ValueError("boom")
+            return "ok"
+
+        async def main():
+            flight = AsyncSingleFlight("test_error")
+            results = await asyncio.gather(*[flight.do("k", fetch) for _ in range(3)], return_exceptions=True)
+            self.assertTrue(all(isinstance(r, ValueError) for r in results))
+            return await flight.do("k", fetch)
+
+        self.assertEqual(asyncio.run(main()), "ok")
+        self.assertEqual(len(attempts), 2)
+
+    def test_waiter_cancel_and_concurrency(self):
+        """测试等待方被取消不影响执行中的调用，max_concurrency限制不同key的并发数"""
+        running = []
+        peak = []
+
+        async def fetch(key):
+            running.append(key)
+            peak.append(len(running))
+            await asyncio.sleep(0.05)
+            running.remove(key)
+            return key
+
+        async def main():
+            flight = AsyncSingleFlight("test_limit", max_concurrency=2)
+            owner = asyncio.ensure_future(flight.do("a", fetch, "a"))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(flight.do("a", fetch, "a"))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            others = await asyncio.gather(*[flight.do(k, fetch, k) for k in ("b", "c", "d")])
+            return await owner, others
+
+        self.assertEqual(asyncio.run(main()), ("a", ["b", "c", "d"]))
+        self.assertLessEqual(max(peak), 2)
+
+    def test_leader_cancel(self):
+        """测试执行方被取消时，等待方不会收到CancelledError，而是接替重新执行"""
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def main():
+            flight = AsyncSingleFlight("test_leader_cancel")
+            leader = asyncio.ensure_future(flight.do("k", fetch))
+            await asyncio.sleep(0)
+            waiters = [asyncio.ensure_future(flight.do("k", fetch)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await asyncio.gather(*waiters)
+
+        self.assertEqual(asyncio.run(main()), ["ok", "ok"])
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
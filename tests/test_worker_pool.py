@@ -0,0 +1,59 @@
+import threading
+import time
+import unittest
+
+from common.worker_pool import AdaptiveThreadPool
+
+
+class TestAdaptiveThreadPool(unittest.TestCase):
+    def test_keyed_order(self):
+        """测试同一个key的任务按提交顺序串行执行，不同key并行"""
+        pool = AdaptiveThreadPool("test_keyed", min_workers=1, max_workers=4)
+        results = {"a": [], "b": []}
+        running = {"a": 0, "b": 0}
+        max_running = {"a": 0, "b": 0}
+        lock = threading.Lock()
+
+        def task(key, i):
+            with lock:
+                running[key] += 1
+                max_running[key] = max(max_running[key], running[key])
+            time.sleep(0.01)
+            with lock:
+                running[key] -= 1
+                results[key].append(i)
+
+        futures = [pool.submit_keyed(key, task, key, i) for i in range(10) for key in ("a", "b")]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(results["a"], list(range(10)))
+        self.assertEqual(results["b"], list(range(10)))
+        self.assertEqual(max_running, {"a": 1, "b": 1})
+        pool.shutdown()
+
+    def test_grow_and_shrink(self):
+        """测试任务排队时线程数增长且不超过上限，空闲后多余线程退出"""
+        pool = AdaptiveThreadPool("test_grow", min_workers=1, max_workers=4, idle_timeout=0.1)
+        event = threading.Event()
+        futures = [pool.submit(event.wait, 5) for _ in range(8)]
+        time.sleep(0.1)
+        self.assertEqual(pool._workers, 4)
+        self.assertEqual(pool.queue_depth, 4)
+        event.set()
+        for future in futures:
+            self.assertTrue(future.result(timeout=5))
+        deadline = time.monotonic() + 5
+        while pool._workers > 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(pool._workers, 1)
+        pool.shutdown()
+
+    def test_exception(self):
+        pool = AdaptiveThreadPool("test_exception")
+        future = pool.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result, 5)
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import threading
+import time
+import unittest
+
+from channel.wx849.wx849_dispatcher import MessageDispatcher, conversation_id
+
+
+def _msg(from_user, n, to_user="wxid_bot"):
+    return {"FromUserName": {"string": from_user}, "ToUserName": {"string": to_user}, "n": n}
+
+
+class TestMessageDispatcher(unittest.TestCase):
+    def test_conversation_id(self):
+        self.assertEqual(conversation_id(_msg("g1@chatroom", 0)), "g1@chatroom")
+        self.assertEqual(conversation_id({"roomId": "g2@chatroom", "FromUserName": "wxid_a"}), "g2@chatroom")
+        self.assertEqual(conversation_id(_msg("wxid_a", 0)), "wxid_a")
+        # 机器人自己发出的私聊消息归到对方的会话
+        self.assertEqual(conversation_id(_msg("wxid_bot", 0, to_user="wxid_a"), "wxid_bot"), "wxid_a")
+
+    def test_order_and_parallelism(self):
+        """测试同一会话内跨批次按顺序串行处理，不同会话并行处理，处理出错不影响后续消息"""
+        handled = {}
+        running = {}
+        max_running = {}
+        peak = []
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def handler(msg):
+            conv = msg["FromUserName"]["string"]
+            with lock:
+                running[conv] = running.get(conv, 0) + 1
+                max_running[conv] = max(max_running.get(conv, 0), running[conv])
+                peak.append(sum(running.values()))
+            time.sleep(0.02)
+            with lock:
+                running[conv] -= 1
+                handled.setdefault(conv, []).append(msg["n"])
+                if sum(len(v) for v in handled.values()) == 12:
+                    done.set()
+            if msg["n"] == 1:
+                raise RuntimeError("handler error")
+
+        dispatcher = MessageDispatcher(handler, lambda: "wxid_bot", max_workers=4)
+        dispatcher.dispatch([_msg(conv, n) for n in range(3) for conv in ("wxid_a", "wxid_b", "g1@chatroom")])
+        dispatcher.dispatch([_msg(conv, 3) for conv in ("wxid_a", "wxid_b", "g1@chatroom")])
+        self.assertTrue(done.wait(5))
+
+        self.assertEqual(handled, {conv: [0, 1, 2, 3] for conv in ("wxid_a", "wxid_b", "g1@chatroom")})
+        # 同一会话内严格串行，不同会话之间并行
+        self.assertEqual(max_running, {conv: 1 for conv in ("wxid_a", "wxid_b", "g1@chatroom")})
+        self.assertGreater(max(peak), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
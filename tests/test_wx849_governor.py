@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib", "wx849"))
+
+from WechatAPI.governor import OutboundGovernor  # noqa: E402
+
+
+class TestWX849Governor(unittest.TestCase):
+    def test_recipient_order_and_rate(self):
+        """测试同一接收者按顺序发送，并受接收者令牌桶限制"""
+        sent = []
+
+        async def send(recipient, i):
+            sent.append((recipient, i, time.monotonic()))
+            return i
+
+        async def run():
+            governor = OutboundGovernor(global_rate=0, recipient_rate=20, recipient_burst=2)
+            start = time.monotonic()
+            results = await asyncio.gather(*[governor.submit("a", send, "a", i) for i in range(6)])
+            return start, results
+
+        start, results = asyncio.run(run())
+        self.assertEqual(results, list(range(6)))
+        self.assertEqual([i for _, i, _ in sent], list(range(6)))
+        # 突发2条，其余4条按每秒20条补充令牌
+        self.assertGreaterEqual(sent[-1][2] - start, 0.18)
+
+    def test_recipients_in_parallel(self):
+        """测试不同接收者之间不互相阻塞"""
+
+        async def slow_send(recipient):
+            await asyncio.sleep(0.2)
+            return recipient
+
+        async def run():
+            governor = OutboundGovernor(global_rate=0, recipient_rate=0)
+            start = time.monotonic()
+            await asyncio.gather(*[governor.submit(r, slow_send, r) for r in ("a", "b", "c")])
+            return time.monotonic() - start
+
+        self.assertLess(asyncio.run(run()), 0.4)
+
+    def test_continuation_priority(self):
+        """测试刚发送过消息的接收者优先于其他积压消息"""
+        sent = []
+
+        async def send(recipient):
+            sent.append(recipient)
+
+        async def run():
+            governor = OutboundGovernor(global_rate=10, global_burst=1, recipient_rate=0)
+            await governor.submit("a", send, "a")
+            backlog = [asyncio.ensure_future(governor.submit(r, send, r)) for r in ("b", "c")]
+            await asyncio.sleep(0)
+            await governor.submit("a", send, "a")
+            await asyncio.gather(*backlog)
+
+        asyncio.run(run())
+        self.assertEqual(sent, ["a", "a", "b", "c"])
+
+    def test_cancelled_send(self):
+        """测试发送函数抛出 CancelledError 时调用方不会一直等待，之后的消息照常发送"""
+        async def cancelled_send():
+            raise asyncio.CancelledError()
+
+        async def send():
+            return "ok"
+
+        async def run():
+            governor = OutboundGovernor(global_rate=0, recipient_rate=0)
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(asyncio.shield(governor.submit("a", cancelled_send)), timeout=1)
+            return await asyncio.wait_for(governor.submit("a", send), timeout=1)
+
+        self.assertEqual(asyncio.run(run()), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from channel.wx849.wx849_media import MediaCache
+
+
+class TestWX849MediaCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, True)
+
+    def test_fetch_dedupe_and_hit(self):
+        """测试并发下载合并以及缓存命中"""
+        cache = MediaCache(self.cache_dir, max_bytes=1024)
+        calls = []
+
+        async def download():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "aGVsbG8="  # base64("hello")
+
+        async def run():
+            paths = await asyncio.gather(*[cache.fetch("image", "md5a", ".jpg", download) for _ in range(5)])
+            paths.append(await cache.fetch("image", "md5a", ".jpg", download))
+            return paths
+
+        paths = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(paths)), 1)
+        with open(paths[0], "rb") as f:
+            self.assertEqual(f.read(), b"hello")
+
+    def test_lru_eviction(self):
+        """测试超出配额时淘汰最久未使用的文件"""
+        cache = MediaCache(self.cache_dir, max_bytes=25)
+        cache.store("a", ".jpg", b"a" * 10)
+        cache.store("b", ".jpg", b"b" * 10)
+        self.assertIsNotNone(cache.lookup("a", ".jpg"))  # a 变为最近使用
+        cache.store("c", ".jpg", b"c" * 10)
+        self.assertIsNone(cache.lookup("b", ".jpg"))
+        self.assertFalse(os.path.exists(cache.path("b", ".jpg")))
+        self.assertIsNotNone(cache.lookup("a", ".jpg"))
+        self.assertEqual(cache.stats()["bytes"], 20)
+
+        # 重新加载目录后仍保留已缓存的文件
+        reloaded = MediaCache(self.cache_dir, max_bytes=25)
+        self.assertEqual(reloaded.stats()["files"], 2)
+
+    def test_materialize(self):
+        """测试消息文件删除后不影响缓存文件"""
+        cache = MediaCache(self.cache_dir, max_bytes=1024)
+        path = cache.store("v", ".silk", b"voice")
+        dest = os.path.join(self.cache_dir, "out", "msg.silk")
+        cache.materialize(path, dest)
+        os.remove(dest)
+        self.assertTrue(os.path.exists(path))
+
+    def test_lazy_directory(self):
+        """测试缓存目录在第一次写入时才创建"""
+        cache_dir = os.path.join(self.cache_dir, "media")
+        cache = MediaCache(cache_dir, max_bytes=1024)
+        self.assertIsNone(cache.lookup("a", ".jpg"))
+        self.assertFalse(os.path.exists(cache_dir))
+        cache.store("a", ".jpg", b"a")
+        self.assertIsNotNone(cache.lookup("a", ".jpg"))
+
+
+if __name__ == "__main__":
+    unittest.main()
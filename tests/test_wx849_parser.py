@@ -0,0 +1,80 @@
+import unittest
+from channel.wx849.wx849_parser import chatroom_id, is_group_message, parse_message
+
+GROUP = "12345678901@chatroom"
+
+
+class TestWX849Parser(unittest.TestCase):
+    def test_group_text_sender(self):
+        """测试群消息发送者前缀拆分"""
+        parsed = parse_message({}, "wxid_a:\n你好: 世界", GROUP)
+        self.assertTrue(parsed.is_group)
+        self.assertEqual(parsed.sender_wxid, "wxid_a")
+        self.assertEqual(parsed.body, "你好: 世界")
+
+        parsed = parse_message({}, "wxid_a:你好", GROUP)
+        self.assertEqual(parsed.sender_wxid, "wxid_a")
+        self.assertEqual(parsed.body, "你好")
+
+    def test_private_text_untouched(self):
+        """测试私聊消息内容不做拆分"""
+        parsed = parse_message({}, "注意: 明天开会", "wxid_a")
+        self.assertFalse(parsed.is_group)
+        self.assertEqual(parsed.sender_wxid, "")
+        self.assertEqual(parsed.body, "注意: 明天开会")
+
+    def test_msg_source(self):
+        """测试从MsgSource解析@列表和机器人群昵称"""
+        msg = {"MsgSource": "<msgsource><atuserlist><![CDATA[,wxid_bot,wxid_b]]></atuserlist>"
+                            "<displayname>小助手</displayname></msgsource>"}
+        parsed = parse_message(msg, "wxid_a:\n@小助手 在吗", GROUP)
+        self.assertEqual(parsed.at_list, ["wxid_bot", "wxid_b"])
+        self.assertEqual(parsed.self_display_name, "小助手")
+
+        parsed = parse_message({"AtUserList": "wxid_bot,"}, "wxid_a:\n@小助手 在吗", GROUP)
+        self.assertEqual(parsed.at_list, ["wxid_bot"])
+
+    def test_media_attrs(self):
+        """测试媒体消息属性"""
+        content = 'wxid_a:\n<?xml version="1.0"?><msg><img aeskey="k1" cdnmidimgurl="u1" length="100" md5="m1" /></msg>'
+        parsed = parse_message({}, content, GROUP)
+        self.assertEqual(parsed.sender_wxid, "wxid_a")
+        self.assertTrue(parsed.body.startswith("<?xml"))
+        self.assertEqual(parsed.elements["tag"], "img")
+        self.assertEqual((parsed.attr("aeskey"), parsed.attr("cdnmidimgurl"), parsed.attr("length"), parsed.attr("md5")),
+                         ("k1", "u1", "100", "m1"))
+
+        parsed = parse_message({}, '<msg><emoji fromusername = "wxid_b" cdnurl = "http://a?x=1&amp;y=2" /></msg>', GROUP)
+        self.assertEqual(parsed.sender_wxid, "wxid_b")
+        self.assertEqual(parsed.attr("cdnurl"), "http://a?x=1&y=2")
+
+        parsed = parse_message({}, "<msg><voicemsg voiceurl='v1' length='5' /></msg>", "wxid_a")
+        self.assertEqual(parsed.attr("voiceurl"), "v1")
+        self.assertEqual(parsed.attr("length"), "5")
+
+    def test_appmsg(self):
+        """测试appmsg子类型和XML中的发送者"""
+        content = ("<msg><appmsg appid=\"\"><title>t</title><type>57</type><refermsg><type>1</type></refermsg>"
+                   "</appmsg><fromusername><![CDATA[wxid_c]]></fromusername></msg>")
+        parsed = parse_message({}, content, GROUP)
+        self.assertEqual(parsed.app_type, "57")
+        self.assertEqual(parsed.sender_wxid, "wxid_c")
+        self.assertIsNone(parse_message({}, "hello", "wxid_a").app_type)
+
+    def test_xml_username_sender(self):
+        """测试发送者只在XML的username元素中时的兜底"""
+        content = '<?xml version="1.0"?><msg><username>wxid_d</username><fromusername>wxid_e</fromusername></msg>'
+        self.assertEqual(parse_message({}, content, GROUP).sender_wxid, "wxid_d")
+        self.assertEqual(parse_message({}, "<sysmsg><username>wxid_d</username></sysmsg>", GROUP).sender_wxid, "")
+
+    def test_group_detection(self):
+        """测试根据roomId或发送方/接收方识别群消息，兼容 {"string": ...} 格式的字段"""
+        self.assertEqual(chatroom_id({"FromUserName": {"string": GROUP}, "ToUserName": "wxid_bot"}), GROUP)
+        self.assertEqual(chatroom_id({"roomId": GROUP, "FromUserName": "wxid_a"}), GROUP)
+        self.assertEqual(chatroom_id({"FromUserName": "wxid_bot", "ToUserName": {"string": GROUP}}), GROUP)
+        self.assertTrue(is_group_message({"roomId": GROUP}))
+        self.assertFalse(is_group_message({"FromUserName": {"string": "wxid_a"}, "ToUserName": "wxid_bot"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from channel.wx849.wx849_poller import (AdaptivePoller, LONGPOLL_CONFIRM_POLLS, LONGPOLL_RELEASE_POLLS, SYNC_MODE_AUTO,
+                                        SYNC_MODE_LONGPOLL, SYNC_MODE_POLL)
+
+
+def _poller(mode):
+    return AdaptivePoller(mode=mode, min_interval=0.1, max_interval=0.8, error_max_interval=4, longpoll_threshold=1.0)
+
+
+class TestAdaptivePoller(unittest.TestCase):
+    def test_idle_backoff(self):
+        """测试普通轮询空闲时指数退避(带抖动)，有消息时恢复最小间隔"""
+        poller = _poller(SYNC_MODE_POLL)
+        delays = [poller.on_success(0, 0.01) for _ in range(6)]
+        for delay, interval in zip(delays, (0.1, 0.2, 0.4, 0.8, 0.8, 0.8)):
+            self.assertGreaterEqual(delay, interval / 2)
+            self.assertLessEqual(delay, interval)
+        self.assertEqual(poller.on_success(3, 0.01), 0.1)
+        self.assertEqual(poller.on_success(3, 0.01, has_more=True), 0)
+        self.assertLessEqual(poller.on_success(0, 0.01), 0.1)
+        # 普通轮询模式下即使请求很慢也不切换为长轮询
+        poller.on_success(0, 2.0)
+        self.assertFalse(poller.longpoll_detected)
+
+    def test_longpoll(self):
+        """测试自动识别长轮询：连续多次被挂起才切换，切换后被挂起的请求立即发起下一次，没有挂起时仍然退避"""
+        poller = _poller(SYNC_MODE_AUTO)
+        for _ in range(LONGPOLL_CONFIRM_POLLS - 1):
+            self.assertGreater(poller.on_success(0, 1.5), 0)
+        self.assertFalse(poller.longpoll_detected)
+        # 偶发的慢请求中间夹着快请求时重新计数
+        self.assertGreater(poller.on_success(0, 0.01), 0)
+        for _ in range(LONGPOLL_CONFIRM_POLLS):
+            poller.on_success(0, 1.5)
+        self.assertTrue(poller.longpoll_detected)
+        self.assertEqual(poller.on_success(0, 1.2), 0)
+
+        # 没有被挂起的空请求继续指数退避，连续多次后退回自适应轮询
+        delays = [poller.on_success(0, 0.01) for _ in range(LONGPOLL_RELEASE_POLLS)]
+        self.assertGreater(delays[-1], 0.1)
+        self.assertFalse(poller.longpoll_detected)
+        self.assertGreater(poller.on_success(0, 1.5), 0)
+
+        poller = _poller(SYNC_MODE_LONGPOLL)
+        self.assertTrue(poller.longpoll_detected)
+        self.assertEqual(poller.on_success(0, 1.5), 0)
+        for _ in range(LONGPOLL_RELEASE_POLLS):
+            poller.on_success(0, 0.01)
+        self.assertTrue(poller.longpoll_detected)
+
+    def test_error_backoff(self):
+        """测试出错时退避间隔翻倍直到上限，成功后重置"""
+        poller = _poller(SYNC_MODE_POLL)
+        delays = [poller.on_error() for _ in range(5)]
+        for delay, interval in zip(delays, (1, 2, 4, 4, 4)):
+            self.assertGreaterEqual(delay, interval / 2)
+            self.assertLessEqual(delay, interval)
+        poller.on_success(1, 0.01)
+        self.assertLessEqual(poller.on_error(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
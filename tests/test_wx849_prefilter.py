@@ -0,0 +1,90 @@
+import unittest
+
+from channel.wx849.wx849_prefilter import GroupPrefilter
+from config import conf
+
+GROUP = "12345678901@chatroom"
+
+
+class FakeRooms(object):
+    def __init__(self, names, nicknames=None):
+        self.names = names
+        self.nicknames = nicknames or {}
+
+    def get_group_name(self, group_id):
+        return self.names.get(group_id)
+
+    def get_member_nickname(self, group_id, wxid):
+        return self.nicknames.get((group_id, wxid))
+
+
+def _group_msg(text, msg_type=1, msg_source=""):
+    return {
+        "FromUserName": {"string": GROUP},
+        "ToUserName": {"string": "wxid_bot"},
+        "MsgType": msg_type,
+        "Content": {"string": f"wxid_a:\n{text}"},
+        "MsgSource": msg_source,
+    }
+
+
+class TestWX849Prefilter(unittest.TestCase):
+    def setUp(self):
+        self._saved = {k: conf()[k] for k in ("group_name_white_list", "group_chat_prefix", "group_chat_keyword",
+                                              "group_speech_recognition") if k in conf()}
+        conf()["group_name_white_list"] = ["ALL_GROUP"]
+        conf()["group_chat_prefix"] = ["bot"]
+        conf()["group_chat_keyword"] = ["帮助"]
+        conf()["group_speech_recognition"] = False
+        rooms = FakeRooms({GROUP: "测试群"}, {(GROUP, "wxid_bot"): "群助手"})
+        self.prefilter = GroupPrefilter(rooms, lambda: "wxid_bot", lambda: "小助手")
+
+    def tearDown(self):
+        for key in ("group_name_white_list", "group_chat_prefix", "group_chat_keyword", "group_speech_recognition"):
+            if key in self._saved:
+                conf()[key] = self._saved[key]
+            else:
+                conf().pop(key, None)
+
+    def test_text_trigger(self):
+        """测试文本消息按前缀、关键词、@判断"""
+        self.assertTrue(self.prefilter.accept(_group_msg("bot 你好")))
+        self.assertTrue(self.prefilter.accept(_group_msg("有没有帮助文档")))
+        self.assertTrue(self.prefilter.accept(_group_msg("@小助手 在吗")))
+        self.assertTrue(self.prefilter.accept(_group_msg("@群助手\u2005在吗")))
+        self.assertTrue(self.prefilter.accept(_group_msg("@机器人 在吗", msg_source="<selfDisplayName>机器人</selfDisplayName>")))
+        self.assertTrue(self.prefilter.accept(_group_msg("在吗", msg_source="<atuserlist>wxid_bot</atuserlist>")))
+        self.assertFalse(self.prefilter.accept(_group_msg("今天天气不错")))
+        # @其他成员或邮箱地址不会触发
+        self.assertFalse(self.prefilter.accept(_group_msg("@张三 吃饭了吗")))
+        self.assertFalse(self.prefilter.accept(_group_msg("发到 test@example.com")))
+
+    def test_unknown_self_name(self):
+        """测试还不知道机器人昵称时，带@的消息交给后续判断"""
+        prefilter = GroupPrefilter(FakeRooms({}), lambda: None)
+        self.assertTrue(prefilter.accept(_group_msg("@张三 吃饭了吗")))
+        self.assertFalse(prefilter.accept(_group_msg("今天天气不错")))
+
+    def test_non_text(self):
+        """测试非文本消息：语音按配置过滤，其他类型放行"""
+        self.assertFalse(self.prefilter.accept(_group_msg("<msg><voicemsg /></msg>", msg_type=34)))
+        conf()["group_speech_recognition"] = True
+        self.assertTrue(self.prefilter.accept(_group_msg("<msg><voicemsg /></msg>", msg_type=34)))
+        self.assertTrue(self.prefilter.accept(_group_msg("<msg><img /></msg>", msg_type=3)))
+
+    def test_whitelist(self):
+        """测试群名已知且不在白名单中的消息被丢弃"""
+        conf()["group_name_white_list"] = ["其他群"]
+        self.assertFalse(self.prefilter.accept(_group_msg("bot 你好")))
+        conf()["group_name_white_list"] = ["测试群"]
+        self.assertTrue(self.prefilter.accept(_group_msg("bot 你好")))
+
+    def test_whitelist_missing(self):
+        """测试未配置群白名单时与 handle_group 一样按 ALL_GROUP 处理"""
+        conf().pop("group_name_white_list", None)
+        self.assertTrue(self.prefilter.accept(_group_msg("bot 你好")))
+        self.assertFalse(self.prefilter.accept(_group_msg("今天天气不错")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from channel.wx849.wx849_rooms import ChatroomDirectory
+
+GROUP = "12345678901@chatroom"
+
+
+class TestChatroomDirectory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "wx849_rooms.json")
+        self.directories = []
+
+    def tearDown(self):
+        for directory in self.directories:
+            directory.close()
+            self.assertFalse(directory._flush_thread.is_alive())
+        self.tmp.cleanup()
+
+    def _directory(self):
+        directory = ChatroomDirectory(self.path)
+        self.directories.append(directory)
+        return directory
+
+    def test_load_and_index(self):
+        """测试加载文件后按群ID和成员wxid查询"""
+        rooms = {GROUP: {"chatroomId": GROUP, "nickName": "测试群", "last_update": int(time.time()),
+                         "members": [{"UserName": "wxid_a", "NickName": "阿A", "DisplayName": "群名片A"},
+                                     {"UserName": "wxid_b", "NickName": "阿B"}]}}
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(rooms, f)
+        directory = self._directory()
+        self.assertEqual(directory.get_group_name(GROUP), "测试群")
+        self.assertEqual(directory.get_member_nickname(GROUP, "wxid_a"), "群名片A")
+        self.assertEqual(directory.get_member_nickname(GROUP, "wxid_b"), "阿B")
+        self.assertIsNone(directory.get_member(GROUP, "wxid_c"))
+        self.assertIsNone(directory.get_group_name("other@chatroom"))
+        self.assertTrue(directory.is_fresh(GROUP, require_members=True))
+
+    def test_update_and_expire(self):
+        """测试更新成员列表后旧索引失效，以及超过有效期后需要重新获取"""
+        directory = self._directory()
+        directory.update_room(GROUP)
+        self.assertIsNone(directory.get_group_name(GROUP))  # 名称未知时群名等于群ID
+        self.assertFalse(directory.is_fresh(GROUP, require_members=True))
+        directory.set_members(GROUP, [{"UserName": "wxid_a", "NickName": "阿A", "ChatroomMemberFlag": 2049}])
+        directory.set_members(GROUP, [{"UserName": "wxid_b", "NickName": "阿B"}], member_count=1)
+        self.assertIsNone(directory.get_member(GROUP, "wxid_a"))
+        self.assertEqual(directory.get_member_nickname(GROUP, "wxid_b"), "阿B")
+        self.assertTrue(directory.is_fresh(GROUP, require_members=True))
+        directory.get_room(GROUP)["last_update"] -= directory.ttl + 1
+        self.assertFalse(directory.is_fresh(GROUP))
+        directory.flush()
+
+    def test_flush(self):
+        """测试修改写回磁盘后可以重新加载"""
+        directory = self._directory()
+        directory.update_room(GROUP, nick_name="测试群", owner="wxid_a")
+        directory.flush()
+        self.assertEqual(os.listdir(self.tmp.name), ["wx849_rooms.json"])  # 没有残留的临时文件
+        reloaded = self._directory()
+        self.assertEqual(reloaded.get_group_name(GROUP), "测试群")
+        self.assertEqual(reloaded.get_room(GROUP)["chatRoomOwner"], "wxid_a")
+
+
+if __name__ == "__main__":
+    unittest.main()
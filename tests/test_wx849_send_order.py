@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+import unittest
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class TestWX849SendOrder(unittest.TestCase):
+    def setUp(self):
+        from channel.wx849.wx849_channel import WX849Channel
+
+        self.channel = WX849Channel()
+        self.thread = threading.Thread(target=self.channel.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.sent = []
+
+    def tearDown(self):
+        self.channel.loop.call_soon_threadsafe(self.channel.loop.stop)
+        self.thread.join()
+
+    def _text(self, content, delay=0):
+        async def send_func(wait_turn):
+            await wait_turn()
+            await asyncio.sleep(delay)
+            self.sent.append(content)
+            return {"Success": True}
+
+        return send_func
+
+    def test_failed_image_download_keeps_order(self):
+        """测试图片下载失败提前返回时，后面的消息仍然等前一条发送完成"""
+        async def fail_download(img_url):
+            raise ConnectionError("download failed")
+
+        self.channel._get_image_url_payload = fail_download
+
+        async def send_image(wait_turn):
+            return await self.channel._send_image_url("wxid_a", "http://example.com/a.png", wait_turn)
+
+        first = self.channel._submit(self.channel._send_in_order("wxid_a", self._text("first", delay=0.2)))
+        image = self.channel._submit(self.channel._send_in_order("wxid_a", send_image))
+        last = self.channel._submit(self.channel._send_in_order("wxid_a", self._text("last")))
+        self.assertIsNone(image.result(timeout=5))
+        last.result(timeout=5)
+        first.result(timeout=5)
+        self.assertEqual(self.sent, ["first", "last"])
+        self.assertEqual(self.channel._send_tails, {})
+
+    def test_cancel_waiting_send(self):
+        """测试取消排队中的发送不影响前一条发送的结果，发送顺序状态也能清理干净"""
+        first = self.channel._submit(self.channel._send_in_order("wxid_a", self._text("first", delay=0.2)))
+        second = self.channel._submit(self.channel._send_in_order("wxid_a", self._text("second")))
+        time.sleep(0.05)
+        self.assertTrue(second.cancel())
+        self.assertEqual(first.result(timeout=5), {"Success": True})
+        self.assertEqual(self.sent, ["first"])
+        self.assertTrue(_wait(lambda: self.channel._send_tails == {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
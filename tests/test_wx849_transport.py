@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+import unittest
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib", "wx849"))
+
+from WechatAPI import transport  # noqa: E402
+
+
+class TestWX849Transport(unittest.TestCase):
+    def setUp(self):
+        self.peers = set()
+
+    def tearDown(self):
+        transport.set_latency_hook(None)
+
+    async def _start_server(self):
+        async def handler(request):
+            self.peers.add(request.transport.get_extra_info("peername"))
+            if request.path == "/slow":
+                await asyncio.sleep(0.3)
+            return web.json_response({"Success": True})
+
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    def test_session_reuse_and_close(self):
+        """测试同一事件循环复用一个会话和TCP连接，关闭后重新创建，并回调请求耗时"""
+        latencies = []
+        transport.set_latency_hook(lambda method, path, elapsed, status: latencies.append((method, path, status)))
+
+        async def main():
+            transport.bind_loop(asyncio.get_running_loop())
+            runner, base = await self._start_server()
+            try:
+                async with transport.shared_session() as session:
+                    first = session
+                    for _ in range(3):
+                        async with session.post(f"{base}/VXAPI/Msg/SendTxt", json={}) as response:
+                            self.assertEqual((await response.json())["Success"], True)
+                self.assertIs(transport.get_session(), first)
+                await transport.close_session()
+                self.assertTrue(first.closed)
+                second = transport.get_session()
+                self.assertIsNot(second, first)
+                await transport.close_session()
+            finally:
+                await runner.cleanup()
+
+        asyncio.run(main())
+        self.assertEqual(len(self.peers), 1)  # 3个请求复用同一个连接
+        self.assertEqual(latencies, [("POST", "/VXAPI/Msg/SendTxt", 200)] * 3)
+
+    def test_unbound_loop_session_closed(self):
+        """测试不在常驻事件循环上时每次使用独立会话，退出时关闭"""
+        async def main():
+            runner, base = await self._start_server()
+            try:
+                async with transport.shared_session() as first:
+                    async with first.post(f"{base}/VXAPI/Msg/SendTxt", json={}) as response:
+                        self.assertEqual(response.status, 200)
+                self.assertTrue(first.closed)
+                async with transport.shared_session() as second:
+                    self.assertIsNot(second, first)
+                self.assertTrue(second.closed)
+                self.assertNotIn(asyncio.get_running_loop(), transport._sessions)
+            finally:
+                await runner.cleanup()
+
+        asyncio.run(main())
+
+    def test_read_timeout(self):
+        """测试默认按读取超时判断，媒体接口使用更长的读取超时"""
+        saved = dict(transport._settings)
+        transport.configure(read_timeout=0.1, media_read_timeout=1)
+
+        async def main():
+            runner, base = await self._start_server()
+            try:
+                session = transport.get_session()
+                self.assertIsNone(session.timeout.total)
+                with self.assertRaises(asyncio.TimeoutError):
+                    async with session.post(f"{base}/slow", json={}) as response:
+                        await response.read()
+                async with session.post(f"{base}/slow", json={}, timeout=transport.media_timeout()) as response:
+                    self.assertEqual(response.status, 200)
+                await transport.close_session()
+            finally:
+                await runner.cleanup()
+
+        try:
+            asyncio.run(main())
+        finally:
+            transport.configure(**saved)
+
+    def test_configure_rejects_unknown_key(self):
+        with self.assertRaises(ValueError):
+            transport.configure(bogus=1)
+
+
+if __name__ == "__main__":
+    unittest.main()